@@ -0,0 +1,210 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Summarize and classify a dataset of pull requests offline, shard by shard."""
+
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Callable, Iterator, Tuple
+
+from loguru import logger
+
+from entity.pull_request import PullRequest
+
+csv.field_size_limit(sys.maxsize)
+
+SHARD_FILE_FORMAT = 'shard-{:06d}.jsonl'
+# the input and the options of the run which wrote the shards, a run only resumes the shards of the same ones
+MANIFEST_FILE = 'manifest.json'
+
+# the summarizer and the discriminator of the current process
+_components = None
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """
+    Read the PR records from a JSONL or a CSV file lazily.
+
+    Each record has the `url`, `title`, `desc` and `commits` fields. In a CSV file, the commit messages are
+    separated by newlines.
+
+    Args:
+        path: the path of the `.jsonl` or `.csv` file.
+
+    Returns:
+        A generator of records.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                commits = row.get('commits') or ''
+                row['commits'] = [c for c in commits.split('\n') if c]
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_shards(records: Iterator[dict], shard_size: int) -> Iterator[Tuple[int, list]]:
+    shard = []
+    index = 0
+    for record in records:
+        shard.append(record)
+        if len(shard) == shard_size:
+            yield index, shard
+            shard = []
+            index += 1
+    if shard:
+        yield index, shard
+
+
+def shard_path(output_dir: str, index: int) -> str:
+    return os.path.join(output_dir, SHARD_FILE_FORMAT.format(index))
+
+
+def init_worker(init_components: Callable):
+    global _components
+    _components = init_components()
+
+
+def process_shard(output_dir: str, index: int, records: [dict], max_tokens: int = None) -> Tuple[int, int]:
+    """
+    Summarize and classify the records of a shard, and write the results to the shard's output file.
+
+    The output file is written to a temporary file first and renamed at the end, so a shard either has a complete
+    output file or none.
+
+    Returns:
+        The index of the shard and the number of the records.
+    """
+    summarizer, discriminator = _components
+    prs = []
+    for record in records:
+        pr = PullRequest(record.get('url') or '')
+        pr.set_data({'title': record.get('title') or '', 'desc': record.get('desc') or '',
+                     'commits': record.get('commits') or []}, max_tokens)
+        prs.append(pr)
+
+    entries = summarizer.summarize(prs)
+    if len(entries) != len(prs):
+        raise ValueError(f'Shard {index}: the number of entries ({len(entries)}) and PRs ({len(prs)}) do not match')
+
+    path = shard_path(output_dir, index)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        for pr, entry in zip(prs, entries):
+            # classify one by one since the categories are keyed by PR numbers, which are not unique in a dataset
+            categories = discriminator.classify([pr])
+            category = categories[0].category.name if categories else None
+            f.write(json.dumps({'url': pr.url, 'summary': entry.body, 'category': category}) + '\n')
+    os.replace(f'{path}.tmp', path)
+    return index, len(records)
+
+
+def make_manifest(input_path: str, shard_size: int, max_tokens: int = None) -> dict:
+    stat = os.stat(input_path)
+    return {'input_path': os.path.abspath(input_path), 'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns, 'shard_size': shard_size, 'max_tokens': max_tokens}
+
+
+def check_manifest(output_dir: str, manifest: dict):
+    """
+    Write the manifest of the run to `output_dir`, or check that it matches the one of the run which wrote the shards
+    there, since the shards of another input or shard size cover other records.
+
+    Raises:
+        ValueError: if the shards of `output_dir` were written by a run of another input or other options.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+        if existing != manifest:
+            changed = ', '.join(k for k in sorted(set(existing) | set(manifest)) if existing.get(k) != manifest.get(k))
+            raise ValueError(f'Cannot resume the run in {output_dir}, its {changed} changed, '
+                             f'use another output directory')
+        return
+    if any(name.startswith('shard-') for name in os.listdir(output_dir)):
+        raise ValueError(f'Cannot resume the run in {output_dir}, it has shards but no {MANIFEST_FILE}, '
+                         f'use another output directory')
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def iter_pending_shards(input_path: str, output_dir: str, shard_size: int) -> Iterator[Tuple[int, list]]:
+    for index, records in iter_shards(read_records(input_path), shard_size):
+        if os.path.exists(shard_path(output_dir, index)):
+            logger.debug(f'Shard {index} is already done, skip it')
+            continue
+        yield index, records
+
+
+def process_shards(shards: Iterator[Tuple[int, list]], output_dir: str, init_components: Callable, workers: int,
+                   max_tokens: int = None) -> Iterator[Tuple[int, int]]:
+    if workers <= 1:
+        init_worker(init_components)
+        for index, records in shards:
+            yield process_shard(output_dir, index, records, max_tokens)
+        return
+
+    # fork so that the workers inherit `init_components` and everything imported, and keep at most two shards
+    # per worker in flight so that the input is not read far ahead of the workers
+    with multiprocessing.get_context('fork').Pool(workers, initializer=init_worker,
+                                                  initargs=(init_components,)) as pool:
+        in_flight = deque()
+        for index, records in shards:
+            in_flight.append(pool.apply_async(process_shard, (output_dir, index, records, max_tokens)))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def run(input_path: str, output_dir: str, init_components: Callable, shard_size: int = 1000, workers: int = 1,
+        max_tokens: int = None) -> int:
+    """
+    Stream the records of the input file through the summarizer and the discriminator.
+
+    The records are split into shards of `shard_size` records, and each shard is processed by one of the `workers`
+    processes, every process creates its own components once with `init_components`. The results of every shard are
+    written to `output_dir` as soon as the shard is done, and the shards that are already done are skipped, so an
+    interrupted run resumes where it stopped. A run refuses to resume the shards of another input file, shard size
+    or token budget, see `check_manifest`.
+
+    Args:
+        input_path: the path of the `.jsonl` or `.csv` file.
+        output_dir: where to save the results.
+        init_components: a function that returns a tuple of the summarizer and the discriminator.
+        shard_size: the number of records per shard.
+        workers: the number of worker processes, the shards are processed in this process if it is 1.
+        max_tokens: the token budget of every PR, see `PullRequest.set_data`.
+
+    Returns:
+        The number of the processed records.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    check_manifest(output_dir, make_manifest(input_path, shard_size, max_tokens))
+    beg = time.time()
+    total = 0
+    shards = iter_pending_shards(input_path, output_dir, shard_size)
+    for index, count in process_shards(shards, output_dir, init_components, workers, max_tokens):
+        total += count
+        logger.info(f'Shard {index} is done, {total} record(s) are processed in {time.time() - beg:.2f} seconds')
+    return total
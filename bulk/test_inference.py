@@ -0,0 +1,106 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+from bulk import inference
+from entity.category import Category, EntryCategory
+from entity.entry import Entry
+
+RECORDS = [
+    {'url': f'https://github.com/foo/bar/pull/{i}', 'title': f'fix bug {i}', 'desc': 'the bug is fixed',
+     'commits': ['fix the bug', 'add tests']}
+    for i in range(10)
+]
+
+
+class MockSummarizer:
+    def summarize(self, items):
+        return [Entry(pr.id, ' '.join(pr.title)) for pr in items]
+
+
+class MockDiscriminator:
+    def classify(self, items):
+        return [EntryCategory(pr.id, Category.BugFix) for pr in items]
+
+
+def init_components():
+    return MockSummarizer(), MockDiscriminator()
+
+
+def read_outputs(output_dir):
+    ret = []
+    for name in sorted(n for n in os.listdir(output_dir) if n.startswith('shard-')):
+        with open(os.path.join(output_dir, name)) as f:
+            ret.extend(json.loads(line) for line in f)
+    return ret
+
+
+class TestInference(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.jsonl = os.path.join(self.tmp.name, 'prs.jsonl')
+        with open(self.jsonl, 'w') as f:
+            f.writelines(json.dumps(r) + '\n' for r in RECORDS)
+        self.csv = os.path.join(self.tmp.name, 'prs.csv')
+        with open(self.csv, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=['url', 'title', 'desc', 'commits'])
+            writer.writeheader()
+            writer.writerows([dict(r, commits='\n'.join(r['commits'])) for r in RECORDS])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_records(self):
+        self.assertEqual(RECORDS, list(inference.read_records(self.jsonl)))
+        self.assertEqual(RECORDS, list(inference.read_records(self.csv)))
+
+    def test_iter_shards(self):
+        shards = list(inference.iter_shards(iter(RECORDS), 4))
+        self.assertEqual([0, 1, 2], [i for i, _ in shards])
+        self.assertEqual([4, 4, 2], [len(s) for _, s in shards])
+
+    def test_run(self):
+        for workers in [1, 2]:
+            output_dir = os.path.join(self.tmp.name, f'output_{workers}')
+            self.assertEqual(10, inference.run(self.jsonl, output_dir, init_components, shard_size=3, workers=workers))
+            self.assertEqual(5, len(os.listdir(output_dir)))
+            outputs = read_outputs(output_dir)
+            self.assertEqual([r['url'] for r in RECORDS], [o['url'] for o in outputs])
+            self.assertEqual([r['title'] for r in RECORDS], [o['summary'] for o in outputs])
+            self.assertTrue(all(o['category'] == 'BugFix' for o in outputs))
+
+    def test_resume(self):
+        output_dir = os.path.join(self.tmp.name, 'output')
+        inference.run(self.csv, output_dir, init_components, shard_size=3)
+        os.remove(inference.shard_path(output_dir, 1))
+        self.assertEqual(3, inference.run(self.csv, output_dir, init_components, shard_size=3))
+        self.assertEqual([r['url'] for r in RECORDS], [o['url'] for o in read_outputs(output_dir)])
+
+    def test_resume_mismatch(self):
+        output_dir = os.path.join(self.tmp.name, 'output')
+        inference.run(self.jsonl, output_dir, init_components, shard_size=3)
+        # the shards of another shard size cover other records
+        with self.assertRaises(ValueError):
+            inference.run(self.jsonl, output_dir, init_components, shard_size=4)
+        with self.assertRaises(ValueError):
+            inference.run(self.csv, output_dir, init_components, shard_size=3)
+        with open(self.jsonl, 'a') as f:
+            f.write(json.dumps(RECORDS[0]) + '\n')
+        with self.assertRaises(ValueError):
+            inference.run(self.jsonl, output_dir, init_components, shard_size=3)
@@ -20,9 +20,10 @@ from entity.pull_request import PullRequest
 
 
 class PullRequestsCollector(Collector):
-    def __init__(self, client: AbstractClient):
+    def __init__(self, client: AbstractClient, max_tokens: int = None):
         super().__init__(client)
         self.client = client
+        self.max_tokens = max_tokens
 
     @logger.catch
     def get_all_during(self, owner: str, name: str, since: str = None, until: str = None) -> [PullRequest]:
@@ -39,7 +40,7 @@ class PullRequestsCollector(Collector):
             try:
                 pr = PullRequest(url)
                 pr_data = self.client.get_pull_request_info(owner, name, pr.number)
-                pr.set_data(pr_data)
+                pr.set_data(pr_data, self.max_tokens)
                 prs.append(pr)
             except Exception as e:
                 logger.warning(f'Failed to process the PR {url}: {e}')
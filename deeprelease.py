@@ -22,11 +22,13 @@ from datetime import datetime
 import fire
 from loguru import logger
 
+from bulk import inference
 from collector.github.client import Client
 from collector.github.collector import PullRequestsCollector
 from discriminator.fasttext.discriminator import CategoryDiscriminator
+from entity.columnar import ReleaseColumns
 from generator.markdown.generator import MarkdownGenerator
-from summarizer.pg_network.summarizer import EntrySummarizer
+from summarizer.fallback import FallbackSummarizer
 
 
 class DeepRelease:
@@ -61,20 +63,29 @@ class DeepRelease:
             return
 
         beg = time.time()
+        self.summarizer, self.discriminator = self.__create_models()
+        self.generator = MarkdownGenerator()
+        self.initialize = True
+        logger.debug(f'Initialize components took {time.time() - beg:.2f} seconds')
 
-        if self.config.has_option('summarizer', 'model_path'):
-            self.summarizer = EntrySummarizer(model_path=self.config['summarizer']['model_path'])
+    def __create_models(self):
+        """Create the summarizer and the discriminator."""
+        if self.config.has_option('summarizer', 'latency_budget'):
+            # the PRs are summarized extractively when the abstractive summarizer is predicted to exceed the budget
+            summarizer = FallbackSummarizer(**self.config['summarizer'])
         else:
-            self.summarizer = EntrySummarizer()
+            # torch is only imported when the abstractive summarizer is used
+            from summarizer.pg_network.summarizer import EntrySummarizer
+            # the options other than model_path override the hyper-parameters of the model, e.g., decode_batch_size
+            summarizer = EntrySummarizer(**self.config['summarizer']) if self.config.has_section('summarizer') \
+                else EntrySummarizer()
 
         if self.config.has_option('discriminator', 'model_path'):
-            self.discriminator = CategoryDiscriminator(model_path=self.config['discriminator']['model_path'])
+            discriminator = CategoryDiscriminator(model_path=self.config['discriminator']['model_path'])
         else:
-            self.discriminator = CategoryDiscriminator()
+            discriminator = CategoryDiscriminator()
 
-        self.generator = MarkdownGenerator()
-        self.initialize = True
-        logger.debug(f'Initialize components took {time.time() - beg:.2f} seconds')
+        return summarizer, discriminator
 
     @logger.catch
     def collect(self, repo: str, since: str = None, until: str = None):
@@ -94,7 +105,8 @@ class DeepRelease:
             if token is None:
                 logger.error('The env variable GITHUB_TOKEN is not set')
                 exit(1)
-            self.collector = PullRequestsCollector(Client(token))
+            max_tokens = self.config.getint('collector', 'max_tokens', fallback=None)
+            self.collector = PullRequestsCollector(Client(token), max_tokens=max_tokens)
 
         if not validate_date_format(since) or not validate_date_format(until):
             logger.error('Invalid date format, should be in %Y%m%d%H%M format')
@@ -111,7 +123,8 @@ class DeepRelease:
         return prs
 
     @logger.catch
-    def run(self, repo: str, save_dir='.', save_name='release.md', since: str = None, until: str = None):
+    def run(self, repo: str, save_dir='.', save_name='release.md', since: str = None, until: str = None,
+            export_dir: str = None):
         """Run DeepRelease.
 
         Args:
@@ -120,6 +133,7 @@ class DeepRelease:
             save_dir: where to save the generated file.
             since: the beginning time or date for fetching data, in `%Y%m%d%H%M` format.
             until: the ending time or date for fetching PRs, in `%Y%m%d%H%M` format.
+            export_dir: if set, export the PRs, their summaries and categories to this directory in columnar format.
 
         Returns:
             None.
@@ -143,6 +157,30 @@ class DeepRelease:
         self.generator.generate(entries, categories, save_dir=save_dir, save_name=save_name)
         logger.info(f'Generate the release notes: {save_dir}/{save_name}')
 
+        if export_dir is not None:
+            ReleaseColumns.from_objects(prs, entries, categories).save(export_dir)
+            logger.info(f'Export {len(prs)} pull request(s) to {export_dir}')
+
+    @logger.catch
+    def bulk(self, input_path: str, output_dir: str, shard_size: int = 1000, workers: int = 1):
+        """Summarize and classify a dataset of pull requests offline.
+
+        Args:
+            input_path: a `.jsonl` or `.csv` file of PR records with the `url`, `title`, `desc` and `commits` fields.
+            output_dir: where to save the results, one JSONL file per shard. Rerun with the same arguments to resume
+                an interrupted run, a run of another input file or shard size refuses to resume it.
+            shard_size: the number of records per shard.
+            workers: the number of worker processes.
+
+        Returns:
+            None.
+        """
+        beg = time.time()
+        max_tokens = self.config.getint('collector', 'max_tokens', fallback=None)
+        total = inference.run(input_path, output_dir, self.__create_models, shard_size=shard_size, workers=workers,
+                              max_tokens=max_tokens)
+        logger.info(f'{total} pull request(s) are summarized and classified in {time.time() - beg:.2f} seconds')
+
 
 def split_owner_repo(repo):
     """Split the repo name into owner and repo.
@@ -0,0 +1,217 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A columnar layout of pull requests, change entries and change categories.
+
+Every column is a NumPy array, strings follow the Apache Arrow layout (the UTF-8 bytes of all the strings and an
+offsets array), and lists of tokens are offsets into a string column. A table is saved as a directory of `.npy` files,
+so it can be memory-mapped when it is loaded.
+"""
+
+import os
+
+import numpy as np
+
+from entity.category import Category, EntryCategory
+from entity.entry import Entry
+from entity.pull_request import PullRequest
+
+# the category code of a pull request that is not classified
+NO_CATEGORY = -1
+
+
+class StringColumn:
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings: [str]):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def slice(self, beg: int, end: int) -> [str]:
+        """Decode the strings from `beg` to `end` at once."""
+        offsets = self.offsets[beg:end + 1] - self.offsets[beg]
+        buf = self.data[self.offsets[beg]:self.offsets[end]].tobytes()
+        return [buf[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(end - beg)]
+
+    def to_list(self) -> [str]:
+        return self.slice(0, len(self))
+
+    def save(self, path: str):
+        np.save(f'{path}.offsets.npy', self.offsets)
+        np.save(f'{path}.data.npy', self.data)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode=None):
+        return cls(np.load(f'{path}.offsets.npy', mmap_mode=mmap_mode),
+                   np.load(f'{path}.data.npy', mmap_mode=mmap_mode))
+
+    @classmethod
+    def concat(cls, columns):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for c in columns:
+            offsets.append(c.offsets[1:] - c.offsets[0] + base)
+            base += c.offsets[-1] - c.offsets[0]
+        data = [c.data[c.offsets[0]:c.offsets[-1]] for c in columns]
+        return cls(np.concatenate(offsets), np.concatenate(data) if data else np.zeros(0, dtype=np.uint8))
+
+
+class TokensColumn:
+    """A column of token lists, the tokens of the i-th row are `tokens[offsets[i]:offsets[i + 1]]`."""
+
+    def __init__(self, offsets: np.ndarray, tokens: StringColumn):
+        self.offsets = offsets
+        self.tokens = tokens
+
+    @classmethod
+    def from_lists(cls, lists: [[str]]):
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(lst) for lst in lists], out=offsets[1:])
+        return cls(offsets, StringColumn.from_strings([t for lst in lists for t in lst]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> [str]:
+        return self.tokens.slice(self.offsets[i], self.offsets[i + 1])
+
+    def to_list(self) -> [[str]]:
+        tokens = self.tokens.slice(self.offsets[0], self.offsets[-1])
+        offsets = self.offsets - self.offsets[0]
+        return [tokens[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def save(self, path: str):
+        np.save(f'{path}.offsets.npy', self.offsets)
+        self.tokens.save(f'{path}.tokens')
+
+    @classmethod
+    def load(cls, path: str, mmap_mode=None):
+        return cls(np.load(f'{path}.offsets.npy', mmap_mode=mmap_mode), StringColumn.load(f'{path}.tokens', mmap_mode))
+
+    @classmethod
+    def concat(cls, columns):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for c in columns:
+            offsets.append(c.offsets[1:] - c.offsets[0] + base)
+            base += c.offsets[-1] - c.offsets[0]
+        # only the tokens referenced by the offsets are kept
+        tokens = [StringColumn(c.tokens.offsets[c.offsets[0]:c.offsets[-1] + 1], c.tokens.data) for c in columns]
+        return cls(np.concatenate(offsets), StringColumn.concat(tokens))
+
+
+class ReleaseColumns:
+    """Pull requests with their summaries and categories, one row per pull request."""
+
+    STRING_COLUMNS = ['urls', 'summaries']
+    TOKENS_COLUMNS = ['titles', 'descriptions', 'commit_messages']
+
+    def __init__(self, ids: np.ndarray, urls: StringColumn, titles: TokensColumn, descriptions: TokensColumn,
+                 commit_messages: TokensColumn, summaries: StringColumn, categories: np.ndarray):
+        self.ids = ids
+        self.urls = urls
+        self.titles = titles
+        self.descriptions = descriptions
+        self.commit_messages = commit_messages
+        self.summaries = summaries
+        self.categories = categories
+
+    @classmethod
+    def from_objects(cls, prs: [PullRequest], entries: [Entry] = None, categories: [EntryCategory] = None):
+        """
+        Build the columns from the outputs of the stages, the entries and the categories are joined by the PR id.
+
+        Args:
+            prs: A list of pull requests.
+            entries: A list of change entries, the summary of a PR without an entry is empty.
+            categories: A list of change categories, the code of a PR without a category is `NO_CATEGORY`.
+
+        Returns:
+            The columns.
+        """
+        summaries = {e.id: e.body for e in entries or []}
+        codes = {c.entry_id: c.category.value for c in categories or []}
+        return cls(ids=np.array([pr.id if isinstance(pr.id, int) else -1 for pr in prs], dtype=np.int64),
+                   urls=StringColumn.from_strings([pr.url for pr in prs]),
+                   titles=TokensColumn.from_lists([pr.title for pr in prs]),
+                   descriptions=TokensColumn.from_lists([pr.description for pr in prs]),
+                   commit_messages=TokensColumn.from_lists([pr.commit_messages for pr in prs]),
+                   summaries=StringColumn.from_strings([summaries.get(pr.id, '') for pr in prs]),
+                   categories=np.array([codes.get(pr.id, NO_CATEGORY) for pr in prs], dtype=np.int8))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pull_requests(self) -> [PullRequest]:
+        ret = []
+        for url, title, desc, commits in zip(self.urls.to_list(), self.titles.to_list(),
+                                             self.descriptions.to_list(), self.commit_messages.to_list()):
+            pr = PullRequest(url)
+            pr.title = title
+            pr.description = desc
+            pr.commit_messages = commits
+            ret.append(pr)
+        return ret
+
+    def entries(self) -> [Entry]:
+        return [Entry(int(i), s) for i, s in zip(self.ids, self.summaries.to_list())]
+
+    def entry_categories(self) -> [EntryCategory]:
+        return [EntryCategory(int(i), Category(int(c))) for i, c in zip(self.ids, self.categories) if c != NO_CATEGORY]
+
+    def save(self, save_dir: str):
+        os.makedirs(save_dir, exist_ok=True)
+        np.save(os.path.join(save_dir, 'ids.npy'), self.ids)
+        np.save(os.path.join(save_dir, 'categories.npy'), self.categories)
+        for name in self.STRING_COLUMNS + self.TOKENS_COLUMNS:
+            getattr(self, name).save(os.path.join(save_dir, name))
+
+    @classmethod
+    def load(cls, save_dir: str, mmap: bool = True):
+        """Load the columns saved by `save`, the arrays are memory-mapped read-only if `mmap` is True."""
+        mmap_mode = 'r' if mmap else None
+        columns = {
+            'ids': np.load(os.path.join(save_dir, 'ids.npy'), mmap_mode=mmap_mode),
+            'categories': np.load(os.path.join(save_dir, 'categories.npy'), mmap_mode=mmap_mode),
+        }
+        for name in cls.STRING_COLUMNS:
+            columns[name] = StringColumn.load(os.path.join(save_dir, name), mmap_mode)
+        for name in cls.TOKENS_COLUMNS:
+            columns[name] = TokensColumn.load(os.path.join(save_dir, name), mmap_mode)
+        return cls(**columns)
+
+    @classmethod
+    def concat(cls, tables):
+        """Concatenate the tables, e.g., of several releases, into one."""
+        columns = {
+            'ids': np.concatenate([t.ids for t in tables]),
+            'categories': np.concatenate([t.categories for t in tables]),
+        }
+        for name in cls.STRING_COLUMNS:
+            columns[name] = StringColumn.concat([getattr(t, name) for t in tables])
+        for name in cls.TOKENS_COLUMNS:
+            columns[name] = TokensColumn.concat([getattr(t, name) for t in tables])
+        return cls(**columns)
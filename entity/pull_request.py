@@ -24,16 +24,25 @@ class PullRequest:
         self.description = []
         self.commit_messages = []
 
-    def set_data(self, data: dict):
+    def set_data(self, data: dict, max_tokens: int = None):
         """
         Set the data of the pull request.
 
         :param data:
+        :param max_tokens: The token budget of the whole pull request, i.e., `title [sep] description [sep] commits`.
+            The description and the commit messages stop being preprocessed once the budget is filled.
         :return:
         """
         self.title = preprocess_title(data.get('title'))
-        self.description = preprocess_desc_and_commits(data.get('desc'))
-        self.commit_messages = preprocess_desc_and_commits(' '.join(data.get('commits')))
+        if max_tokens is None:
+            self.description = preprocess_desc_and_commits(data.get('desc'))
+            self.commit_messages = preprocess_desc_and_commits(' '.join(data.get('commits')))
+            return
+
+        budget = max_tokens - len(self.title) - 1
+        self.description = preprocess_desc_and_commits(data.get('desc'), budget)
+        budget -= len(self.description) + 1
+        self.commit_messages = preprocess_desc_and_commits(' '.join(data.get('commits')), budget)
 
     @property
     def id(self):
@@ -0,0 +1,69 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from entity.category import Category, EntryCategory
+from entity.columnar import ReleaseColumns, NO_CATEGORY
+from entity.entry import Entry
+from entity.pull_request import PullRequest
+
+
+def prepare_data():
+    prs = []
+    for i, title in enumerate([['fix', 'a', 'bug'], ['add', 'émoji', 'support'], []]):
+        pr = PullRequest(f'https://github.com/foo/bar/pull/{i + 1}')
+        pr.title = title
+        pr.description = ['the', 'description', '.'] * i
+        pr.commit_messages = ['commit', str(i)]
+        prs.append(pr)
+    entries = [Entry(1, 'fix a bug'), Entry(2, 'add émoji support')]
+    categories = [EntryCategory(1, Category.BugFix), EntryCategory(2, Category.Features)]
+    return prs, entries, categories
+
+
+class TestReleaseColumns(unittest.TestCase):
+    prs, entries, categories = prepare_data()
+
+    def assert_same(self, columns):
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(columns.ids.tolist(), [1, 2, 3])
+        self.assertEqual(columns.categories.tolist(), [Category.BugFix.value, Category.Features.value, NO_CATEGORY])
+        for expected, actual in zip(self.prs, columns.pull_requests()):
+            self.assertEqual(str(expected), str(actual))
+        self.assertEqual(columns.titles[1], ['add', 'émoji', 'support'])
+        self.assertEqual(columns.entries(), self.entries + [Entry(3, '')])
+        self.assertEqual([(c.entry_id, c.category) for c in columns.entry_categories()],
+                         [(c.entry_id, c.category) for c in self.categories])
+
+    def test_from_objects(self):
+        self.assert_same(ReleaseColumns.from_objects(self.prs, self.entries, self.categories))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as d:
+            ReleaseColumns.from_objects(self.prs, self.entries, self.categories).save(d)
+            columns = ReleaseColumns.load(d)
+            self.assertIsInstance(columns.ids, np.memmap)
+            self.assert_same(columns)
+
+    def test_concat(self):
+        columns = ReleaseColumns.from_objects(self.prs, self.entries, self.categories)
+        first = ReleaseColumns.from_objects(self.prs[:1], self.entries, self.categories)
+        rest = ReleaseColumns.from_objects(self.prs[1:], self.entries, self.categories)
+        self.assert_same(ReleaseColumns.concat([first, rest]))
+        self.assertEqual(ReleaseColumns.concat([columns, columns]).descriptions.to_list(),
+                         columns.descriptions.to_list() * 2)
@@ -36,3 +36,15 @@ class TestPullRequest(unittest.TestCase):
         self.assertEqual(['test'], self.pr.title)
         self.assertEqual(['test', '.'], self.pr.description)
         self.assertEqual([], self.pr.commit_messages)
+
+    def test_set_data_with_budget(self):
+        data = {
+            'title': 'fix a bug',
+            'desc': 'the bug is fixed',
+            'commits': ['fix the bug', 'add tests']
+        }
+        pr = PullRequest('https://github.com/foo/bar/pull/1')
+        pr.set_data(data, max_tokens=10)
+        self.assertEqual(['fix', 'a', 'bug'], pr.title)
+        self.assertEqual(['the', 'bug', 'is', 'fixed', '.'], pr.description)
+        self.assertEqual([], pr.commit_messages)
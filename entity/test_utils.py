@@ -12,9 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
 import pytest
 
-from entity.utils import parse_pull_request_url, preprocess_title, preprocess_desc_and_commits
+from entity.utils import parse_pull_request_url, preprocess_title, preprocess_desc_and_commits, replace_versions, \
+    PATTERNS
+
+# the time budget (in seconds) for preprocessing a single adversarial input
+TIME_BUDGET = 2
+
+LOG = '\n'.join(f'2022-03-01 12:00:{i % 60:02d} INFO org.apache.skywalking.oap.server.core.Module{i} started in {i}ms'
+                for i in range(5000))
 
 
 class TestUtils:
@@ -39,6 +48,64 @@ class TestUtils:
     def test_preprocess_desc_and_commits(self, text, expected):
         assert preprocess_desc_and_commits(text) == expected
 
+    @pytest.mark.parametrize("text,expected", [
+        ("contact foo.bar@test.com", True),
+        ("contact \"foo bar\"@test.com", True),
+        ("contact foo@[127.0.0.1]", True),
+        ("contact foo.bar@test", False),
+        ("foo. @test.com", False),
+    ])
+    def test_email_pattern(self, text, expected):
+        assert (PATTERNS['email_pattern'].search(text) is not None) == expected
+
+    @pytest.mark.parametrize("text, expected", [
+        ('from 1.2.3 to v1.2.4-rc.1', 'from  version  to  version '),
+        ('bump to 01.2.3 now', 'bump to 0 version  now'),
+        ('v007.1.2', 'v00 version '),
+        ('2021.10.1.5', ' version '),
+        ('1.2.3.04.5.6', ' version  version '),
+        ('1.2.03.4.5', ' version  version '),
+        ('12.3', '12.3'),
+    ])
+    def test_replace_versions(self, text, expected):
+        assert replace_versions(text) == expected
+
+    @pytest.mark.parametrize("text", [
+        'a.' * 50000,
+        '"a' * 50000,
+        '1' * 100000,
+        '10' * 50000,
+        '0' * 100000,
+        '01' * 50000,
+        '1.0' * 50000,
+        'x@' + 'a-' * 50000,
+        LOG,
+    ])
+    def test_preprocess_adversarial_input(self, text):
+        beg = time.perf_counter()
+        preprocess_desc_and_commits(text)
+        assert time.perf_counter() - beg < TIME_BUDGET
+
+    @pytest.mark.parametrize("text,max_tokens,expected", [
+        ("fix a bug", 10, ["fix", "a", "bug", "."]),
+        ("fix a bug", 2, ["fix", "a"]),
+        ("fix a bug", 0, []),
+        ("fix a bug\n```\ncode here\n```\nadd tests", 10, ["fix", "a", "bug", ".", "add", "tests", "."]),
+        ("fix a bug\n<!-- a\ncomment -->\n- [x] i have added tests", 10, ["fix", "a", "bug", "."]),
+        ("fix a bug\ntraceback (most recent call last):\n  file \"a.py\", line 1, in <module>", 10,
+         ["fix", "a", "bug", "."]),
+        ("fix a bug\n2022-03-01 12:00:00 starting the server", 10, ["fix", "a", "bug", "."]),
+    ])
+    def test_preprocess_desc_and_commits_with_budget(self, text, max_tokens, expected):
+        assert preprocess_desc_and_commits(text, max_tokens) == expected
+
+    def test_preprocess_huge_input_with_budget(self):
+        text = '\n'.join(['fix a bug in the storage module'] * 100000)
+        beg = time.perf_counter()
+        tokens = preprocess_desc_and_commits(text, 400)
+        assert len(tokens) == 400
+        assert time.perf_counter() - beg < TIME_BUDGET / 10
+
     @pytest.mark.parametrize("url, expected", [
         ('https://github.com/apache/skywalking-python/pull/175', ('apache', 'skywalking-python', 175))])
     def test_parse_pull_request_url(self, url, expected):
@@ -18,8 +18,10 @@ from nltk.tokenize import sent_tokenize, word_tokenize
 
 # patterns that need to be removed
 PATTERNS = {
+    # only the existence of an address matters, so the pattern anchors on the `@` and checks just enough of the
+    # local part and the domain around it, which keeps the scan linear even for long dotted strings
     'email_pattern': re.compile(
-        r'(([^<>()\[\]\\.,;:\s@"]+(\.[^<>()\[\]\\.,;:\s@"]+)*)|(".+"))@((\[[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}])|(([a-zA-Z\-0-9]+\.)+[a-zA-Z]{2,}))'),
+        r'(?:[^<>()\[\]\\.,;:\s@"]|"""|"[^"\n]+"+)@(?:\[[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}]|(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2})'),
     'url_pattern': re.compile(
         r'https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()!@:%_\+.~#?&\/\/=]*)'),
     'reference_pattern': re.compile(r'#[\d]+'),
@@ -28,10 +30,29 @@ PATTERNS = {
 }
 
 # patterns that need to be replaced
-version_pattern = r'v?(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(\.(0|[1-9]\d*))?(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?'
+# a version never starts in the middle of a number, otherwise every digit of a long number is a new starting point.
+# The leading zeros of a number are matched instead, and kept by `replace_version` like the version started after them
+version_body = r'(?P<zeros>0*)(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(\.(0|[1-9]\d*))?(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?'
+version_pattern = re.compile(r'v?(?<!\d)' + version_body)
+# a version right after the digits of the previous one, e.g., the 4.5.6 of 1.2.3.04.5.6, see `replace_versions`
+continued_version_pattern = re.compile(version_body)
 sha_pattern = r'(^|\s)[\dA-Fa-f-]{7,}(?=(\s|$))'
 digit_pattern = r'(\s|-|\.)[\d]+(?=\s)'
 
+# lines that are skipped by the budgeted preprocessing, they are matched against the cleaned and stripped line
+NOISE_LINE_PATTERN = re.compile(
+    r'\d{4}-\d{2}-\d{2}[ t]\d{2}:\d{2}'  # log lines starting with a timestamp
+    r'|\[(trace|debug|info|warn|warning|error|fatal)]'  # log lines starting with a level
+    r'|traceback \(most recent call last\)|file "[^"]*", line \d+'  # python stack traces
+    r'|at [\w$.<>]+\(|caused by:|exception in thread'  # java stack traces
+    r'|([-+] )?\[[ x]] '  # checklists, the asterisks are already removed
+)
+FENCES = ('```', '~~~')
+# the number of characters preprocessed at a time by the budgeted preprocessing
+CHUNK_SIZE = 2048
+# the max number of characters of a single line that can be used for each token of the budget
+CHARS_PER_TOKEN = 16
+
 
 def preprocess_title(s: str) -> [str]:
     functions = [remove_non_ascii_and_asterisk, remove_ref_and_mention, replace_words, my_strip]
@@ -42,7 +63,18 @@ def preprocess_title(s: str) -> [str]:
     return s
 
 
-def preprocess_desc_and_commits(s: str) -> [str]:
+def preprocess_desc_and_commits(s: str, max_tokens: int = None) -> [str]:
+    """
+    Preprocess the description or the commit messages of a pull request.
+
+    :param s: The text to preprocess.
+    :param max_tokens: If set, preprocess the text chunk by chunk, skip code blocks, logs, stack traces and
+        checklists, and stop once `max_tokens` tokens are produced.
+    :return: A list of tokens.
+    """
+    if max_tokens is not None:
+        return preprocess_with_budget(s, max_tokens)
+
     functions = [remove_non_ascii_and_asterisk, preprocess_text, replace_words, my_strip]
 
     for f in functions:
@@ -51,6 +83,85 @@ def preprocess_desc_and_commits(s: str) -> [str]:
     return s
 
 
+def preprocess_with_budget(s: str, max_tokens: int) -> [str]:
+    tokens = []
+    chunk = []
+    size = 0
+    for line in iter_content_lines(str(s), max_tokens * CHARS_PER_TOKEN):
+        if len(tokens) >= max_tokens:
+            break
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            tokens.extend(preprocess_chunk(chunk))
+            chunk = []
+            size = 0
+    if chunk and len(tokens) < max_tokens:
+        tokens.extend(preprocess_chunk(chunk))
+    return tokens[:max(max_tokens, 0)]
+
+
+def preprocess_chunk(lines: [str]) -> [str]:
+    return my_strip(replace_words(preprocess_text('\n'.join(lines))))
+
+
+def iter_content_lines(s: str, max_line_length: int):
+    """
+    Iterate the cleaned lines of the text that are worth summarizing.
+
+    Fenced code blocks, HTML comments and the lines matching `NOISE_LINE_PATTERN` are skipped, and every line
+    is truncated to `max_line_length` characters before it is cleaned, so a huge line costs no more than a short one.
+
+    :param s: The raw text.
+    :param max_line_length: The max number of characters of a line.
+    :return: A generator of lines.
+    """
+    in_fence = False
+    in_comment = False
+    beg = 0
+    while beg < len(s):
+        end = s.find('\n', beg)
+        if end == -1:
+            end = len(s)
+        line = s[beg:min(end, beg + max_line_length)]
+        beg = end + 1
+
+        if in_comment:
+            pos = line.find('-->')
+            if pos == -1:
+                continue
+            in_comment = False
+            line = line[pos + 3:]
+        line, in_comment = remove_html_comments(line)
+
+        stripped = line.lstrip()
+        if stripped.startswith(FENCES):
+            in_fence = not in_fence
+            continue
+        if in_fence:
+            continue
+
+        line = remove_non_ascii_and_asterisk(line)
+        if line and NOISE_LINE_PATTERN.match(line) is None:
+            yield line
+
+
+def remove_html_comments(line: str) -> (str, bool):
+    """Remove the HTML comments in the line, and return whether the last comment is still open."""
+    parts = []
+    beg = 0
+    while True:
+        pos = line.find('<!--', beg)
+        if pos == -1:
+            parts.append(line[beg:])
+            return ''.join(parts), False
+        parts.append(line[beg:pos])
+        end = line.find('-->', pos + 4)
+        if end == -1:
+            return ''.join(parts), True
+        beg = end + 3
+
+
 def my_strip(s: str) -> [str]:
     s = str(s)
     s = s.replace('#', '')
@@ -90,21 +201,40 @@ def preprocess_text(text: str) -> str:
     sens = sent_tokenize(" ".join(temp))
     ret = []
     for sen in sens:
-        flag = True
-        for p in PATTERNS.values():
-            if len(p.findall(sen)) > 0:
-                flag = False
-                break
-        if flag:
+        # `search` stops at the first match instead of collecting all of them
+        if not any(p.search(sen) for p in PATTERNS.values()):
             ret.append(sen)
 
     return ' '.join(ret).strip()
 
 
+def replace_version(match: re.Match) -> str:
+    # the leading zeros are kept, the same as when the version starts after them
+    if match.group('zeros'):
+        return match.group(0)[:match.end('zeros') - match.start()] + ' version '
+    return ' version '
+
+
+def replace_versions(text: str) -> str:
+    """Replace the versions with ` version `, in linear time but the same as a scan from every position would."""
+    ret = []
+    pos = 0
+    match = version_pattern.search(text)
+    while match is not None:
+        ret.append(text[pos:match.start()])
+        ret.append(replace_version(match))
+        pos = match.end()
+        match = continued_version_pattern.match(text, pos) if text[pos:pos + 1].isdigit() else None
+        if match is None:
+            match = version_pattern.search(text, pos)
+    ret.append(text[pos:])
+    return ''.join(ret)
+
+
 # replace version, sha, digit and `nan`
 def replace_words(text: str) -> str:
     ret = re.sub(sha_pattern, ' sha ', text)
-    ret = re.sub(version_pattern, ' version ', ret)
+    ret = replace_versions(ret)
     ret = re.sub(digit_pattern, ' 0 ', ret)
     return ret
 
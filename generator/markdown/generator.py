@@ -13,9 +13,11 @@
 # limitations under the License.
 import string
 
+import numpy as np
 from loguru import logger
 
 from entity.category import Category, EntryCategory
+from entity.columnar import ReleaseColumns
 from entity.entry import Entry
 from entity.group import Group
 from generator.base import Generator
@@ -42,6 +44,20 @@ class MarkdownGenerator(Generator):
                 ret.append(groups[Category[o].value])
         return ret
 
+    @staticmethod
+    def merge_columns(columns: ReleaseColumns, order='FBDN') -> [Group]:
+        """Same as `merge`, but the entries and their categories are already joined in the columns."""
+        ret = []
+        for o in order:
+            indices = np.flatnonzero(columns.categories == Category[o].value)
+            if len(indices) == 0:
+                continue
+            group = Group(Category[o])
+            for i in indices:
+                group.append(Entry(int(columns.ids[i]), columns.summaries[i]))
+            ret.append(group)
+        return ret
+
     def generate_content(self, groups: [Group], **kwargs):
         lines = []
         for g in groups:
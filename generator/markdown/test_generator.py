@@ -17,7 +17,9 @@ import unittest
 import pytest
 
 from entity.category import Category, EntryCategory
+from entity.columnar import ReleaseColumns
 from entity.entry import Entry
+from entity.pull_request import PullRequest
 from generator.markdown.generator import MarkdownGenerator, process_single_category, process_single_entry, capitalize
 
 
@@ -53,6 +55,14 @@ class TestMarkdownGenerator(unittest.TestCase):
         for i in range(3):
             self.assertIn(self.entries[i], groups[1].entries)
 
+    def test_merge_columns(self):
+        prs = [PullRequest(f'https://github.com/foo/bar/pull/{e.id}') for e in self.entries]
+        columns = ReleaseColumns.from_objects(prs, self.entries, self.entry_categories)
+        groups = self.generator.merge_columns(columns)
+        expected = self.generator.merge(self.entries, self.entry_categories)
+        self.assertEqual([g.category for g in expected], [g.category for g in groups])
+        self.assertEqual([g.entries for g in expected], [g.entries for g in groups])
+
     def test_generate_content(self):
         groups = self.generator.merge(self.entries, self.entry_categories)
         content = self.generator.generate_content(groups)
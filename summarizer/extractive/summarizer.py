@@ -0,0 +1,121 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A summarizer which extracts the entries from the titles and the descriptions of the PRs with heuristic cleanup. It
+needs no model and takes microseconds per PR, e.g., for preview builds, see `summarizer.fallback`.
+"""
+
+from entity.entry import Entry
+from entity.pull_request import PullRequest
+from summarizer.base import Summarizer
+
+# the types of conventional commits, e.g., `fix(parser): ...`, the ones which are verbs are kept in the entries
+COMMIT_TYPES = {'feat', 'feature', 'fix', 'docs', 'doc', 'style', 'refactor', 'perf', 'test', 'tests', 'build', 'ci',
+                'chore', 'revert', 'deps'}
+VERB_TYPES = {'fix', 'refactor', 'revert', 'test'}
+# the leading words of the sentences which refer to the PR itself, e.g., `this pr fixes ...`
+SELF_REFERENCES = [['this', 'pr'], ['this', 'pull', 'request'], ['this', 'change'], ['this', 'commit'],
+                   ['this', 'patch']]
+SENTENCE_ENDS = {'.', '!', '?'}
+PUNCTUATION = {'.', ',', ':', ';', '!', '?', '-', '--', '(', ')', '[', ']', '``', "''", '`'}
+# the sentences of fewer words are skipped, e.g., the headings of PR templates
+MIN_SENTENCE_WORDS = 3
+# the titles of fewer words are completed by the first sentence of the description
+MIN_TITLE_WORDS = 4
+
+
+def strip_punctuation(words: [str]) -> [str]:
+    beg, end = 0, len(words)
+    while beg < end and words[beg] in PUNCTUATION:
+        beg += 1
+    while end > beg and words[end - 1] in PUNCTUATION:
+        end -= 1
+    return words[beg:end]
+
+
+def strip_tags(words: [str]) -> [str]:
+    """Remove the leading tags of a title, e.g., `[wip]` or `[ci skip]`."""
+    while words and words[0] == '[' and ']' in words:
+        words = words[words.index(']') + 1:]
+    return words
+
+
+def strip_commit_type(words: [str]) -> [str]:
+    """Remove the conventional commit type of a title, e.g., `chore(deps):`, but keep the ones which are verbs."""
+    if not words or words[0] not in COMMIT_TYPES:
+        return words
+    rest = words[1:]
+    if rest[:1] == ['('] and ')' in rest:
+        rest = rest[rest.index(')') + 1:]
+    if rest[:1] == ['!']:
+        rest = rest[1:]
+    if rest[:1] != [':']:
+        return words
+    rest = strip_punctuation(rest)
+    if words[0] in VERB_TYPES and not (rest and rest[0].startswith(words[0])):
+        rest = [words[0]] + rest
+    return rest
+
+
+def sentences(words: [str]):
+    beg = 0
+    for i, word in enumerate(words):
+        if word in SENTENCE_ENDS:
+            yield words[beg:i]
+            beg = i + 1
+    if beg < len(words):
+        yield words[beg:]
+
+
+def first_sentence(words: [str]) -> [str]:
+    """The first sentence of the text which is not a heading or a checklist item, without referring to the PR."""
+    for sentence in sentences(words):
+        # a checklist item starts with a box, e.g., `- [x]`
+        if '[' in sentence[:2]:
+            continue
+        sentence = strip_punctuation(sentence)
+        if len(sentence) < MIN_SENTENCE_WORDS:
+            continue
+        for reference in SELF_REFERENCES:
+            if sentence[:len(reference)] == reference:
+                sentence = strip_punctuation(sentence[len(reference):])
+                break
+        if sentence:
+            return sentence
+    return []
+
+
+class ExtractiveSummarizer(Summarizer):
+    def summarize(self, items: [PullRequest]) -> [Entry]:
+        return [Entry(pr.id, self.extract(pr)) for pr in items]
+
+    @staticmethod
+    def extract(pr: PullRequest) -> str:
+        """
+        The cleaned title of the PR, which is completed by the first sentence of its description if it is short. The
+        first sentence of the commit messages is used if both of them are empty. The words are the preprocessed ones
+        of the PR, separated by spaces like the outputs of `EntrySummarizer`.
+        """
+        title = strip_punctuation(strip_commit_type(strip_tags(pr.title)))
+        words = title
+        if len(title) < MIN_TITLE_WORDS:
+            sentence = first_sentence(pr.description)
+            if not title:
+                words = sentence
+            elif sentence and not set(sentence) <= set(title):
+                words = title + [','] + sentence
+        if not words:
+            words = first_sentence(pr.commit_messages)
+        return ' '.join(words)
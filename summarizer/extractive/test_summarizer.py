@@ -0,0 +1,49 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from entity.pull_request import PullRequest
+from summarizer.extractive.summarizer import ExtractiveSummarizer
+
+
+def make_pr(title, desc='', commits=()):
+    pr = PullRequest('https://github.com/owner/repo/pull/1')
+    pr.set_data({'title': title, 'desc': desc, 'commits': list(commits)})
+    return pr
+
+
+@pytest.mark.parametrize("title,desc,commits,expected", [
+    ('[WIP] Fix: crash when config is missing (#123)', 'This PR fixes the crash.', [],
+     'fix crash when config is missing'),
+    ('chore(deps): bump lodash from 4.17.15 to 4.17.21', 'Bumps lodash from 4.17.15 to 4.17.21.', [],
+     'bump lodash from version to version'),
+    ('feat(parser)!: support yaml anchors', '', [], 'support yaml anchors'),
+    ('fix: fixed typo', '', [], 'fixed typo'),
+    # a short title is completed by the first sentence which is not a heading or a checklist item
+    ('Update README.md', '## Description\n- [x] docs\nThis pull request corrects the installation steps.', [],
+     'update readme.md , corrects the installation steps'),
+    ('Docs', 'Docs', [], 'docs'),
+    ('', 'The cache is evicted by size. It is tested.', [], 'the cache is evicted by size'),
+    ('', '', ['Add retries to the http client'], 'add retries to the http client'),
+])
+def test_extract(title, desc, commits, expected):
+    assert ExtractiveSummarizer.extract(make_pr(title, desc, commits)) == expected
+
+
+def test_summarize():
+    prs = [make_pr('Fix the bug'), make_pr('Add a feature')]
+    prs[1].number = 2
+    entries = ExtractiveSummarizer().summarize(prs)
+    assert [(e.id, e.body) for e in entries] == [(1, 'fix the bug'), (2, 'add a feature')]
@@ -0,0 +1,111 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The abstractive summarizer, which falls back to the extractive one when decoding the PRs of a run is predicted to
+take longer than the budget, e.g., for preview builds where latency matters more than polish.
+"""
+
+import math
+import os
+import time
+
+from loguru import logger
+
+from entity.entry import Entry
+from entity.pull_request import PullRequest
+from summarizer.base import Summarizer
+from summarizer.extractive.summarizer import ExtractiveSummarizer
+from summarizer.pg_network.cache import SummaryCache, cache_key, cache_prefix
+from summarizer.pg_network.dataset.data import pr2article, pr2words
+from summarizer.pg_network.dedup import group_duplicates
+from summarizer.pg_network.params import PARAMS, Params
+
+# the seconds of decoding a PR per predicted decoder step in batches of 16 on a single core, see `predicted_steps`.
+# `python -m summarizer.pg_network.benchmark seconds_per_step` measures 0.0031 to 0.0037 on one machine and 0.006 on
+# another, the slower one is taken so that the budget is not exceeded. It is calibrated by every abstractive run.
+SECONDS_PER_STEP = 0.006
+
+
+def predicted_steps(params: Params, enc_len: int) -> int:
+    """The max decoder steps of an article of `enc_len` words, which bound its steps in `BeamSearch`."""
+    return min(params.max_dec_steps, math.ceil(params.dec_steps_ratio * min(enc_len, params.max_enc_steps)))
+
+
+class FallbackSummarizer(Summarizer):
+    def __init__(self, **kwargs):
+        """
+        The options are the ones of `EntrySummarizer`, which is only created when it is needed, and:
+
+        - latency_budget: the max predicted seconds of decoding the PRs of a run, they are summarized by
+          `ExtractiveSummarizer` beyond it, 0 means no limit.
+        - seconds_per_step: the seconds of decoding a PR per predicted decoder step, see `predict_seconds`. It is
+          replaced by the measured one after every abstractive run.
+        """
+        super().__init__(**kwargs)
+        self.latency_budget = float(kwargs.get('latency_budget', 0))
+        self.seconds_per_step = float(kwargs.get('seconds_per_step', SECONDS_PER_STEP))
+        self.params = Params(**{k: v for k, v in kwargs.items() if k in PARAMS})
+        self.near_duplicate_threshold = float(kwargs.get('near_duplicate_threshold', 0))
+        self.extractive = ExtractiveSummarizer()
+        self.abstractive = None
+
+        # the summaries cached by `EntrySummarizer` are not decoded, so they are not predicted either
+        self.cache = None
+        if kwargs.get('cache_path') and os.path.isfile(kwargs.get('model_path', '')):
+            self.cache = SummaryCache(kwargs['cache_path'], max_size_mb=kwargs.get('cache_size_mb', 64))
+            self.cache_prefix = cache_prefix(self.cache.model_digest(kwargs['model_path']), self.params,
+                                             int(kwargs.get('ngram_filter', 1)), self.near_duplicate_threshold)
+
+    def predict_steps(self, items: [PullRequest]) -> int:
+        """
+        The predicted decoder steps of the PRs, without loading the model: the ones of a PR of each group of
+        duplicate articles which are not cached, like `EntrySummarizer`, see `predicted_steps`.
+        """
+        articles = [pr2article(pr) for pr in items]
+        pending = list(range(len(items)))
+        if self.cache is not None:
+            cached = self.cache.get_many([cache_key(self.cache_prefix, article) for article in articles])
+            pending = [i for i in pending if cached[i] is None]
+        groups = group_duplicates([articles[i] for i in pending], self.near_duplicate_threshold)
+        return sum(predicted_steps(self.params, len(pr2words(items[pending[group[0]]]))) for group in groups)
+
+    def num_workers(self) -> int:
+        return max(1, min(self.params.num_workers, os.cpu_count() or 1))
+
+    def predict_seconds(self, items: [PullRequest]) -> float:
+        """The predicted seconds of decoding the PRs, their predicted steps split among the workers."""
+        return self.predict_steps(items) * self.seconds_per_step / self.num_workers()
+
+    def summarize(self, items: [PullRequest]) -> [Entry]:
+        steps = None
+        if self.latency_budget > 0:
+            steps = self.predict_steps(items)
+            predicted = steps * self.seconds_per_step / self.num_workers()
+            if predicted > self.latency_budget:
+                logger.info(f'Summarizing {len(items)} PR(s) is predicted to take {predicted:.1f} seconds, beyond the '
+                            f'budget of {self.latency_budget:g} seconds, they are summarized extractively')
+                return self.extractive.summarize(items)
+
+        if self.abstractive is None:
+            # torch and the model are only loaded when the abstractive summarizer is needed
+            from summarizer.pg_network.summarizer import EntrySummarizer
+            self.abstractive = EntrySummarizer(**self.kwargs)
+        beg = time.time()
+        entries = self.abstractive.summarize(items)
+        if steps:
+            # calibrate the prediction of the next runs by this one
+            self.seconds_per_step = (time.time() - beg) * self.num_workers() / steps
+            logger.debug(f'Decoding took {self.seconds_per_step:.4f} seconds per predicted step')
+        return entries
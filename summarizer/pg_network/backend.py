@@ -0,0 +1,225 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The runtime backends of the encoder and a decoder step of `BeamSearch`, selected by `params.backend`:
+
+- eager: the PyTorch modules.
+- torchscript: the modules traced by `torch.jit.trace`.
+- onnx: the modules exported to ONNX and run by onnxruntime, which is an optional dependency.
+
+The traced and exported modules are loaded from `params.export_dir` if it is set, see `export.py`, otherwise they
+are traced from the loaded model when the backend is created.
+"""
+
+import inspect
+import io
+import os
+
+import torch
+from torch import nn
+
+ENCODER_FILE = 'encoder'
+STEP_FILE = 'decoder_step'
+ENCODER_INPUTS = ['enc_inps', 'enc_seq_lens']
+ENCODER_OUTPUTS = ['enc_outputs', 'enc_features', 's_0_h', 's_0_c']
+STEP_INPUTS = ['y_t_1', 's_t_1_h', 's_t_1_c', 'c_t_1', 'enc_outputs', 'enc_features', 'enc_pad_mask',
+               'extend_vocab_zeros', 'enc_inps_extended', 'coverage_t']
+STEP_OUTPUTS = ['log_probs', 's_t_h', 's_t_c', 'c_t', 'attn_dist', 'coverage_t_plus']
+# ScatterElements supports reduction='add' since opset 16
+ONNX_OPSET = 16
+
+
+class DecoderStep(nn.Module):
+    """`AttentionDecoder.step` with tensor inputs and outputs only, so that it can be traced."""
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.decoder = decoder
+
+    def forward(self, y_t_1, s_t_1_h, s_t_1_c, c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+                enc_inps_extended, coverage_t):
+        log_probs, s_t, c_t, attn_dist, coverage_t_plus = self.decoder.step(
+            y_t_1, (s_t_1_h, s_t_1_c), c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+            enc_inps_extended, coverage_t if self.decoder._hps.is_coverage else None)
+        if self.decoder._hps.is_coverage:
+            return log_probs, s_t[0], s_t[1], c_t, attn_dist, coverage_t_plus
+        return log_probs, s_t[0], s_t[1], c_t, attn_dist
+
+
+def example_inputs(params, batch_size=2, enc_len=8, num_extend=2):
+    """The inputs to trace the encoder and the decoder step with, the sizes of the traced graphs are dynamic."""
+    device = torch.device(params.eval_device)
+    enc_inps = torch.randint(4, params.vocab_size, (batch_size, enc_len), device=device)
+    # the lengths are sorted in descending order for `pack_padded_sequence`
+    enc_seq_lens = torch.arange(enc_len, enc_len - batch_size, -1, dtype=torch.long)
+
+    step_inputs = (torch.randint(4, params.vocab_size, (batch_size,), device=device),
+                   torch.zeros((1, batch_size, params.hidden_dim), device=device),
+                   torch.zeros((1, batch_size, params.hidden_dim), device=device),
+                   torch.zeros((batch_size, 1, 2 * params.hidden_dim), device=device),
+                   torch.randn((batch_size, enc_len, 2 * params.hidden_dim), device=device),
+                   torch.randn((batch_size, enc_len, 2 * params.hidden_dim), device=device),
+                   torch.ones((batch_size, enc_len), device=device),
+                   torch.zeros((batch_size, num_extend), device=device),
+                   torch.randint(0, params.vocab_size + num_extend, (batch_size, enc_len), device=device),
+                   torch.zeros((batch_size, enc_len), device=device))
+    return (enc_inps, enc_seq_lens), step_inputs
+
+
+@torch.no_grad()
+def trace(params, model):
+    """Trace the encoder and the decoder step of the model into TorchScript modules."""
+    encoder_inputs, step_inputs = example_inputs(params)
+    # the traced graphs are checked by the parity tests with other sizes instead
+    encoder = torch.jit.trace(model.encoder, encoder_inputs, check_trace=False)
+    step = torch.jit.trace(DecoderStep(model.decoder), step_inputs, check_trace=False)
+    return encoder, step
+
+
+@torch.no_grad()
+def export_onnx(params, model, encoder_file, step_file):
+    """Export the encoder and the decoder step of the model to ONNX, the files can also be file-like objects."""
+    if params.quantize:
+        raise ValueError('The dynamically quantized model cannot be exported to ONNX')
+    encoder_inputs, step_inputs = example_inputs(params)
+    options = {'opset_version': ONNX_OPSET}
+    # newer versions of torch export with dynamo by default, which needs onnxscript
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        options['dynamo'] = False
+
+    encoder_axes = {'enc_inps': {0: 'batch', 1: 'enc_len'}, 'enc_seq_lens': {0: 'batch'},
+                    'enc_outputs': {0: 'batch', 1: 'enc_len'}, 'enc_features': {0: 'batch', 1: 'enc_len'},
+                    's_0_h': {1: 'batch'}, 's_0_c': {1: 'batch'}}
+    torch.onnx.export(model.encoder, encoder_inputs, encoder_file, input_names=ENCODER_INPUTS,
+                      output_names=ENCODER_OUTPUTS, dynamic_axes=encoder_axes, **options)
+
+    step_outputs = STEP_OUTPUTS if params.is_coverage else STEP_OUTPUTS[:-1]
+    step_axes = {name: {0: 'rows'} for name in STEP_INPUTS + STEP_OUTPUTS}
+    for name in ('s_t_1_h', 's_t_1_c', 's_t_h', 's_t_c'):
+        step_axes[name] = {1: 'rows'}
+    for name in ('enc_outputs', 'enc_features', 'enc_pad_mask', 'enc_inps_extended', 'coverage_t', 'attn_dist',
+                 'coverage_t_plus'):
+        step_axes[name][1] = 'enc_len'
+    if not params.is_coverage:
+        del step_axes['coverage_t_plus']
+    step_axes['extend_vocab_zeros'][1] = 'num_extend'
+    step_axes['log_probs'][1] = 'extend_vocab_size'
+    torch.onnx.export(DecoderStep(model.decoder), step_inputs, step_file, input_names=STEP_INPUTS,
+                      output_names=step_outputs, dynamic_axes=step_axes, **options)
+
+
+class EagerBackend(object):
+    def __init__(self, params, model):
+        self.params = params
+        self.model = model
+
+    def encode(self, enc_batch, enc_lens):
+        """The same as `Encoder.forward`."""
+        return self.model.encoder(enc_batch, enc_lens)
+
+    def step(self, y_t_1, s_t_1, c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+             enc_inps_extended, coverage_t, shortlist=None):
+        """The same as `AttentionDecoder.step`."""
+        return self.model.decoder.step(y_t_1, s_t_1, c_t_1, enc_outputs, enc_features, enc_pad_mask,
+                                       extend_vocab_zeros, enc_inps_extended, coverage_t, shortlist)
+
+    def step_inputs(self, y_t_1, s_t_1, c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+                    enc_inps_extended, coverage_t):
+        """The inputs of `DecoderStep`, the optional inputs are replaced by tensors which are not used."""
+        if extend_vocab_zeros is None:
+            extend_vocab_zeros = enc_features.new_zeros((y_t_1.size(0), 0))
+        if enc_inps_extended is None:
+            enc_inps_extended = torch.zeros_like(enc_pad_mask, dtype=torch.long)
+        if coverage_t is None:
+            coverage_t = enc_pad_mask
+        return (y_t_1, s_t_1[0], s_t_1[1], c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+                enc_inps_extended, coverage_t)
+
+    def step_outputs(self, outputs):
+        """The outputs of `DecoderStep` in the form of the outputs of `AttentionDecoder.step`."""
+        coverage_t_plus = outputs[5] if self.params.is_coverage else None
+        return outputs[0], (outputs[1], outputs[2]), outputs[3], outputs[4], coverage_t_plus
+
+
+class TorchScriptBackend(EagerBackend):
+    def __init__(self, params, model):
+        super().__init__(params, model)
+        if params.export_dir:
+            device = torch.device(params.eval_device)
+            self.encoder = torch.jit.load(os.path.join(params.export_dir, f'{ENCODER_FILE}.pt'), map_location=device)
+            self.decoder_step = torch.jit.load(os.path.join(params.export_dir, f'{STEP_FILE}.pt'), map_location=device)
+        else:
+            self.encoder, self.decoder_step = trace(params, model)
+
+    def encode(self, enc_batch, enc_lens):
+        return self.encoder(enc_batch, torch.as_tensor(enc_lens, dtype=torch.long))
+
+    def step(self, *inputs):
+        return self.step_outputs(self.decoder_step(*self.step_inputs(*inputs)))
+
+
+class OnnxBackend(EagerBackend):
+    def __init__(self, params, model):
+        super().__init__(params, model)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError('The onnx backend needs onnxruntime, install it by `pip install onnxruntime`')
+
+        if params.export_dir:
+            encoder = os.path.join(params.export_dir, f'{ENCODER_FILE}.onnx')
+            step = os.path.join(params.export_dir, f'{STEP_FILE}.onnx')
+        else:
+            encoder_file, step_file = io.BytesIO(), io.BytesIO()
+            export_onnx(params, model, encoder_file, step_file)
+            encoder, step = encoder_file.getvalue(), step_file.getvalue()
+
+        options = onnxruntime.SessionOptions()
+        # follow the threads of torch, see `InferenceRuntime`
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.encoder = onnxruntime.InferenceSession(encoder, options, providers=['CPUExecutionProvider'])
+        self.decoder_step = onnxruntime.InferenceSession(step, options, providers=['CPUExecutionProvider'])
+        self.device = torch.device(params.eval_device)
+
+    def run(self, session, names, inputs):
+        # the unused inputs are removed from the exported graph
+        feeds = dict(zip(names, inputs))
+        outputs = session.run(None, {i.name: feeds[i.name].detach().cpu().contiguous().numpy()
+                                     for i in session.get_inputs()})
+        return [torch.from_numpy(output).to(self.device) for output in outputs]
+
+    def encode(self, enc_batch, enc_lens):
+        enc_outputs, enc_features, s_0_h, s_0_c = self.run(self.encoder, ENCODER_INPUTS,
+                                                           (enc_batch, torch.as_tensor(enc_lens, dtype=torch.long)))
+        return enc_outputs, enc_features, (s_0_h, s_0_c)
+
+    def step(self, *inputs):
+        return self.step_outputs(self.run(self.decoder_step, STEP_INPUTS, self.step_inputs(*inputs)))
+
+
+BACKENDS = {
+    'eager': EagerBackend,
+    'torchscript': TorchScriptBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def create_backend(params, model):
+    if params.backend not in BACKENDS:
+        raise ValueError(f'Unknown backend: {params.backend}, expected one of {", ".join(BACKENDS)}')
+    if params.shortlist_size > 0 and params.backend != 'eager':
+        # the traced decoder step computes the distribution over the whole vocab
+        raise ValueError(f'The shortlist is only supported by the eager backend, not {params.backend}')
+    return BACKENDS[params.backend](params, model)
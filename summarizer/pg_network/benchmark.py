@@ -0,0 +1,402 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the pointer-generator network, e.g., `python -m summarizer.pg_network.benchmark encoder --n=100`.
+
+The weights are random unless a checkpoint is given, which does not matter for measuring the speed.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+import fire
+import torch
+
+from bulk.inference import read_records
+from entity.pull_request import PullRequest
+from summarizer.fallback import predicted_steps
+from summarizer.pg_network.backend import create_backend
+from summarizer.pg_network.dataset.batcher import Batch, Example
+from summarizer.pg_network.dataset.scheduler import bucket_by_length
+from summarizer.pg_network.dataset.train_util import get_input_from_batch
+from summarizer.pg_network.decode import BeamSearch
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.runtime import InferenceRuntime, peak_rss_mb
+from summarizer.pg_network.summarizer import EntrySummarizer
+
+# load the vocab in a fresh process, the dicts are the same as the ones of the former vocab.py. The current RSS is
+# read from /proc since the peak RSS of a child process can be inherited from its parent, so it runs on Linux only.
+VOCAB_SCRIPT = """
+import resource, sys, time
+import loguru, numpy
+
+def rss_mb():
+    return int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 1024 / 1024
+
+before = rss_mb()
+beg = time.time()
+if sys.argv[1] == 'mmap':
+    from summarizer.pg_network.dataset.data import Vocab
+    vocab = Vocab()
+else:
+    # the module of the dict literals which the vocab used to be, in the directory of the argument
+    sys.path.insert(0, sys.argv[2])
+    from vocab import WORD_TO_ID, ID_TO_WORD
+print(time.time() - beg, rss_mb() - before)
+"""
+# the module of the vocab before it became the memory-mapped vocab file, relative to the root of the repo
+VOCAB_MODULE = 'summarizer/pg_network/vocab.py'
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def vocab_runs(way, args, repeat, env=None):
+    """Run `VOCAB_SCRIPT` in `repeat` fresh processes, the best milliseconds and the least increase of the RSS."""
+    runs = [subprocess.run([sys.executable, *args], stdout=subprocess.PIPE, check=True, env=env)
+            for _ in range(repeat)]
+    results = [[float(x) for x in run.stdout.split()] for run in runs]
+    return {f'{way}_load_ms': round(min(r[0] for r in results) * 1000, 3),
+            f'{way}_rss_mb': round(min(r[1] for r in results), 1)}
+
+
+class Benchmark(object):
+    def __init__(self, model_path=None, input_path=None, n=100, seed=0):
+        """
+        Args:
+            model_path: the path of the checkpoint, the weights are random if it is None.
+            input_path: a JSONL or CSV file of PR records, see `bulk.inference.read_records`. Random articles of up
+                to `max_enc_steps` words are used if it is None.
+            n: the number of PRs.
+            seed: the seed of the random weights and articles.
+        """
+        torch.manual_seed(seed)
+        self.params = Params()
+        self.beam_search = BeamSearch(self.params, model_path, ngram_filter=1)
+        self.vocab = self.beam_search.vocab
+        if input_path is None:
+            self.examples = self.random_examples(n, seed)
+        else:
+            self.examples = self.read_examples(input_path, n)
+
+    def random_examples(self, n, seed):
+        rnd = random.Random(seed)
+        words = [self.vocab.id2word(i) for i in range(4, self.vocab.size())]
+        return [Example(self.params, i, ' '.join(rnd.choices(words, k=rnd.randint(1, self.params.max_enc_steps))),
+                        '', self.vocab) for i in range(n)]
+
+    def read_examples(self, input_path, n):
+        examples = []
+        for record in islice(read_records(input_path), n):
+            pr = PullRequest(record.get('url') or '')
+            pr.set_data({'title': record.get('title') or '', 'desc': record.get('desc') or '',
+                         'commits': record.get('commits') or []})
+            examples.append(EntrySummarizer.encode(pr, self.params, self.vocab))
+        return examples
+
+    @torch.no_grad()
+    def encoder(self, repeat=3):
+        """
+        Measure the encoder time per PR when each article is encoded `beam_size` times, as the decoder used to do,
+        and when it is encoded once.
+
+        Returns:
+            The best milliseconds per PR of `repeat` runs for each way.
+        """
+        ret = {}
+        for copies in (self.params.beam_size, 1):
+            inputs = [get_input_from_batch(self.params, Batch(self.params, [ex] * copies, self.vocab, copies),
+                                           self.params.eval_device) for ex in self.examples]
+            best = float('inf')
+            for _ in range(repeat):
+                beg = time.time()
+                for enc_batch, _, enc_lens, *_ in inputs:
+                    self.beam_search.model.encoder(enc_batch, enc_lens)
+                best = min(best, time.time() - beg)
+            ret[f'encoder_ms_per_pr_{copies}_copies'] = round(best * 1000 / len(self.examples), 3)
+        return ret
+
+    def decode(self, batch_size=16):
+        """
+        Measure the decoding time per PR of the reference `Beam` search, one PR at a time, and of the tensorized
+        beam search, `batch_size` PRs at a time.
+
+        Returns:
+            The milliseconds per PR of each engine, and whether their summaries are the same.
+        """
+        beg = time.time()
+        expected = []
+        for ex in self.examples:
+            best_summary = self.beam_search.beam_search(Batch(self.params, [ex], self.vocab, 1))
+            expected.append(self.beam_search.to_text(best_summary.tokens[1:], ex.article_oovs))
+        reference_time = time.time() - beg
+
+        self.params.decode_batch_size = batch_size
+        beg = time.time()
+        actual = self.beam_search.decode_examples(self.examples)
+        tensor_time = time.time() - beg
+        return {'reference_ms_per_pr': round(reference_time * 1000 / len(self.examples), 3),
+                f'tensor_ms_per_pr_batch_{batch_size}': round(tensor_time * 1000 / len(self.examples), 3),
+                'same_summaries': actual == expected}
+
+    @torch.no_grad()
+    def step_inputs(self, batch_size):
+        """The inputs of a decoder step for the longest `batch_size` PRs of `beam_size` hypotheses each."""
+        examples = sorted(self.examples, key=lambda ex: ex.enc_len, reverse=True)[:batch_size]
+        batch = Batch(self.params, examples, self.vocab, len(examples))
+        enc_batch, enc_padding_mask, enc_lens, enc_batch_extended, extend_vocab_zeros, c_t_0, coverage_t_0 = \
+            get_input_from_batch(self.params, batch, self.params.eval_device)
+        enc_outputs, enc_features, s_0 = self.beam_search.model.encoder(enc_batch, enc_lens)
+
+        rows = torch.arange(len(examples)).repeat_interleave(self.params.beam_size)
+        y_t_1 = torch.randint(0, self.vocab.size(), (len(rows),))
+        return (y_t_1, (s_0[0][:, rows], s_0[1][:, rows]), c_t_0[rows].unsqueeze(1), enc_outputs[rows],
+                enc_features[rows], enc_padding_mask[rows],
+                None if extend_vocab_zeros is None else extend_vocab_zeros[rows],
+                None if enc_batch_extended is None else enc_batch_extended[rows],
+                None if coverage_t_0 is None else coverage_t_0[rows])
+
+    @torch.no_grad()
+    def step(self, batch_size=16, repeat=20):
+        """
+        Measure the latency of a decoder step, `AttentionDecoder.forward` followed by `torch.log` versus
+        `AttentionDecoder.step`, for `batch_size` PRs of `beam_size` hypotheses each.
+
+        Returns:
+            The best milliseconds per step of each way, and the max difference of their log probabilities.
+        """
+        inputs = self.step_inputs(batch_size)
+
+        decoder = self.beam_search.model.decoder
+        ret = {}
+        outputs = []
+        for name, step in (('forward', lambda: torch.log(decoder(*inputs)[0])),
+                           ('step', lambda: decoder.step(*inputs)[0])):
+            best = float('inf')
+            for _ in range(repeat):
+                beg = time.time()
+                log_probs = step()
+                best = min(best, time.time() - beg)
+            ret[f'{name}_ms_per_step'] = round(best * 1000, 3)
+            outputs.append(log_probs)
+        # the -inf of the same zero probabilities give nan, which is ignored
+        ret['max_abs_diff'] = (outputs[0] - outputs[1]).nan_to_num(posinf=0, neginf=0).abs().max().item()
+        return ret
+
+    def runtime(self, batch_size=16, num_threads=None, num_interop_threads=None, inference=True):
+        """
+        Measure the decoding latency per PR and the peak memory of the process, with or without the inference
+        runtime. The peak memory is the one of the whole process, so run one configuration per process, e.g.,
+        `runtime --inference=False` and `runtime --num_threads=2`.
+
+        Returns:
+            The milliseconds per PR, the peak RSS in MB, and the number of threads of torch.
+        """
+        self.params.decode_batch_size = batch_size
+        if inference:
+            runtime = InferenceRuntime(num_threads, num_interop_threads)
+            with runtime.run(len(self.examples)):
+                self.beam_search.decode_examples(self.examples)
+            latency = runtime.latency
+        else:
+            beg = time.time()
+            self.beam_search.decode_examples(self.examples)
+            latency = (time.time() - beg) / len(self.examples)
+        return {'ms_per_pr': round(latency * 1000, 3), 'peak_rss_mb': round(peak_rss_mb(), 1),
+                'num_threads': torch.get_num_threads()}
+
+    @torch.no_grad()
+    def backends(self, batch_size=16, repeat=20, backends=('eager', 'torchscript', 'onnx')):
+        """
+        Measure the latency of a decoder step for `batch_size` PRs of `beam_size` hypotheses each, and the decoding
+        time per PR, with each backend of `backend.py`. The onnx backend needs onnxruntime.
+
+        Returns:
+            The best milliseconds per step of `repeat` runs and the milliseconds per PR of each backend, and whether
+            its summaries are the same as the ones of the first backend.
+        """
+        self.params.decode_batch_size = batch_size
+        inputs = self.step_inputs(batch_size)
+        ret = {}
+        expected = None
+        for name in backends:
+            self.params.backend = name
+            self.beam_search.backend = create_backend(self.params, self.beam_search.model)
+            best = float('inf')
+            for _ in range(repeat):
+                beg = time.time()
+                self.beam_search.backend.step(*inputs)
+                best = min(best, time.time() - beg)
+            ret[f'{name}_ms_per_step'] = round(best * 1000, 3)
+
+            beg = time.time()
+            summaries = self.beam_search.decode_examples(self.examples)
+            ret[f'{name}_ms_per_pr'] = round((time.time() - beg) * 1000 / len(self.examples), 3)
+            if expected is None:
+                expected = summaries
+            ret[f'{name}_same_summaries'] = summaries == expected
+        return ret
+
+    def schedule(self, batch_size=16):
+        """
+        Measure the encoder padding and the decoding time per PR when the PRs are decoded in groups of `batch_size` in
+        their order, and in groups of similar lengths, see `bucket_by_length`.
+
+        Returns:
+            The fraction of the encoder positions which are padding and the milliseconds per PR of each way, and
+            whether their summaries are the same.
+        """
+        ret = {}
+        summaries = {}
+        # the examples of a group are sorted by length for the encoder anyway
+        in_order = [sorted(range(i, min(i + batch_size, len(self.examples))), key=lambda j: self.examples[j].enc_len,
+                           reverse=True) for i in range(0, len(self.examples), batch_size)]
+        for way, groups in (('input_order', in_order), ('bucketed', bucket_by_length(self.examples, batch_size))):
+            padding = 0
+            outputs = [None] * len(self.examples)
+            beg = time.time()
+            for group in groups:
+                lens = [self.examples[i].enc_len for i in group]
+                padding += max(lens) * len(lens) - sum(lens)
+                batch = Batch(self.params, [self.examples[i] for i in group], self.vocab, len(group))
+                for i, output_ids in zip(group, self.beam_search.tensor_beam_search(batch)):
+                    outputs[i] = output_ids
+            ret[f'{way}_ms_per_pr'] = round((time.time() - beg) * 1000 / len(self.examples), 3)
+            ret[f'{way}_padding'] = round(padding / (padding + sum(ex.enc_len for ex in self.examples)), 3)
+            summaries[way] = outputs
+        ret['same_summaries'] = summaries['input_order'] == summaries['bucketed']
+        return ret
+
+    def workers(self, batch_size=16, num_workers=(1, 2, 4)):
+        """
+        Measure the decoding time per PR with each number of forked workers, see `pool.py`. The speedup is bounded by
+        the number of cores.
+
+        Returns:
+            The milliseconds per PR of each number of workers, and whether their summaries are the same.
+        """
+        self.params.decode_batch_size = batch_size
+        ret = {'num_cores': os.cpu_count()}
+        expected = None
+        for n in num_workers:
+            self.params.num_workers = n
+            beg = time.time()
+            summaries = self.beam_search.decode_examples(self.examples)
+            ret[f'{n}_workers_ms_per_pr'] = round((time.time() - beg) * 1000 / len(self.examples), 3)
+            if expected is None:
+                expected = summaries
+            ret[f'{n}_workers_same_summaries'] = summaries == expected
+        return ret
+
+    def early_stop(self, batch_size=16, modes=('none', 'exact', 'length')):
+        """
+        Measure the decoder steps and the decoding time per PR with each way of `params.early_stop`, see
+        `BeamSearch.score_bound`. The steps of a PR are the decoder steps in which it is running.
+
+        Returns:
+            The average steps per PR, the steps saved per PR and the milliseconds per PR of each way, and whether its
+            summaries are the same as the ones of the first way.
+        """
+        self.params.decode_batch_size = batch_size
+        rows = []
+        step = self.beam_search.backend.step
+        self.beam_search.backend.step = lambda y_t_1, *inputs: rows.append(len(y_t_1)) or step(y_t_1, *inputs)
+        ret = {}
+        expected = None
+        try:
+            for mode in modes:
+                self.params.early_stop = mode
+                rows.clear()
+                beg = time.time()
+                summaries = self.beam_search.decode_examples(self.examples)
+                ret[f'{mode}_ms_per_pr'] = round((time.time() - beg) * 1000 / len(self.examples), 3)
+                steps = sum(rows) / self.params.beam_size / len(self.examples)
+                ret[f'{mode}_steps_per_pr'] = round(steps, 2)
+                if expected is None:
+                    expected, expected_steps = summaries, steps
+                ret[f'{mode}_steps_saved_per_pr'] = round(expected_steps - steps, 2)
+                ret[f'{mode}_same_summaries'] = summaries == expected
+        finally:
+            self.beam_search.backend.step = step
+        return ret
+
+    def seconds_per_step(self, batch_size=16):
+        """
+        Measure the seconds of decoding a PR per predicted decoder step, which is the `seconds_per_step` of
+        `FallbackSummarizer`: the decoding time over the steps predicted by `predicted_steps`. The PRs stop earlier
+        than predicted, e.g., at a stop token, so it is more than the time of a decoder step.
+
+        Returns:
+            The milliseconds per PR, the predicted and the actual decoder steps per PR, and the seconds per
+            predicted step.
+        """
+        self.params.decode_batch_size = batch_size
+        rows = []
+        step = self.beam_search.backend.step
+        self.beam_search.backend.step = lambda y_t_1, *inputs, **options: \
+            rows.append(len(y_t_1)) or step(y_t_1, *inputs, **options)
+        try:
+            beg = time.time()
+            self.beam_search.decode_examples(self.examples)
+            seconds = time.time() - beg
+        finally:
+            self.beam_search.backend.step = step
+        predicted = sum(predicted_steps(self.params, ex.enc_len) for ex in self.examples)
+        return {'ms_per_pr': round(seconds * 1000 / len(self.examples), 3),
+                'predicted_steps_per_pr': round(predicted / len(self.examples), 2),
+                'steps_per_pr': round(sum(rows) / self.params.beam_size / len(self.examples), 2),
+                'seconds_per_step': round(seconds / predicted, 5)}
+
+    def vocab_load(self, repeat=5, base=None):
+        """
+        Measure the time to import and load `Vocab` and the memory it takes in fresh processes, with the
+        memory-mapped vocab file and with the module of the dict literals which the vocab used to be, taken from
+        git. The module is imported both when it is compiled and when its bytecode is cached.
+
+        Args:
+            repeat: the number of runs of each way.
+            base: the git revision of the module, the last one which has it if it is None.
+
+        Returns:
+            The best milliseconds of `repeat` runs and the least increase of the RSS in MB of each way.
+        """
+        if base is None:
+            deleted = subprocess.run(['git', 'rev-list', '-n', '1', 'HEAD', '--', VOCAB_MODULE],
+                                     stdout=subprocess.PIPE, check=True, text=True, cwd=ROOT).stdout.strip()
+            base = f'{deleted}^'
+        module_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(module_dir, 'vocab.py'), 'wb') as f:
+                f.write(subprocess.run(['git', 'show', f'{base}:{VOCAB_MODULE}'], stdout=subprocess.PIPE,
+                                       check=True, cwd=ROOT).stdout)
+            ret = vocab_runs('mmap', ['-c', VOCAB_SCRIPT, 'mmap'], repeat)
+            # -B keeps the bytecode from being written, so the module is compiled by every import
+            ret.update(vocab_runs('module_compiled', ['-B', '-c', VOCAB_SCRIPT, 'module', module_dir], repeat))
+            # the first import writes the bytecode, which the others load
+            env = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+            subprocess.run([sys.executable, '-c', VOCAB_SCRIPT, 'module', module_dir], stdout=subprocess.PIPE,
+                           check=True, env=env)
+            ret.update(vocab_runs('module_cached', ['-c', VOCAB_SCRIPT, 'module', module_dir], repeat, env))
+        finally:
+            shutil.rmtree(module_dir)
+        return ret
+
+
+if __name__ == '__main__':
+    fire.Fire(Benchmark)
@@ -0,0 +1,137 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A persistent cache of summaries in a SQLite file, which evicts the least recently used ones beyond its size."""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+# the hyper-parameters which change the summaries, they are a part of the cache keys, see `cache_prefix`
+CACHE_PARAMS = ['max_enc_steps', 'max_dec_steps', 'dec_steps_ratio', 'min_dec_steps', 'beam_size', 'early_stop',
+                'pointer_gen', 'is_coverage', 'quantize', 'shortlist_size', 'backend']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    -- a counter of the uses instead of the time, which may not increase between two uses
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used);
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """The SHA-256 of the file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_prefix(model_digest, params, ngram_filter, near_duplicate_threshold):
+    """The part of the cache keys shared by the PRs: the digest of the model and the hyper-parameters of decoding."""
+    settings = {k: params.dict[k] for k in CACHE_PARAMS}
+    settings['ngram_filter'] = bool(ngram_filter)
+    settings['near_duplicate_threshold'] = near_duplicate_threshold
+    return json.dumps([model_digest, settings], sort_keys=True)
+
+
+def cache_key(prefix, article):
+    """The key of the summary of the article, see `cache_prefix`."""
+    return hashlib.sha256(f'{prefix}\n{article}'.encode('utf-8')).hexdigest()
+
+
+class SummaryCache(object):
+    def __init__(self, path, max_size_mb=64.0):
+        """
+        Args:
+            path: the path of the SQLite file, its directory is created if it does not exist.
+            max_size_mb: the max total size of the keys and summaries in MB, the least recently used ones are evicted
+                beyond it.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_size = int(float(max_size_mb) * 1024 * 1024)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def get_many(self, keys):
+        """The summaries of the keys, None for the missing ones. The found ones become the most recently used."""
+        found = {}
+        with self._conn:
+            # the number of the parameters of a query is limited
+            for i in range(0, len(keys), 500):
+                chunk = list(set(keys[i:i + 500]))
+                rows = self._conn.execute(f'SELECT key, summary FROM summaries WHERE key IN '
+                                          f'({",".join("?" * len(chunk))})', chunk)
+                found.update(rows)
+            now = self.now()
+            self._conn.executemany('UPDATE summaries SET last_used = ? WHERE key = ?', [(now, k) for k in found])
+        return [found.get(k) for k in keys]
+
+    def put_many(self, keys, summaries):
+        """Store the summaries of the keys, then evict the least recently used ones beyond the max size."""
+        with self._conn:
+            now = self.now()
+            rows = [(k, s, len(k) + len(s.encode('utf-8')), now) for k, s in zip(keys, summaries)]
+            self._conn.executemany('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)', rows)
+            self.evict()
+
+    def now(self):
+        return self._conn.execute('SELECT COALESCE(MAX(last_used), 0) + 1 FROM summaries').fetchone()[0]
+
+    def evict(self):
+        (total,) = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM summaries').fetchone()
+        if total <= self.max_size:
+            return
+        evicted = []
+        for key, size in self._conn.execute('SELECT key, size FROM summaries ORDER BY last_used'):
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM summaries WHERE key = ?', evicted)
+
+    def size(self):
+        """The number of the summaries and their total size in bytes."""
+        return self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries').fetchone()
+
+    def model_digest(self, path):
+        """The SHA-256 of the model file, which is only computed again if the size or mtime of the file changes."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._conn.execute('SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                 (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+        digest = file_digest(path)
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)',
+                               (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
@@ -0,0 +1,225 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The weights file of the pointer-generator network for inference, which holds the weights of the encoder and the
+decoder only, without the optimizer state or anything else of a training checkpoint. It uses the layout of
+safetensors: the length of the JSON header as uint64, the header, and the tensor data, so that the tensors are
+memory-mapped instead of being unpickled. Convert a checkpoint by, e.g.,
+`python -m summarizer.pg_network.checkpoint models/pg_network models/pg_network.weights`.
+
+A tensor which is the same as another one, i.e., the embedding shared by the encoder and the decoder, is stored once,
+and its name is mapped to the stored one in the metadata of the header.
+"""
+
+import inspect
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+
+import fire
+import torch
+from loguru import logger
+
+STATE_DICTS = {'encoder': 'encoder_state_dict', 'decoder': 'decoder_state_dict'}
+DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+DTYPE_NAMES = {v: k for k, v in DTYPES.items()}
+# the tensor data starts at a multiple of the alignment
+ALIGNMENT = 8
+
+
+def save_weights(state, path):
+    """Write the encoder and decoder state dicts of a checkpoint to a weights file."""
+    header = {}
+    metadata = {'format': 'pt'}
+    stored = {}
+    tensors = []
+    offset = 0
+    for prefix, key in STATE_DICTS.items():
+        for name, tensor in state[key].items():
+            name = f'{prefix}.{name}'
+            tensor = tensor.detach().cpu()
+            same = (tensor.data_ptr(), tensor.dtype, tuple(tensor.size()), tuple(tensor.stride()))
+            if same in stored:
+                metadata[name] = stored[same]
+                continue
+            stored[same] = name
+            # numpy has no bfloat16, its bytes are the same as the ones of int16
+            data = tensor.contiguous().view(torch.int16 if tensor.dtype == torch.bfloat16 else tensor.dtype)
+            data = data.numpy().tobytes()
+            header[name] = {'dtype': DTYPE_NAMES[tensor.dtype], 'shape': list(tensor.size()),
+                            'data_offsets': [offset, offset + len(data)]}
+            tensors.append(data)
+            # keep every tensor aligned
+            padding = -len(data) % ALIGNMENT
+            tensors.append(b'\0' * padding)
+            offset += len(data) + padding
+    header['__metadata__'] = metadata
+
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-len(encoded) % ALIGNMENT)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        for data in tensors:
+            f.write(data)
+
+
+def is_weights_file(path):
+    with open(path, 'rb') as f:
+        head = f.read(9)
+    return len(head) == 9 and head[8:] == b'{' and struct.unpack('<Q', head[:8])[0] < os.path.getsize(path)
+
+
+def read_header(buf, path):
+    try:
+        (header_len,) = struct.unpack_from('<Q', buf)
+        if 8 + header_len > len(buf):
+            raise ValueError(f'the header of {header_len} bytes exceeds the file')
+        header = json.loads(bytes(buf[8:8 + header_len]).decode('utf-8'))
+    except (ValueError, struct.error) as e:
+        raise ValueError(f'The weights file {path} is corrupt: {e}') from e
+    return header, 8 + header_len
+
+
+def load_weights(path):
+    """
+    Read a weights file into the encoder and decoder state dicts of a checkpoint. The tensors are views of a private
+    memory map of the file, the pages are read on demand and shared with the page cache until they are written.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header, data_start = read_header(buf, path)
+    metadata = header.pop('__metadata__', {})
+
+    tensors = {}
+    for name, info in header.items():
+        begin, end = info['data_offsets']
+        dtype = DTYPES[info['dtype']]
+        count = 1
+        for size in info['shape']:
+            count *= size
+        if data_start + end > len(buf) or end - begin != count * torch.empty((), dtype=dtype).element_size():
+            raise ValueError(f'The weights file {path} is corrupt: the data of {name} is truncated or mismatched')
+        if count == 0:
+            tensors[name] = torch.empty(info['shape'], dtype=dtype)
+        else:
+            tensors[name] = torch.frombuffer(buf, dtype=dtype, count=count, offset=data_start + begin) \
+                .view(info['shape'])
+    for name, stored in metadata.items():
+        # the other metadata, e.g., format, are not names of tensors
+        if '.' in name:
+            if stored not in tensors:
+                raise ValueError(f'The weights file {path} is corrupt: {name} is the same as the missing {stored}')
+            tensors[name] = tensors[stored]
+
+    state = {key: {} for key in STATE_DICTS.values()}
+    for name, tensor in tensors.items():
+        prefix, name = name.split('.', 1)
+        if prefix not in STATE_DICTS:
+            raise ValueError(f'The weights file {path} has a tensor of an unknown module: {prefix}.{name}')
+        state[STATE_DICTS[prefix]][name] = tensor
+    return state
+
+
+def load_checkpoint(path, trusted=False):
+    """
+    Load a training checkpoint saved by `torch.save`, only the tensors are unpickled if torch supports it. A
+    checkpoint which has other objects, e.g., the arguments of the training, is unpickled entirely only if it is
+    trusted, since unpickling may run arbitrary code.
+    """
+    kwargs = {'map_location': 'cpu'}
+    if 'weights_only' not in inspect.signature(torch.load).parameters:
+        return torch.load(path, **kwargs)
+    try:
+        return torch.load(path, weights_only=True, **kwargs)
+    except pickle.UnpicklingError as e:
+        if not trusted:
+            raise pickle.UnpicklingError(
+                f'the checkpoint has objects other than tensors, convert it to a weights file by `python -m '
+                f'summarizer.pg_network.checkpoint {path} <output_path> --trusted` or set trust_checkpoint if its '
+                f'source is trusted') from e
+        logger.warning(f'The checkpoint {path} has objects other than tensors, it is unpickled entirely since it is '
+                       f'trusted')
+        return torch.load(path, weights_only=False, **kwargs)
+
+
+def assign_state(module, state_dict, strict=True):
+    """
+    The same as `module.load_state_dict`, but the tensors of the state dict replace the data of the parameters and
+    buffers instead of being copied into them, so that memory-mapped weights stay memory-mapped. The parameters
+    themselves are kept, so that the tied ones stay tied.
+    """
+    own = dict(module.named_parameters())
+    own.update(module.named_buffers())
+    missing = [name for name in own if name not in state_dict]
+    unexpected = [name for name in state_dict if name not in own]
+    if strict and (missing or unexpected):
+        raise RuntimeError(f'Error(s) in loading state_dict for {module.__class__.__name__}: '
+                           f'missing keys {missing}, unexpected keys {unexpected}')
+    for name, tensor in state_dict.items():
+        if name not in own:
+            continue
+        target = own[name]
+        if target.size() != tensor.size():
+            raise RuntimeError(f'size mismatch for {name}: copying a param with shape {tuple(tensor.size())}, the '
+                               f'shape in current model is {tuple(target.size())}')
+        target.data = tensor.to(device=target.device, dtype=target.dtype)
+
+
+def load_state(model_file_path, trusted=False):
+    """
+    Load the encoder and decoder state dicts from a weights file or a training checkpoint. It fails immediately with
+    the reason if the file is missing or corrupt. See `load_checkpoint` for `trusted`.
+    """
+    if not os.path.isfile(model_file_path):
+        raise FileNotFoundError(f'The model file {model_file_path} does not exist')
+    beg = time.time()
+    try:
+        if is_weights_file(model_file_path):
+            state = load_weights(model_file_path)
+        else:
+            state = load_checkpoint(model_file_path, trusted)
+    except Exception as e:
+        raise RuntimeError(f'Failed to load the model file {model_file_path}: {e}') from e
+    missing = [key for key in STATE_DICTS.values() if key not in state]
+    if missing:
+        raise RuntimeError(f'The model file {model_file_path} has no {", ".join(missing)}')
+    logger.debug(f'Loading the model file {model_file_path} took {time.time() - beg:.2f} seconds')
+    return state
+
+
+def convert(checkpoint_path, output_path, trusted=False):
+    """Convert a training checkpoint to a weights file, see `load_checkpoint` for `trusted`."""
+    save_weights(load_checkpoint(checkpoint_path, trusted), output_path)
+    return f'{checkpoint_path} ({os.path.getsize(checkpoint_path)} bytes) is converted to {output_path} ' \
+           f'({os.path.getsize(output_path)} bytes)'
+
+
+if __name__ == '__main__':
+    fire.Fire(convert)
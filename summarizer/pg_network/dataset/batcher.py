@@ -24,6 +24,7 @@ import numpy as np
 from loguru import logger
 
 from summarizer.pg_network.dataset import data
+from summarizer.pg_network.dataset.scheduler import bucket_by_length
 
 random.seed(1234)
 np.random.seed(318)
@@ -71,6 +72,31 @@ class Example(object):
         self.original_article = article
         self.original_abstract = abstract
 
+    @classmethod
+    def from_ids(cls, params, id, enc_input, enc_input_extend_vocab, article_oovs, vocab):
+        """
+        Create an example to decode from the ids of an article, e.g., the output of `data.article2arrays`.
+
+        The article must be truncated to `params.max_enc_steps` words before it is mapped to ids, so that
+        `article_oovs` only holds the OOVs the encoder will see.
+        """
+        example = cls.__new__(cls)
+        example.enc_len = len(enc_input)
+        example.enc_input = enc_input
+        example.dec_input, example.target = example.get_dec_inp_targ_seqs([], params.max_dec_steps,
+                                                                          vocab.word2id(data.START_DECODING),
+                                                                          vocab.word2id(data.STOP_DECODING))
+        example.dec_len = len(example.dec_input)
+        if params.pointer_gen:
+            example.enc_input_extend_vocab = enc_input_extend_vocab
+            example.article_oovs = article_oovs
+
+        example.params = params
+        example.id = id
+        example.original_article = None
+        example.original_abstract = ''
+        return example
+
     def get_dec_inp_targ_seqs(self, sequence, max_len, start_id, stop_id):
         #    if truncate, there will be no end
         inp = [start_id] + sequence[:]
@@ -83,15 +109,6 @@ class Example(object):
         assert len(inp) == len(target)
         return inp, target
 
-    def pad_decoder_inp_targ(self, max_len, pad_id):
-        self.dec_input.extend([pad_id] * (max_len - len(self.dec_input)))
-        self.target.extend([pad_id] * (max_len - len(self.target)))
-
-    def pad_encoder_input(self, max_len, pad_id):
-        self.enc_input.extend([pad_id] * (max_len - len(self.enc_input)))
-        if self.params.pointer_gen:
-            self.enc_input_extend_vocab.extend([pad_id] * (max_len - len(self.enc_input_extend_vocab)))
-
 
 class Batch(object):
     def __init__(self, params, example_list, vocab, batch_size):
@@ -106,19 +123,16 @@ class Batch(object):
         # Determine the maximum length of the encoder input sequence in this batch
         max_enc_seq_len = max([ex.enc_len for ex in example_list])
 
-        # Pad the encoder input sequences up to the length of the longest sequence
-        for ex in example_list:
-            ex.pad_encoder_input(max_enc_seq_len, self.pad_id)
-
         # Initialize the numpy arrays
         # Note: our enc_batch can have different length (second dimension) for each batch because we use dynamic_rnn for the encoder.
         self.enc_batch = np.zeros((self.batch_size, max_enc_seq_len), dtype=np.int32)
         # self.enc_padding_mask = np.zeros((self.batch_size, max_enc_seq_len), dtype=np.float32)
         self.enc_lens = np.zeros((self.batch_size), dtype=np.int32)
 
-        # Fill in the numpy arrays
+        # Fill in the numpy arrays, and pad the encoder input sequences up to the length of the longest sequence
         for i, ex in enumerate(example_list):
-            self.enc_batch[i, :] = ex.enc_input[:]
+            self.enc_batch[i, :ex.enc_len] = ex.enc_input
+            self.enc_batch[i, ex.enc_len:] = self.pad_id
             self.enc_lens[i] = ex.enc_len
         self.enc_padding_mask = (self.enc_batch != self.pad_id).astype(np.float32)
 
@@ -131,23 +145,22 @@ class Batch(object):
             # Store the version of the enc_batch that uses the article OOV ids
             self.enc_batch_extend_vocab = np.zeros((self.batch_size, max_enc_seq_len), dtype=np.int32)
             for i, ex in enumerate(example_list):
-                self.enc_batch_extend_vocab[i, :] = ex.enc_input_extend_vocab[:]
+                self.enc_batch_extend_vocab[i, :ex.enc_len] = ex.enc_input_extend_vocab
+                self.enc_batch_extend_vocab[i, ex.enc_len:] = self.pad_id
 
     def init_decoder_seq(self, example_list):
-        # Pad the inputs and targets
-        for ex in example_list:
-            ex.pad_decoder_inp_targ(self.params.max_dec_steps, self.pad_id)
-
         # Initialize the numpy arrays.
         self.dec_batch = np.zeros((self.batch_size, self.params.max_dec_steps), dtype=np.int32)
         self.target_batch = np.zeros((self.batch_size, self.params.max_dec_steps), dtype=np.int32)
         # self.dec_padding_mask = np.zeros((self.batch_size, self.params.max_dec_steps), dtype=np.float32)
         self.dec_lens = np.zeros((self.batch_size), dtype=np.int32)
 
-        # Fill in the numpy arrays
+        # Fill in the numpy arrays, and pad the inputs and targets
         for i, ex in enumerate(example_list):
-            self.dec_batch[i, :] = ex.dec_input[:]
-            self.target_batch[i, :] = ex.target[:]
+            self.dec_batch[i, :ex.dec_len] = ex.dec_input
+            self.dec_batch[i, ex.dec_len:] = self.pad_id
+            self.target_batch[i, :ex.dec_len] = ex.target
+            self.target_batch[i, ex.dec_len:] = self.pad_id
             self.dec_lens[i] = ex.dec_len
             # for j in range(ex.dec_len):
             #     self.dec_padding_mask[i][j] = 1
@@ -177,12 +190,11 @@ class Batcher(object):
         if single_pass:
             self._num_example_q_threads = 1  # just one thread, so we read through the dataset just once
             self._num_batch_q_threads = 1  # just one thread to batch examples
-            self._bucketing_cache_size = 1  # only load one batch's worth of examples before bucketing; this essentially means no bucketing
-            self._finished_reading = False  # this will tell us when we're finished reading the dataset
         else:
             self._num_example_q_threads = 1  # 16 # num threads to fill example queue
             self._num_batch_q_threads = 1  # 4  # num threads to fill batch queue
-            self._bucketing_cache_size = 1  # 100 # how many batches-worth of examples to load into cache before bucketing
+        # how many batches-worth of examples to load into cache before bucketing, 1 means no bucketing
+        self._bucketing_cache_size = params.bucketing_cache_size
 
         # Start the threads that load the queues
         self._example_q_threads = []
@@ -208,11 +220,12 @@ class Batcher(object):
             logger.trace(
                 'Bucket input queue is empty when calling next_batch. Bucket queue size: %i, Input queue size: %i',
                 self._batch_queue.qsize(), self._example_queue.qsize())
-            if self._single_pass and self._finished_reading:
-                logger.trace("Finished reading dataset in single_pass mode.")
-                return None
 
         batch = self._batch_queue.get()  # get the next Batch
+        if batch is None:
+            # None is the sentinel put by the batch queue thread in single_pass mode, put it back for the next call
+            logger.trace("Finished reading dataset in single_pass mode.")
+            self._batch_queue.put(None)
         return batch
 
     def fill_example_queue(self):
@@ -228,7 +241,7 @@ class Batcher(object):
                 if self._single_pass:
                     logger.trace(
                         "single_pass mode is on, so we've finished reading dataset. This thread is stopping.")
-                    self._finished_reading = True
+                    self._example_queue.put(None)  # the sentinel that tells the batch queue thread to stop
                     break
                 else:
                     raise Exception("single_pass mode is off but the example generator is out of data; error.")
@@ -237,12 +250,14 @@ class Batcher(object):
             self._example_queue.put(example)  # place the Example in the example queue.
 
     def fill_batch_queue(self):
-        while True:
+        finished = False
+        while not finished:
             if self.mode == 'decode':
-                # beam search decode mode single example repeated in the batch
+                # beam search decode mode, one copy of each example, the beam search expands it across the hypotheses
                 ex = self._example_queue.get()
-                b = [ex for _ in range(self.batch_size)]
-                self._batch_queue.put(Batch(self.params, b, self._vocab, self.batch_size))
+                if ex is None:
+                    break
+                self._batch_queue.put(Batch(self.params, [ex], self._vocab, 1))
             else:
                 # 1. add batch_size * _bucketing_cache_size examples
                 # 2. sorted them in descending order
@@ -253,17 +268,23 @@ class Batcher(object):
                 inputs = []
                 # bucket
                 for _ in range(self.batch_size * self._bucketing_cache_size):
-                    inputs.append(self._example_queue.get())
-                inputs = sorted(inputs, key=lambda inp: inp.enc_len, reverse=True)  # sort by length of encoder sequence
-
-                # Group the sorted Examples into batches, optionally shuffle the batches, and place in the batch queue.
-                batches = []
-                for i in range(0, len(inputs), self.batch_size):
-                    batches.append(inputs[i:i + self.batch_size])
+                    ex = self._example_queue.get()
+                    if ex is None:
+                        # only full batches are trained, the rest of the examples are dropped
+                        finished = True
+                        break
+                    inputs.append(ex)
+                if finished:
+                    inputs = inputs[:len(inputs) // self.batch_size * self.batch_size]
+
+                # Group the Examples sorted by length into batches, optionally shuffle the batches, and place in the
+                # batch queue.
+                batches = [[inputs[i] for i in b] for b in bucket_by_length(inputs, self.batch_size)]
                 if not self._single_pass:
                     shuffle(batches)
                 for b in batches:  # each b is a list of Example objects
                     self._batch_queue.put(Batch(self.params, b, self._vocab, self.batch_size))
+        self._batch_queue.put(None)  # the sentinel that tells `next_batch` there are no more batches
 
     def watch_threads(self):
         while True:
@@ -288,8 +309,7 @@ class Batcher(object):
                     new_t.start()
 
     def text_generator(self, example_generator):
-        while True:
-            e = next(example_generator)  # e is a tf.Example
+        for e in example_generator:  # e is a row of the CSV file
             try:
                 example_id = e['id']
                 article_text = e['article']
@@ -17,10 +17,12 @@
 import sys
 import csv
 
+import numpy as np
+
 # <s> and </s> are used in the data files to segment the abstracts into sentences. They don't receive vocab ids.
 from loguru import logger
 
-from summarizer.pg_network.vocab import WORD_TO_ID, ID_TO_WORD
+from summarizer.pg_network.dataset.vocab_file import VOCAB_PATH, VocabFile
 
 SENTENCE_START = '<s>'
 SENTENCE_END = '</s>'
@@ -29,25 +31,29 @@ PAD_TOKEN = '[PAD]'  # This has a vocab id, which is used to pad the encoder inp
 UNKNOWN_TOKEN = '[UNK]'  # This has a vocab id, which is used to represent out-of-vocabulary words
 START_DECODING = '[START]'  # This has a vocab id, which is used at the start of every decoder input sequence
 STOP_DECODING = '[STOP]'  # This has a vocab id, which is used at the end of untruncated target sequences
+SEP_TOKEN = '[sep]'  # This separates the title, the description and the commit messages of the article of a PR
 
 csv.field_size_limit(sys.maxsize)
 
 
 class Vocab(object):
-    def __init__(self):
-        self._word_to_id = WORD_TO_ID
-        self._id_to_word = ID_TO_WORD
-        self._count = len(self._word_to_id)
+    def __init__(self, vocab_path=VOCAB_PATH):
+        # memory-mapped, see `vocab_file.py`
+        self._vocab = VocabFile(vocab_path)
+        self._count = len(self._vocab)
+        self._unk_id = self._vocab.id(UNKNOWN_TOKEN)
 
     def word2id(self, word):
-        if word not in self._word_to_id:
-            return self._word_to_id[UNKNOWN_TOKEN]
-        return self._word_to_id[word]
+        word_id = self._vocab.id(word)
+        if word_id is None:
+            return self._unk_id
+        return word_id
 
     def id2word(self, word_id):
-        if word_id not in self._id_to_word:
+        word = self._vocab.word(word_id)
+        if word is None:
             raise ValueError('Id not found in vocab: %d' % word_id)
-        return self._id_to_word[word_id]
+        return word
 
     def size(self):
         return self._count
@@ -58,7 +64,7 @@ class Vocab(object):
             fieldnames = ['word']
             writer = csv.DictWriter(f, delimiter="\t", fieldnames=fieldnames)
             for i in range(self.size()):
-                writer.writerow({"word": self._id_to_word[i]})
+                writer.writerow({"word": self.id2word(i)})
 
 
 def example_generator(data_path, single_pass):
@@ -73,6 +79,16 @@ def example_generator(data_path, single_pass):
             break
 
 
+def pr2words(pr):
+    """The words of the article of a PR: its title, description and commit messages separated by `SEP_TOKEN`."""
+    return pr.title + [SEP_TOKEN] + pr.description + [SEP_TOKEN] + pr.commit_messages
+
+
+def pr2article(pr):
+    """The article of a PR as a string, the words of `pr2words` joined by spaces."""
+    return f' {SEP_TOKEN} '.join([' '.join(pr.title), ' '.join(pr.description), ' '.join(pr.commit_messages)])
+
+
 def article2ids(article_words, vocab):
     ids = []
     oovs = []
@@ -89,6 +105,24 @@ def article2ids(article_words, vocab):
     return ids, oovs
 
 
+def article2arrays(article_words, vocab):
+    """
+    Same as `article2ids`, but also return the ids where OOVs are represented by the id for UNK token, both as int32
+    arrays, in a single pass over the words.
+    """
+    ids = []
+    ids_extend_vocab = []
+    oovs = {}
+    unk_id = vocab.word2id(UNKNOWN_TOKEN)
+    for w in article_words:
+        i = vocab.word2id(w)
+        ids.append(i)
+        if i == unk_id:  # If w is OOV
+            i = vocab.size() + oovs.setdefault(w, len(oovs))
+        ids_extend_vocab.append(i)
+    return np.array(ids, dtype=np.int32), np.array(ids_extend_vocab, dtype=np.int32), list(oovs)
+
+
 def abstract2ids(abstract_words, vocab, article_oovs):
     ids = []
     unk_id = vocab.word2id(UNKNOWN_TOKEN)
@@ -0,0 +1,51 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Schedule examples into batches of similar lengths, so that little of the encoder and decoder work is padding."""
+
+
+def length_key(example):
+    """
+    The encoder length of the example, then its decoder length, which is the length of the reference abstract
+    where it is available, e.g., in training, and the same for all the examples to decode.
+    """
+    return example.enc_len, example.dec_len
+
+
+def bucket_by_length(examples, batch_size, bucket_size=None):
+    """
+    Group the indices of the examples into batches of up to `batch_size` examples of similar lengths.
+
+    The examples are taken in buckets of `bucket_size` batches in their order, all of them are one bucket if
+    `bucket_size` is None. Each bucket is sorted by `length_key` in descending order, stably, and split into batches.
+
+    Returns:
+        The lists of the indices of the examples of each batch, see `restore_order`.
+    """
+    bucket = len(examples) if bucket_size is None else batch_size * bucket_size
+    batches = []
+    for beg in range(0, len(examples), max(bucket, 1)):
+        indices = sorted(range(beg, min(beg + bucket, len(examples))), key=lambda i: length_key(examples[i]),
+                         reverse=True)
+        batches += [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+    return batches
+
+
+def restore_order(batches, outputs):
+    """Put the outputs of the batches of `bucket_by_length` back in the order of the examples."""
+    ordered = [None] * sum(len(batch) for batch in batches)
+    for batch, batch_outputs in zip(batches, outputs):
+        for i, output in zip(batch, batch_outputs):
+            ordered[i] = output
+    return ordered
@@ -0,0 +1,86 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import csv
+import random
+import tempfile
+
+import numpy as np
+import pytest
+
+from summarizer.pg_network.dataset.batcher import Batch, Batcher, Example
+from summarizer.pg_network.dataset.data import Vocab, article2arrays, article2ids
+from summarizer.pg_network.params import Params
+
+params = Params()
+vocab = Vocab()
+
+ARTICLES = [
+    'fix a bug [sep] the bug is fixed . [sep] fix the bug',
+    'add foobarqux support [sep] foobarqux and quxbarfoo are [UNK] . [sep] foobarqux',
+    ' '.join(['update the foobarqux{} module .'.format(i) for i in range(100)]),
+    '',
+]
+
+
+@pytest.mark.parametrize("article", ARTICLES)
+def test_article2arrays(article):
+    words = article.split()
+    ids, ids_extend_vocab, oovs = article2arrays(words, vocab)
+    assert ids.dtype == np.int32 and ids_extend_vocab.dtype == np.int32
+    assert ids.tolist() == [vocab.word2id(w) for w in words]
+    assert (ids_extend_vocab.tolist(), oovs) == article2ids(words, vocab)
+
+
+@pytest.mark.parametrize("batch_size", [1, params.beam_size])
+def test_batch_from_ids(batch_size):
+    for article in ARTICLES[:3]:
+        words = article.split()[:params.max_enc_steps]
+        ex_str = Example(params, 1, article, '', vocab)
+        ex_ids = Example.from_ids(params, 1, *article2arrays(words, vocab), vocab)
+
+        expected = Batch(params, [ex_str] * batch_size, vocab, batch_size)
+        actual = Batch(params, [ex_ids] * batch_size, vocab, batch_size)
+        for attr in ['enc_batch', 'enc_lens', 'enc_padding_mask', 'enc_batch_extend_vocab', 'dec_batch',
+                     'target_batch', 'dec_lens', 'dec_padding_mask']:
+            assert getattr(expected, attr).dtype == getattr(actual, attr).dtype
+            assert np.array_equal(getattr(expected, attr), getattr(actual, attr))
+        assert expected.art_oovs == actual.art_oovs
+        assert expected.max_art_oovs == actual.max_art_oovs
+
+
+def drain(batcher):
+    batches = []
+    batch = batcher.next_batch()
+    while batch is not None:
+        batches.append(batch)
+        batch = batcher.next_batch()
+    # the batcher keeps returning None once it is exhausted
+    assert batcher.next_batch() is None
+    return batches
+
+
+def test_batcher_bucketing():
+    lengths = [random.Random(i).randint(1, 60) for i in range(40)]
+    with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'abstract', 'article'])
+        writer.writerows([[i, 'the summary', ' '.join(['word'] * n)] for i, n in enumerate(lengths)])
+        f.flush()
+        batches = drain(Batcher(Params(bucketing_cache_size=5), f.name, vocab, mode='train', batch_size=4,
+                                single_pass=True))
+    # the examples of every 5 batches are sorted by length together, the last 20 examples are another bucket
+    assert [int(i) for b in batches for i in b.ids] == \
+        sorted(range(20), key=lambda i: -lengths[i]) + sorted(range(20, 40), key=lambda i: -lengths[i])
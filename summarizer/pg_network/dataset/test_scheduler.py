@@ -0,0 +1,46 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from summarizer.pg_network.dataset.scheduler import bucket_by_length, restore_order
+
+
+def make_examples(n):
+    rnd = random.Random(n)
+    return [SimpleNamespace(enc_len=rnd.randint(1, 50), dec_len=rnd.randint(1, 5)) for _ in range(n)]
+
+
+@pytest.mark.parametrize("n,batch_size,bucket_size", [(0, 4, None), (1, 4, None), (37, 4, None), (37, 4, 2),
+                                                      (37, 1, 3), (37, 64, None)])
+def test_bucket_by_length(n, batch_size, bucket_size):
+    examples = make_examples(n)
+    batches = bucket_by_length(examples, batch_size, bucket_size)
+    assert sorted(i for batch in batches for i in batch) == list(range(n))
+    assert all(0 < len(batch) <= batch_size for batch in batches)
+
+    bucket = n if bucket_size is None else batch_size * bucket_size
+    flat = [i for batch in batches for i in batch]
+    for beg in range(0, n, max(bucket, 1)):
+        indices = flat[beg:beg + bucket]
+        # each bucket holds its own examples sorted by length
+        assert sorted(indices) == list(range(beg, min(beg + bucket, n)))
+        keys = [(examples[i].enc_len, examples[i].dec_len) for i in indices]
+        assert keys == sorted(keys, reverse=True)
+
+    assert restore_order(batches, [[f'out{i}' for i in batch] for batch in batches]) == \
+        [f'out{i}' for i in range(n)]
@@ -0,0 +1,56 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from summarizer.pg_network.dataset import data
+from summarizer.pg_network.dataset.data import Vocab
+from summarizer.pg_network.dataset.vocab_file import VocabFile, write_vocab
+
+WORDS = ['[UNK]', '[PAD]', '[START]', '[STOP]', '.', 'fix', 'fixes', '', 'über', '修复', '[sep]'] + \
+        ['word{}'.format(i) for i in range(1000)]
+
+
+def test_vocab_file(tmp_path):
+    path = str(tmp_path / 'vocab.bin')
+    write_vocab(WORDS, path)
+    vocab = VocabFile(path)
+    assert len(vocab) == len(WORDS)
+    for i, w in enumerate(WORDS):
+        assert vocab.id(w) == i
+        assert vocab.word(i) == w
+    assert vocab.id('word1000') is None and vocab.id('Fix') is None
+    assert vocab.word(-1) is None and vocab.word(len(WORDS)) is None
+
+
+def test_write_vocab_duplicates(tmp_path):
+    with pytest.raises(ValueError):
+        write_vocab(['a', 'b', 'a'], str(tmp_path / 'vocab.bin'))
+
+
+def test_vocab(tmp_path):
+    path = str(tmp_path / 'vocab.bin')
+    write_vocab(WORDS, path)
+    vocab = Vocab(path)
+    assert vocab.size() == len(WORDS)
+    assert vocab.word2id(data.PAD_TOKEN) == 1
+    assert vocab.word2id('fixes') == 6 and vocab.id2word(6) == 'fixes'
+    assert vocab.word2id('foobarqux') == vocab.word2id(data.UNKNOWN_TOKEN) == 0
+    with pytest.raises(ValueError):
+        vocab.id2word(len(WORDS))
+
+    # the default vocab of the summarizer
+    vocab = Vocab()
+    assert vocab.size() == 30000
+    assert all(vocab.word2id(vocab.id2word(i)) == i for i in range(vocab.size()))
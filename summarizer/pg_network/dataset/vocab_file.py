@@ -0,0 +1,111 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A compact binary vocab file which is memory-mapped, so that its pages are shared by all the processes which read it
+and nothing has to be parsed on load. The layout, in little-endian:
+
+- the magic `PGVOCAB1`, the number of words and the number of hash slots, as uint32
+- the offsets of the words in the blob, uint32 x (count + 1), the word of id i is blob[offsets[i]:offsets[i + 1]]
+- the hash table, int32 x num_slots, the id of each slot or -1, with linear probing on the CRC32 of the word
+- the blob of the UTF-8 words in the order of their ids
+
+Build it from a text file of one word per line, the line number being the id, e.g.,
+`python -m summarizer.pg_network.dataset.vocab_file words.txt summarizer/pg_network/vocab.bin`.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+import fire
+import numpy as np
+
+VOCAB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'vocab.bin')
+MAGIC = b'PGVOCAB1'
+HEADER = struct.Struct('<8sII')
+
+
+def write_vocab(words, path):
+    """Write the words to a vocab file, the id of a word is its index."""
+    encoded = [w.encode('utf-8') for w in words]
+    if len(set(encoded)) != len(encoded):
+        raise ValueError('The words of a vocab must be unique')
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(w) for w in encoded])
+
+    # a power of two of at least twice the count keeps the probes short
+    num_slots = 1 << max(1, (2 * len(encoded) - 1).bit_length())
+    slots = np.full(num_slots, -1, dtype='<i4')
+    for i, w in enumerate(encoded):
+        slot = zlib.crc32(w) & (num_slots - 1)
+        while slots[slot] >= 0:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = i
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(encoded), num_slots))
+        f.write(offsets.tobytes())
+        f.write(slots.tobytes())
+        f.write(b''.join(encoded))
+
+
+class VocabFile(object):
+    def __init__(self, path=VOCAB_PATH):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, num_slots = HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            raise ValueError(f'Not a vocab file: {path}')
+        self._mask = num_slots - 1
+        self._offsets = np.frombuffer(self._buf, dtype='<u4', count=self._count + 1, offset=HEADER.size)
+        self._slots = np.frombuffer(self._buf, dtype='<i4', count=num_slots,
+                                    offset=HEADER.size + self._offsets.nbytes)
+        self._blob = HEADER.size + self._offsets.nbytes + self._slots.nbytes
+
+    def __len__(self):
+        return self._count
+
+    def _word_bytes(self, i):
+        return self._buf[self._blob + int(self._offsets[i]):self._blob + int(self._offsets[i + 1])]
+
+    def id(self, word):
+        """The id of the word, or None if it is not in the vocab."""
+        w = word.encode('utf-8')
+        slot = zlib.crc32(w) & self._mask
+        while True:
+            i = int(self._slots[slot])
+            if i < 0:
+                return None
+            if self._word_bytes(i) == w:
+                return i
+            slot = (slot + 1) & self._mask
+
+    def word(self, i):
+        """The word of the id, or None if the id is out of the vocab."""
+        if not 0 <= i < self._count:
+            return None
+        return self._word_bytes(i).decode('utf-8')
+
+
+def build(words_path, output_path=VOCAB_PATH):
+    with open(words_path, encoding='utf-8') as f:
+        words = [line.rstrip('\n') for line in f]
+    write_vocab(words, output_path)
+    return f'{len(words)} words are written to {output_path}'
+
+
+if __name__ == '__main__':
+    fire.Fire(build)
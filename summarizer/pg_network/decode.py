@@ -12,51 +12,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
+import multiprocessing
 import time
-import copy
+
 import torch
 from loguru import logger
 
 from . import utils
+from .backend import create_backend
 from .pointer_model import PointerEncoderDecoder
+from .pool import decode_in_workers, fork_context
 
 from .dataset import data
 from .dataset.data import Vocab
-from .dataset.batcher import Batcher
+from .dataset.batcher import Batch
+from .dataset.scheduler import bucket_by_length, restore_order
 from .dataset.train_util import get_input_from_batch
 
+# the bound of a log probability, which is 0 in theory, but the float32 distributions may exceed 1 by rounding
+MAX_LOG_PROB = 1e-5
+EARLY_STOPS = ('none', 'exact', 'length')
+
 
 class Beam(object):
-    def __init__(self, tokens, log_probs, state, context, coverage, ngram_set):
+    def __init__(self, tokens, log_probs, state, context, coverage):
         self.tokens = tokens
         self.log_probs = log_probs
         self.state = state
         self.context = context
         self.coverage = coverage
-        self.ngram_set = ngram_set
-
-    def extend(self, token, log_prob, state, context, coverage, new_3gram):
-        if self.ngram_set is None:
-            ngram_set = None
-        else:
-            ngram_set = copy.copy(self.ngram_set)
-            ngram_set.add(new_3gram)
 
+    def extend(self, token, log_prob, state, context, coverage):
         return Beam(tokens=self.tokens + [token],
                     log_probs=self.log_probs + [log_prob],
                     state=state,
                     context=context,
-                    coverage=coverage,
-                    ngram_set=ngram_set)
-
-    def get_new_3gram(self, token):
-        new_3gram = tuple(self.tokens[-2:] + [token])
-        return new_3gram
-
-    def is_dup_3gram(self, new_3gram):
-        if new_3gram in self.ngram_set:
-            return True
-        return False
+                    coverage=coverage)
 
     @property
     def latest_token(self):
@@ -68,160 +60,570 @@ class Beam(object):
 
 
 class BeamSearch(object):
-    def __init__(self, params, model_file_path, data_file, ngram_filter=False):
+    def __init__(self, params, model_file_path, ngram_filter=False):
+        """
+        Load the model once, it is kept in eval mode to decode every list of examples passed to `decode_examples`.
+
+        Args:
+            params: the hyper-parameters.
+            model_file_path: the path of the checkpoint.
+            ngram_filter: whether to block repeated 3-grams.
+        """
         self.vocab = Vocab()
-        # decode_data_path = os.path.join(params.data_dir, data_file)
-        self.batcher = Batcher(params, data_file, self.vocab, mode='decode',
-                               batch_size=params.beam_size, single_pass=True)
         self.pad_id = self.vocab.word2id(data.PAD_TOKEN)
         assert (self.pad_id == 1)
-        time.sleep(10)
 
+        beg = time.time()
         self.model = PointerEncoderDecoder(params, model_file_path, pad_id=self.pad_id, is_eval=True)
+        # runs the encoder and the decoder steps of `tensor_beam_search`
+        self.backend = create_backend(params, self.model)
+        self.load_time = time.time() - beg
         self.params = params
 
         self.ngram_filter = ngram_filter
-        if not self.ngram_filter:
-            self.cand_beam_size = self.params.beam_size * 2
-        else:
-            self.cand_beam_size = self.params.beam_size * 5
+        if params.early_stop not in EARLY_STOPS:
+            raise ValueError(f'Unknown early_stop: {params.early_stop}, expected one of {", ".join(EARLY_STOPS)}')
+
+        # the seconds between the start of the last `decode_examples` call and its first decoded article
+        self.first_output_time = None
+        # the time when the last `decode_examples` call must stop decoding, see `params.run_timeout`
+        self.deadline = None
+        # the indices of the examples of the last `decode_examples` call which were cut short by a deadline, the ids
+        # of the examples may not be unique, e.g., the numbers of the PRs of several repos
+        self.truncated = []
 
     def sort_beams(self, beams):
         return sorted(beams, key=lambda h: h.avg_log_prob, reverse=True)
 
-    def decode(self):
-        hyps = []
-        batch = self.batcher.next_batch()
-        while batch is not None:
-            # Run beam search to get best Hypothesis
-            best_summary = self.beam_search(batch)
+    def decode_examples(self, examples):
+        """
+        Decode the examples in groups of `params.decode_batch_size`, see `tensor_beam_search`. The groups are of
+        similar lengths so that they need little padding, see `bucket_by_length`, the hyps are returned in the input
+        order. The groups are decoded by `params.num_workers` forked processes if it is more than one and this process
+        is not a daemonic worker itself, see `pool.py`.
+
+        The decoding of the examples is cut short when they run out of `params.pr_timeout` or the call runs out of
+        `params.run_timeout`, their indices are kept in `truncated` and their ids are logged.
+        """
+        beg = time.time()
+        self.first_output_time = None
+        self.truncated = []
+        self.deadline = beg + self.params.run_timeout if self.params.run_timeout > 0 else None
+        in_workers = self.params.num_workers > 1 and len(examples) > 1
+        if in_workers and fork_context() is None:
+            logger.warning('The platform cannot fork, the PRs are decoded in a single process')
+            in_workers = False
+        elif in_workers and multiprocessing.current_process().daemon:
+            # e.g., a worker of `bulk`, a daemonic process is not allowed to have children
+            logger.debug('The PRs are decoded in a single process since this process is a daemonic worker')
+            in_workers = False
+
+        if in_workers:
+            hyps = decode_in_workers(self, examples, self.params.num_workers)
+        else:
+            groups = bucket_by_length(examples, self.params.decode_batch_size)
+            outputs = []
+            for group in groups:
+                outputs.append(self.decode_batch([examples[i] for i in group], group))
+                if self.first_output_time is None:
+                    self.first_output_time = time.time() - beg
+            hyps = restore_order(groups, outputs)
+
+        if self.truncated:
+            logger.warning(f'{len(self.truncated)} of {len(examples)} PRs are cut short by the decoding deadlines, '
+                           f'their summaries are the best partial hypotheses: '
+                           f'{[examples[i].id for i in sorted(self.truncated)]}')
+        return hyps
+
+    def decode_batch(self, examples, indices):
+        """
+        Decode the examples as one batch, they must be sorted by length in descending order. The indices of the
+        examples which are cut short by a deadline are appended to `truncated`, `indices` are the ones of the examples
+        in the input of `decode_examples`.
+        """
+        # the clock of each example starts when it enters the batch, and each example stops on its own deadline, so
+        # the short examples of a batch retire on their own instead of waiting for a long one, see `finished`
+        deadline = self.deadline if self.deadline is not None else math.inf
+        if self.params.pr_timeout > 0:
+            deadline = min(deadline, time.time() + self.params.pr_timeout)
+        deadlines = [deadline] * len(examples) if deadline < math.inf else None
+        batch = Batch(self.params, examples, self.vocab, len(examples))
+        cut_short = []
+        output_ids = self.tensor_beam_search(batch, deadlines, cut_short)
+        self.truncated.extend(indices[j] for j in cut_short)
+        return [self.to_text(ids, batch.art_oovs[j] if self.params.pointer_gen else None)
+                for j, ids in enumerate(output_ids)]
+
+    def to_text(self, output_ids, article_oovs):
+        # Convert the output ids of the best hypothesis back to words
+        decoded_words = data.outputids2decwords(output_ids, self.vocab, article_oovs, self.params.pointer_gen)
+        return utils.prepare_rouge_text(" ".join(decoded_words))
+
+    def extend_beams(self, beams, topk_log_probs, topk_ids, dec_h, dec_c, c_t, coverage_t_plus):
+        """Extend each beam with its top candidates, the i-th beam is the i-th row of the decoder outputs."""
+        all_beams = []
+        for i, h in enumerate(beams):
+            state_i = (dec_h[i], dec_c[i])
+            context_i = c_t[i]
+            coverage_i = (coverage_t_plus[i] if self.params.is_coverage else None)
+
+            for j in range(self.params.beam_size):  # for each of the top beam_size hyps:
+                new_beam = h.extend(token=topk_ids[i, j].item(),
+                                    log_prob=topk_log_probs[i, j].item(),
+                                    state=state_i,
+                                    context=context_i,
+                                    coverage=coverage_i)
+                all_beams.append(new_beam)
+
+        if len(all_beams) < 4:
+            logger.error(f'Only find {all_beams} candidate beams')
+
+        return all_beams
+
+    def select_beams(self, all_beams, results, steps):
+        """Move the best finished candidates to `results` and return the best unfinished ones."""
+        beams = []
+        for h in self.sort_beams(all_beams):
+            if h.latest_token == self.vocab.word2id(data.STOP_DECODING):
+                if steps >= self.params.min_dec_steps:
+                    results.append(h)
+            else:
+                beams.append(h)
+            if len(beams) == self.params.beam_size or len(results) == self.params.beam_size:
+                break
+        return beams
+
+    def score_bound(self, score, length, max_len):
+        """
+        The best average log probability that a hypothesis of the summed log probability and the number of tokens
+        can reach in at most `max_len` decoder steps, by `params.early_stop`:
+
+        - exact: the average of a hypothesis only gets closer to 0 as it grows, so the bound is the one of its longest
+          extension whose further tokens all have the max log probability. Stopping by it never changes the output.
+        - length: its current average, as if its further tokens were no more likely than its tokens so far. It stops
+          much earlier, but the output may change.
+        """
+        if self.params.early_stop == 'length':
+            return score / length
+        remaining = max_len - length + 1
+        return (score + remaining * MAX_LOG_PROB) / (max_len + 1)
+
+    def cannot_improve(self, beams, results, max_len):
+        """Whether no beam can become a result better than the best one, see `score_bound`."""
+        if self.params.early_stop == 'none' or not results:
+            return False
+        best = max(h.avg_log_prob for h in results)
+        return all(best >= self.score_bound(sum(h.log_probs), len(h.tokens), max_len) for h in beams)
+
+    def best_beam(self, beams, results):
+        if len(results) == 0:
+            results = beams
+
+        beams_sorted = self.sort_beams(results)
 
-            # Extract the output ids from the hypothesis and convert back to words
-            output_ids = [int(t) for t in best_summary.tokens[1:]]
-            article_oovs = batch.art_oovs[0] if self.params.pointer_gen else None
-            decoded_words = data.outputids2decwords(output_ids, self.vocab, article_oovs, self.params.pointer_gen)
+        return beams_sorted[0]
 
-            hyps.append(utils.prepare_rouge_text(" ".join(decoded_words)))
+    def decoder_step(self, beams, enc_outputs, enc_features, enc_padding_mask, extend_vocab_zeros,
+                     enc_batch_extended, shortlist=None):
+        """
+        Run the decoder for the latest token of each beam and return the top candidates of each of them. The
+        shortlist is the one of the example, see `shortlist`.
+        """
+        device = torch.device(self.params.eval_device)
+        latest_tokens = [h.latest_token for h in beams]
+        latest_tokens = [t if t < self.vocab.size() else self.vocab.word2id(data.UNKNOWN_TOKEN)
+                         for t in latest_tokens]
+        y_t_1 = torch.LongTensor(latest_tokens).to(device)
+        all_state_h = []
+        all_state_c = []
 
-            batch = self.batcher.next_batch()
+        all_context = []
 
-        return hyps
+        for h in beams:
+            state_h, state_c = h.state
+            all_state_h.append(state_h)
+            all_state_c.append(state_c)
 
+            all_context.append(h.context)
+
+        s_t_1 = (torch.stack(all_state_h, 0).unsqueeze(0), torch.stack(all_state_c, 0).unsqueeze(0))
+        c_t_1 = torch.stack(all_context, 0)
+
+        coverage_t = None
+        if self.params.is_coverage:
+            all_coverage = []
+            for h in beams:
+                all_coverage.append(h.coverage)
+            coverage_t = torch.stack(all_coverage, 0)[:, :enc_features.size(1)]
+
+        if shortlist is not None:
+            shortlist = shortlist[:3] + (shortlist[3].expand(len(beams), -1),)
+        log_probs, s_t, c_t, attn_dist, coverage_t_plus = self.model.decoder.step(y_t_1, s_t_1, c_t_1, enc_outputs,
+                                                                                  enc_features, enc_padding_mask,
+                                                                                  extend_vocab_zeros,
+                                                                                  enc_batch_extended, coverage_t,
+                                                                                  shortlist)
+
+        tokens = torch.LongTensor([h.tokens for h in beams]).to(device)
+        topk_log_probs, topk_ids = self.topk_candidates(log_probs, tokens)
+
+        dec_h, dec_c = s_t
+        # num_beams x hidden_dim, squeeze(0) keeps the beam dimension when there is a single beam
+        dec_h = dec_h.squeeze(0)
+        dec_c = dec_c.squeeze(0)
+
+        return topk_log_probs, topk_ids, dec_h, dec_c, c_t, coverage_t_plus
+
+    @torch.no_grad()
     def beam_search(self, batch):
-        device = torch.device(self.params.eval_device)
+        """
+        Decode a batch of a single example with `Beam` objects. `tensor_beam_search` gives the same hypotheses much
+        faster, this is kept as the reference implementation for testing.
 
+        The example is encoded once, and the encoder outputs are expanded across the hypotheses without copying them.
+        """
         enc_batch, enc_padding_mask, enc_lens, enc_batch_extended, extend_vocab_zeros, c_t_1, coverage_t_0 = \
             get_input_from_batch(self.params, batch, self.params.eval_device)
         c_t_1 = c_t_1.unsqueeze(1)
 
+        # 1 x max_seq_len x 2*hidden_dim
         enc_outputs, enc_features, s_0 = self.model.encoder(enc_batch, enc_lens)
+        shortlist = self.shortlist(enc_batch) if self.params.shortlist_size > 0 else None
 
-        dec_h, dec_c = s_0  # 1 x batch_size x 2*hidden_size
-        # batch_size x 2*hidden_size
-        dec_h = dec_h.squeeze()
-        dec_c = dec_c.squeeze()
+        dec_h, dec_c = s_0  # 1 x 1 x 2*hidden_size
 
-        # initialize beams
-        # TODO: maybe we only need one beam since only beams[0] will be used later at step 0
+        # only one beam at step 0 since all the beams would start from the same state
         beams = [Beam(tokens=[self.vocab.word2id(data.START_DECODING)],
                       log_probs=[0.0],
-                      state=(dec_h[0], dec_c[0]),
+                      state=(dec_h[0, 0], dec_c[0, 0]),
                       context=c_t_1[0],
-                      coverage=(coverage_t_0[0] if self.params.is_coverage else None),
-                      ngram_set=set() if self.ngram_filter else None)
-                 for _ in range(self.params.beam_size)]
+                      coverage=(coverage_t_0[0] if self.params.is_coverage else None))]
         results = []
         steps = 0
-        while steps < self.params.max_dec_steps and len(results) < self.params.beam_size and steps < enc_lens.max():
-            latest_tokens = [h.latest_token for h in beams]
-            latest_tokens = [t if t < self.vocab.size() else self.vocab.word2id(data.UNKNOWN_TOKEN) \
-                             for t in latest_tokens]
-            y_t_1 = torch.LongTensor(latest_tokens).to(device)
-            all_state_h = []
-            all_state_c = []
-
-            all_context = []
+        max_steps = min(self.params.max_dec_steps, math.ceil(self.params.dec_steps_ratio * int(enc_lens.max())))
+        while steps < max_steps and len(results) < self.params.beam_size:
+            if self.cannot_improve(beams, results, max_steps):
+                break
+            num_beams = len(beams)
+            topk_log_probs, topk_ids, dec_h, dec_c, c_t, coverage_t_plus = \
+                self.decoder_step(beams, enc_outputs.expand(num_beams, -1, -1),
+                                  enc_features.expand(num_beams, -1, -1),
+                                  enc_padding_mask.expand(num_beams, -1),
+                                  None if extend_vocab_zeros is None else extend_vocab_zeros.expand(num_beams, -1),
+                                  None if enc_batch_extended is None else enc_batch_extended.expand(num_beams, -1),
+                                  shortlist)
+
+            all_beams = self.extend_beams(beams, topk_log_probs, topk_ids, dec_h, dec_c, c_t, coverage_t_plus)
+            new_beams = self.select_beams(all_beams, results, steps)
+            if len(new_beams) == 0:
+                # e.g. the only candidate is a stop before min_dec_steps, keep the current beams as the result
+                break
+            beams = new_beams
 
-            for h in beams:
-                state_h, state_c = h.state
-                all_state_h.append(state_h)
-                all_state_c.append(state_c)
-
-                all_context.append(h.context)
-
-            s_t_1 = (torch.stack(all_state_h, 0).unsqueeze(0), torch.stack(all_state_c, 0).unsqueeze(0))
-            c_t_1 = torch.stack(all_context, 0)
+            steps += 1
 
-            coverage_t = None
-            if self.params.is_coverage:
-                all_coverage = []
-                for h in beams:
-                    all_coverage.append(h.coverage)
-                coverage_t = torch.stack(all_coverage, 0)
+        return self.best_beam(beams, results)
+
+    def shortlist(self, enc_batch):
+        """
+        The shortlist of a batch for `AttentionDecoder.step`: the `params.shortlist_size` most frequent words, which
+        are the first ids of the vocab, and the in-vocab words of the articles. An article can generate the frequent
+        words and its own words only, the OOVs of the article are still copied by the pointer.
+
+        Returns:
+            The vocab ids, their rows of `V2`, and the mask of each article, batch x shortlist_size, 0 for the ids
+            it can generate and -inf for the others.
+        """
+        size = self.params.shortlist_size
+        ids = torch.unique(torch.cat([torch.arange(size, device=enc_batch.device), enc_batch.view(-1)]))
+        allowed = (ids < size).expand(enc_batch.size(0), -1).clone()
+        allowed.scatter_(1, torch.searchsorted(ids, enc_batch), True)
+        mask = torch.zeros(allowed.size(), device=enc_batch.device).masked_fill_(~allowed, float('-inf'))
+        return self.model.decoder.shortlist(ids) + (mask,)
+
+    def step_options(self, shortlist, state):
+        """The options of `AttentionDecoder.step` for the rows of the running examples, i.e., their shortlist."""
+        if shortlist is None:
+            return {}
+        return {'shortlist': shortlist[:3] + (state['shortlist_mask'].repeat_interleave(self.params.beam_size, 0),)}
+
+    @staticmethod
+    def record_outputs(outputs, finished, state, steps):
+        """
+        Set the output ids of the finished examples which have none yet, to their best result, or to their best
+        hypothesis if they have no result.
+        """
+        for i in finished.nonzero().view(-1).tolist():
+            b = int(state['live'][i])
+            if outputs[b] is not None:
+                continue
+            if state['num_results'][i] > 0:
+                outputs[b] = state['best_tokens'][i, 1:state['best_len'][i]].tolist()
+            else:
+                # the slots are sorted by the average log probability
+                outputs[b] = state['tokens'][i, 0, 1:steps + 1].tolist()
+
+    @staticmethod
+    def gather_encoder_inputs(encoded, state, beam_size):
+        """
+        Gather the encoder outputs of the running examples for each of their slots, cut to the longest of them.
+        The coverages of the state are cut the same way.
+        """
+        rows = state['live'].repeat_interleave(beam_size)
+        max_enc_len = int(state['enc_lens'].max())
+        if 'coverage' in state:
+            state['coverage'] = state['coverage'][:, :, :max_enc_len]
+        enc_outputs, enc_features, enc_padding_mask, extend_vocab_zeros, enc_batch_extended = encoded
+        return (enc_outputs[:, :max_enc_len].index_select(0, rows),
+                enc_features[:, :max_enc_len].index_select(0, rows),
+                enc_padding_mask[:, :max_enc_len].index_select(0, rows),
+                None if extend_vocab_zeros is None else extend_vocab_zeros.index_select(0, rows),
+                None if enc_batch_extended is None else enc_batch_extended[:, :max_enc_len].index_select(0, rows))
+
+    def topk_candidates(self, log_probs, tokens):
+        """
+        Return the log probabilities and the ids of the top `beam_size` next tokens of each hypothesis.
+
+        Args:
+            log_probs: num_hyps x extend_vocab_size, the output of `AttentionDecoder.step`, updated in place.
+            tokens: num_hyps x steps, the tokens of the hypotheses.
+        """
+        # for debug
+        if torch.isnan(log_probs).any():
+            logger.error('log probs contains NAN')
+
+        if self.ngram_filter:
+            self.block_3grams(tokens, log_probs)
+        return torch.topk(log_probs, self.params.beam_size)
+
+    @staticmethod
+    def block_3grams(tokens, log_probs):
+        """
+        Ban the next tokens which would repeat a 3-gram of the hypotheses, in place.
+
+        The 3-grams of a hypothesis which start with its last two tokens give the banned tokens, their log
+        probabilities are set to -inf so that `topk` never selects them.
+
+        Args:
+            tokens: num_hyps x steps, the tokens of the hypotheses.
+            log_probs: num_hyps x extend_vocab_size, the log probabilities of the next tokens.
+        """
+        if tokens.size(-1) < 3:
+            return
+        # num_hyps x (steps - 2)
+        match = (tokens[:, :-2] == tokens[:, -2:-1]) & (tokens[:, 1:-1] == tokens[:, -1:])
+        rows = torch.arange(tokens.size(0), device=tokens.device).unsqueeze(1).expand_as(match)
+        log_probs[rows[match], tokens[:, 2:][match]] = float('-inf')
+
+    def select_candidates(self, scores, valid, num_results, topk_log_probs, topk_ids, steps):
+        """
+        Select the candidates of each example the same way as `extend_beams` and `select_beams`.
+
+        Args:
+            scores: batch x beam, the summed log probabilities of the hypotheses in float64.
+            valid: batch x beam, whether the slots are hypotheses.
+            num_results: batch, the number of the finished hypotheses of each example.
+            topk_log_probs: batch x beam x cand, the log probabilities of the candidates.
+            topk_ids: batch x beam x cand, the candidate tokens.
+            steps: the current step.
+
+        Returns:
+            The summed and the average log probabilities of the candidates, the sorting order of the candidates, the
+            sorted candidate tokens, and whether the sorted candidates are new hypotheses or results. All of them
+            are batch x (beam * cand).
+        """
+        num_live, beam_size, cand_size = topk_ids.size()
+        proposed = valid.unsqueeze(-1).expand(-1, -1, cand_size).reshape(num_live, -1)
+
+        # sort the candidates of each example stably, like `sort_beams`
+        # batch x (beam * cand)
+        sums = (scores.unsqueeze(-1) + topk_log_probs.double()).view(num_live, -1)
+        avgs = (sums / (steps + 2)).masked_fill(~proposed, float('-inf'))
+        avgs, order = avgs.sort(dim=-1, descending=True, stable=True)
+        proposed = proposed.gather(1, order)
+        cand_tokens = topk_ids.view(num_live, -1).gather(1, order)
+
+        # take the candidates in order until there are beam_size new hypotheses or beam_size results
+        is_stop = cand_tokens == self.vocab.word2id(data.STOP_DECODING)
+        is_beam = proposed & ~is_stop
+        is_result = proposed & is_stop
+        if steps < self.params.min_dec_steps:
+            is_result = torch.zeros_like(is_result)
+        beams_before = is_beam.cumsum(-1) - is_beam.long()
+        results_before = num_results.unsqueeze(-1) + is_result.cumsum(-1) - is_result.long()
+        taken = (beams_before < beam_size) & (results_before < beam_size)
+        is_beam = is_beam & taken
+        is_result = is_result & taken
+
+        return sums, avgs, order, cand_tokens, is_beam, is_result
+
+    @staticmethod
+    def update_best_results(is_result, avgs, order, cand_tokens, steps, state):
+        """Replace the best results of the state by the new results of this step which are strictly better."""
+        tokens, best_tokens = state['tokens'], state['best_tokens']
+        cand_size = is_result.size(1) // tokens.size(1)
+        # the first result of an example is its best one of this step since the candidates are sorted
+        first = is_result.long().argmax(-1, keepdim=True)
+        result_avg = avgs.gather(1, first).squeeze(1)
+        better = is_result.any(-1) & (result_avg > state['best_avg'])
+        idx = better.nonzero().view(-1)
+        if len(idx) == 0:
+            return
+        parent = order[idx, first[idx, 0]] // cand_size
+        best_tokens[idx, :steps + 1] = tokens[idx, parent, :steps + 1]
+        best_tokens[idx, steps + 1] = cand_tokens[idx, first[idx, 0]]
+        state['best_len'][idx] = steps + 2
+        state['best_avg'][idx] = result_avg[idx]
+
+    def finished(self, state, steps, cut_short):
+        """Whether the running examples stop before this step, see `tensor_beam_search`."""
+        done = state['stuck'] | (state['num_results'] >= self.params.beam_size) | (state['max_steps'] <= steps)
+        if self.params.early_stop != 'none':
+            # the same as `cannot_improve`, the invalid slots are not hypotheses
+            max_len = state['max_steps'].clamp(max=self.params.max_dec_steps).unsqueeze(1)
+            bounds = self.score_bound(state['scores'], steps + 1, max_len).masked_fill(~state['valid'], float('-inf'))
+            done |= (state['num_results'] > 0) & (state['best_avg'] >= bounds.max(-1).values)
+        if steps >= self.params.max_dec_steps:
+            done[:] = True
+        elif 'deadline' in state and steps >= self.params.min_dec_steps:
+            expired = ~done & (state['deadline'] <= time.time())
+            if cut_short is not None:
+                cut_short.extend(state['live'][expired].tolist())
+            done |= expired
+        return done
+
+    @torch.no_grad()
+    def tensor_beam_search(self, batch, deadlines=None, cut_short=None):
+        """
+        Decode a batch of distinct examples and return the output ids of the best hypothesis of each of them.
+
+        The hypotheses are the `beam_size` slots of each example, their tokens, scores, LSTM states, contexts and
+        coverages are batched tensors that are reordered by index each step. The selection follows `beam_search`
+        exactly: each hypothesis proposes its top `beam_size` candidates, see `topk_candidates`, the candidates
+        of an example are sorted stably by average log probability, and they are taken in that order until there
+        are `beam_size` new hypotheses or `beam_size` results. The scores are summed in float64 like
+        the Python floats of `Beam`, so the hypotheses are the same.
+
+        An example is retired as soon as `beam_search` would have stopped for it, and the encoder outputs are cut
+        to the longest example that is still running. An example stops after `params.max_dec_steps` steps, or after
+        `params.dec_steps_ratio` times the length of its article. It also stops as soon as none of its hypotheses can
+        become a better result than its best one, see `score_bound`. The vocab distribution is restricted to a
+        shortlist if `params.shortlist_size` is set, see `shortlist`.
+
+        Args:
+            batch: the batch to decode.
+            deadlines: the time by `time.time()` of each example when it stops with its best result, or its best
+                partial hypothesis if it has no result. It runs at least `params.min_dec_steps` steps.
+            cut_short: a list which the indices of the examples stopped by the deadline are appended to.
+        """
+        device = torch.device(self.params.eval_device)
+        beam_size = self.params.beam_size
+        # 3-grams are blocked before topk, so beam_size candidates per hypothesis are enough
+        cand_size = beam_size
+        unk_id = self.vocab.word2id(data.UNKNOWN_TOKEN)
 
-            final_dist, s_t, c_t, attn_dist, coverage_t_plus = self.model.decoder(y_t_1, s_t_1, c_t_1, enc_outputs,
-                                                                                  enc_features, enc_padding_mask,
-                                                                                  extend_vocab_zeros,
-                                                                                  enc_batch_extended, coverage_t)
-
-            log_probs = torch.log(final_dist)
-            # for debug
-            if torch.isnan(log_probs).any():
-                logger.error('log probs contains NAN')
-
-            topk_log_probs, topk_ids = torch.topk(log_probs, self.cand_beam_size)
-
-            dec_h, dec_c = s_t
-            dec_h = dec_h.squeeze()
-            dec_c = dec_c.squeeze()
-
-            all_beams = []
-            num_orig_beams = 1 if steps == 0 else len(beams)
-            for i in range(num_orig_beams):
-                h = beams[i]
-                state_i = (dec_h[i], dec_c[i])
-                context_i = c_t[i]
-                coverage_i = (coverage_t_plus[i] if self.params.is_coverage else None)
-
-                cur_count = 0
-                # we assume that all beam can get no_dup 3-grams in self.cand_beam_size
-                for j in range(self.cand_beam_size):  # for each of the top can_beam_size hyps:
-                    cur_token = topk_ids[i, j].item()
-                    new_3gram = None
-                    if self.ngram_filter:
-                        new_3gram = h.get_new_3gram(cur_token)
-                        if h.is_dup_3gram(new_3gram):
-                            continue
-
-                    new_beam = h.extend(token=topk_ids[i, j].item(),
-                                        log_prob=topk_log_probs[i, j].item(),
-                                        state=state_i,
-                                        context=context_i,
-                                        coverage=coverage_i,
-                                        new_3gram=new_3gram)
-                    all_beams.append(new_beam)
-                    cur_count += 1
-                    if cur_count == self.params.beam_size:
-                        break
-
-            if len(all_beams) < 4:
-                logger.error(f'Only find {all_beams} candidate beams')
-
-            beams = []
-            for h in self.sort_beams(all_beams):
-                if h.latest_token == self.vocab.word2id(data.STOP_DECODING):
-                    if steps >= self.params.min_dec_steps:
-                        results.append(h)
-                else:
-                    beams.append(h)
-                if len(beams) == self.params.beam_size or len(results) == self.params.beam_size:
+        enc_batch, enc_padding_mask, enc_lens, enc_batch_extended, extend_vocab_zeros, c_t_0, coverage_t_0 = \
+            get_input_from_batch(self.params, batch, self.params.eval_device)
+        enc_outputs, enc_features, s_0 = self.backend.encode(enc_batch, enc_lens)
+        encoded = (enc_outputs, enc_features, enc_padding_mask, extend_vocab_zeros, enc_batch_extended)
+        batch_size = len(enc_lens)
+        shortlist = self.shortlist(enc_batch) if self.params.shortlist_size > 0 else None
+
+        # the state of the running examples, batch x beam x ...
+        state = {
+            'live': torch.arange(batch_size, device=device),
+            'enc_lens': torch.from_numpy(enc_lens).long().to(device),
+            'max_steps': (torch.from_numpy(enc_lens).double() * self.params.dec_steps_ratio).ceil().long().to(device),
+            'tokens': torch.full((batch_size, beam_size, self.params.max_dec_steps + 1),
+                                 self.vocab.word2id(data.START_DECODING), dtype=torch.long, device=device),
+            'scores': torch.zeros((batch_size, beam_size), dtype=torch.float64, device=device),
+            # only the first slot is a hypothesis at step 0, since all the beams would start from the same state
+            'valid': torch.arange(beam_size, device=device).expand(batch_size, -1) == 0,
+            'dec_h': s_0[0].squeeze(0).unsqueeze(1).expand(-1, beam_size, -1),
+            'dec_c': s_0[1].squeeze(0).unsqueeze(1).expand(-1, beam_size, -1),
+            'context': c_t_0.unsqueeze(1).expand(-1, beam_size, -1),
+            # the finished hypotheses, only the number of them and the best one are needed
+            'num_results': torch.zeros(batch_size, dtype=torch.long, device=device),
+            'best_avg': torch.full((batch_size,), float('-inf'), dtype=torch.float64, device=device),
+            'best_tokens': torch.zeros((batch_size, self.params.max_dec_steps + 1), dtype=torch.long, device=device),
+            'best_len': torch.zeros(batch_size, dtype=torch.long, device=device),
+            # the examples which have no new hypotheses
+            'stuck': torch.zeros(batch_size, dtype=torch.bool, device=device),
+        }
+        if self.params.is_coverage:
+            state['coverage'] = coverage_t_0.unsqueeze(1).expand(-1, beam_size, -1)
+        if shortlist is not None:
+            state['shortlist_mask'] = shortlist[3]
+        if deadlines is not None:
+            state['deadline'] = torch.tensor(deadlines, dtype=torch.float64, device=device)
+
+        outputs = [None] * batch_size
+        enc_inputs = None
+        steps = 0
+        while True:
+            done = self.finished(state, steps, cut_short)
+            if done.any():
+                self.record_outputs(outputs, done, state, steps)
+                if done.all():
                     break
+                state = {k: v[~done] for k, v in state.items()}
+                enc_inputs = None
+
+            num_live = len(state['live'])
+            if enc_inputs is None:
+                # the rows only change when an example is retired
+                enc_inputs = self.gather_encoder_inputs(encoded, state, beam_size)
+                options = self.step_options(shortlist, state)
+
+            num_rows = num_live * beam_size
+            y_t_1 = state['tokens'][:, :, steps].reshape(-1)
+            y_t_1 = y_t_1.masked_fill(y_t_1 >= self.vocab.size(), unk_id)
+            s_t_1 = (state['dec_h'].reshape(1, num_rows, -1), state['dec_c'].reshape(1, num_rows, -1))
+            c_t_1 = state['context'].reshape(num_rows, 1, -1)
+            coverage_t = state['coverage'].reshape(num_rows, -1) if self.params.is_coverage else None
+
+            log_probs, s_t, c_t, attn_dist, coverage_t_plus = self.backend.step(y_t_1, s_t_1, c_t_1, *enc_inputs,
+                                                                                coverage_t, **options)
+
+            # batch x beam x cand
+            topk_log_probs, topk_ids = self.topk_candidates(log_probs,
+                                                            state['tokens'][:, :, :steps + 1].reshape(num_rows, -1))
+            topk_log_probs = topk_log_probs.view(num_live, beam_size, cand_size)
+            topk_ids = topk_ids.view(num_live, beam_size, cand_size)
+
+            sums, avgs, order, cand_tokens, is_beam, is_result = \
+                self.select_candidates(state['scores'], state['valid'], state['num_results'], topk_log_probs,
+                                       topk_ids, steps)
+
+            if is_result.any():
+                state['num_results'] = state['num_results'] + is_result.sum(-1)
+                self.update_best_results(is_result, avgs, order, cand_tokens, steps, state)
+
+            # an example without new hypotheses ends with its current ones, like `beam_search`, e.g. when its only
+            # candidate is a stop before min_dec_steps
+            state['stuck'] = ~is_beam.any(-1)
+            self.record_outputs(outputs, state['stuck'], state, steps)
+
+            # the positions of the new hypotheses in the sorted candidates, in order, padded with the others
+            positions = torch.arange(is_beam.size(1), device=device).expand_as(is_beam)
+            positions = positions.masked_fill(~is_beam, is_beam.size(1))
+            slots = positions.topk(beam_size, dim=-1, largest=False, sorted=True).indices
+            flat = order.gather(1, slots)
+            parent = flat // cand_size
+
+            # reorder the state by the parents of the new hypotheses
+            rows = (torch.arange(num_live, device=device).unsqueeze(1) * beam_size + parent).view(-1)
+            tokens = state['tokens'].gather(1, parent.unsqueeze(-1).expand(-1, -1, state['tokens'].size(-1)))
+            tokens[:, :, steps + 1] = cand_tokens.gather(1, slots)
+            state['tokens'] = tokens
+            state['scores'] = sums.gather(1, flat)
+            state['valid'] = is_beam.gather(1, slots)
+            state['dec_h'] = s_t[0].squeeze(0).index_select(0, rows).view(num_live, beam_size, -1)
+            state['dec_c'] = s_t[1].squeeze(0).index_select(0, rows).view(num_live, beam_size, -1)
+            state['context'] = c_t.squeeze(1).index_select(0, rows).view(num_live, beam_size, -1)
+            if self.params.is_coverage:
+                state['coverage'] = coverage_t_plus.index_select(0, rows).view(num_live, beam_size, -1)
 
             steps += 1
 
-        if len(results) == 0:
-            results = beams
-
-        beams_sorted = self.sort_beams(results)
-
-        return beams_sorted[0]
+        return outputs
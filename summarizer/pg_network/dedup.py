@@ -0,0 +1,105 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Group the duplicate articles of PRs before decoding, e.g., the ones of the PRs of dependency bots, so that each group
+is decoded once. The identical articles are grouped by their text, and optionally the near-duplicate ones by the
+MinHash of their word shingles, see `MinHashIndex`.
+"""
+
+import zlib
+
+import numpy as np
+
+# a Mersenne prime, the products of the coefficients and the 32-bit hashes of the shingles fit in uint64
+PRIME = (1 << 31) - 1
+
+
+class MinHashIndex(object):
+    def __init__(self, threshold, shingle_size=3, num_perm=64, bands=16, seed=1):
+        """
+        An index of the MinHash signatures of articles, which finds the one most similar to an article. The
+        candidates are the ones which share a band of the signature with it, the locality-sensitive hashing of
+        `bands` bands finds the articles of a Jaccard similarity of (1 / bands) ^ (bands / num_perm) or more.
+
+        Args:
+            threshold: the least estimated Jaccard similarity of the word shingles of two similar articles.
+            shingle_size: the number of words of a shingle.
+            num_perm: the number of hash functions of a signature, a multiple of `bands`.
+            bands: the number of bands of a signature.
+            seed: the seed of the hash functions.
+        """
+        if num_perm % bands:
+            raise ValueError(f'num_perm ({num_perm}) must be a multiple of bands ({bands})')
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.rows = num_perm // bands
+        rnd = np.random.RandomState(seed)
+        self._a = rnd.randint(1, PRIME, size=num_perm).astype(np.uint64)
+        self._b = rnd.randint(0, PRIME, size=num_perm).astype(np.uint64)
+        self._signatures = {}
+        self._buckets = {}
+
+    def signature(self, article):
+        words = article.split()
+        size = min(self.shingle_size, len(words))
+        shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles] or [0], dtype=np.uint64)
+        return ((np.outer(hashes, self._a) + self._b) % PRIME).min(axis=0)
+
+    def bands(self, signature):
+        return [(i, signature[i:i + self.rows].tobytes()) for i in range(0, len(signature), self.rows)]
+
+    def add(self, key, signature):
+        self._signatures[key] = signature
+        for band in self.bands(signature):
+            self._buckets.setdefault(band, []).append(key)
+
+    def query(self, signature):
+        """The key of the most similar article of at least the threshold, or None."""
+        candidates = {key for band in self.bands(signature) for key in self._buckets.get(band, [])}
+        best, best_similarity = None, -1.0
+        # the earliest one of the most similar ones
+        for key in sorted(candidates):
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if self.threshold <= similarity and best_similarity < similarity:
+                best, best_similarity = key, similarity
+        return best
+
+
+def group_duplicates(articles, threshold=0.0):
+    """
+    Group the indices of the duplicate articles, the first index of a group is its representative. The groups are in
+    the order of their representatives.
+
+    Args:
+        articles: the articles of the PRs, see `EntrySummarizer.preprocess`.
+        threshold: the least estimated Jaccard similarity of the word shingles of an article and the representative
+            of its group, only the identical articles are grouped if it is 0.
+    """
+    groups = []
+    group_of = {}
+    index = MinHashIndex(threshold) if threshold > 0 else None
+    for i, article in enumerate(articles):
+        if article not in group_of:
+            signature = None if index is None else index.signature(article)
+            similar = None if index is None else index.query(signature)
+            if similar is None:
+                similar = len(groups)
+                groups.append([])
+                if index is not None:
+                    index.add(similar, signature)
+            group_of[article] = similar
+        groups[group_of[article]].append(i)
+    return groups
@@ -0,0 +1,121 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Evaluate the inference options of the pointer-generator network on a held-out set, e.g.,
+`python -m summarizer.pg_network.evaluate quantization --data_path=test.csv`.
+
+The held-out set is a CSV file of the `id`, `abstract` and `article` columns, the same as the training data.
+"""
+
+from itertools import islice
+
+import fire
+
+from summarizer.pg_network.dataset import data
+from summarizer.pg_network.dataset.batcher import Example
+from summarizer.pg_network.decode import BeamSearch
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.runtime import InferenceRuntime
+from summarizer.pg_network.summarizer import MODEL_PATH
+from summarizer.pg_network.utils import rouge
+
+
+def read_examples(data_path, params, vocab, n=None):
+    """Read the first n examples of the held-out set and their reference abstracts."""
+    examples, refs = [], []
+    for row in islice(data.example_generator(data_path, single_pass=True), n):
+        if not row['article']:
+            continue
+        examples.append(Example(params, row['id'], row['article'], row['abstract'], vocab))
+        refs.append(row['abstract'])
+    return examples, refs
+
+
+def decode(params, model_path, data_path, n=None):
+    """
+    Decode the held-out set.
+
+    Returns:
+        The hyps, the reference abstracts, and the seconds per example.
+    """
+    beam_search = BeamSearch(params, model_path, ngram_filter=1)
+    examples, refs = read_examples(data_path, params, beam_search.vocab, n)
+    runtime = InferenceRuntime()
+    with runtime.run(len(examples)):
+        hyps = beam_search.decode_examples(examples)
+    return hyps, refs, runtime.latency
+
+
+def compare(data_path, model_path, n, baseline, variant):
+    """
+    Compare the decoding of the held-out set with two sets of hyper-parameters.
+
+    Args:
+        baseline: the name and the hyper-parameters of the baseline.
+        variant: the name and the hyper-parameters compared with the baseline.
+
+    Returns:
+        The milliseconds per example and the ROUGE scores against the references of both, the speedup, the ROUGE
+        deltas of the variant, and the ROUGE scores of the summaries of the variant against the ones of the baseline.
+    """
+    (base_name, base_params), (name, params) = baseline, variant
+    base_hyps, refs, base_latency = decode(base_params, model_path, data_path, n)
+    hyps, _, latency = decode(params, model_path, data_path, n)
+
+    ret = {'examples': len(refs), f'{base_name}_ms_per_example': round(base_latency * 1000, 3),
+           f'{name}_ms_per_example': round(latency * 1000, 3),
+           'speedup': round(base_latency / latency, 3) if latency else None}
+    base_scores, scores = rouge(base_hyps, refs), rouge(hyps, refs)
+    for k in base_scores:
+        ret[f'{base_name}_{k}'] = round(base_scores[k], 4)
+        ret[f'{name}_{k}'] = round(scores[k], 4)
+        ret[f'delta_{k}'] = round(scores[k] - base_scores[k], 4)
+    for k, v in rouge(hyps, base_hyps).items():
+        ret[f'{name}_vs_{base_name}_{k}'] = round(v, 4)
+    return ret
+
+
+def quantization(data_path, model_path=MODEL_PATH, n=None, decode_batch_size=16):
+    """
+    Compare the dynamic int8 quantized model with the fp32 model on the held-out set, see `compare`.
+
+    Args:
+        data_path: the CSV file of the held-out set.
+        model_path: the path of the checkpoint.
+        n: the number of examples to evaluate, all of them if it is None.
+        decode_batch_size: the number of examples decoded at once.
+    """
+    return compare(data_path, model_path, n, ('fp32', Params(decode_batch_size=decode_batch_size)),
+                   ('int8', Params(decode_batch_size=decode_batch_size, quantize=True)))
+
+
+def shortlist(data_path, model_path=MODEL_PATH, n=None, decode_batch_size=16, shortlist_size=5000):
+    """
+    Compare the vocab distribution over a shortlist with the one over the whole vocab on the held-out set, see
+    `BeamSearch.shortlist` and `compare`.
+
+    Args:
+        data_path: the CSV file of the held-out set.
+        model_path: the path of the checkpoint.
+        n: the number of examples to evaluate, all of them if it is None.
+        decode_batch_size: the number of examples decoded at once.
+        shortlist_size: the number of the most frequent words of the shortlist.
+    """
+    return compare(data_path, model_path, n, ('full', Params(decode_batch_size=decode_batch_size)),
+                   ('shortlist', Params(decode_batch_size=decode_batch_size, shortlist_size=shortlist_size)))
+
+
+if __name__ == '__main__':
+    fire.Fire({'quantization': quantization, 'shortlist': shortlist})
@@ -0,0 +1,61 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export the encoder and a decoder step of the pointer-generator network for the torchscript and onnx backends, e.g.,
+`python -m summarizer.pg_network.export models/pg_network models/pg_network_export --onnx`.
+
+Set `backend` and `export_dir` of the summarizer to run them, the hyper-parameters, e.g., `is_coverage`, must be the
+same as the ones they are exported with.
+"""
+
+import os
+
+import fire
+import torch
+
+from summarizer.pg_network.backend import ENCODER_FILE, STEP_FILE, export_onnx, trace
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+
+
+def export(model_path, output_dir, torchscript=True, onnx=False, **kwargs):
+    """
+    Args:
+        model_path: the path of the checkpoint.
+        output_dir: the directory of the exported files.
+        torchscript: whether to export the TorchScript files, `encoder.pt` and `decoder_step.pt`.
+        onnx: whether to export the ONNX files, `encoder.onnx` and `decoder_step.onnx`.
+        kwargs: the hyper-parameters which override the defaults, see `Params`.
+
+    Returns:
+        The paths of the exported files.
+    """
+    params = Params(**kwargs)
+    model = PointerEncoderDecoder(params, model_path, is_eval=True)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    if torchscript:
+        encoder, step = trace(params, model)
+        paths += [os.path.join(output_dir, f'{ENCODER_FILE}.pt'), os.path.join(output_dir, f'{STEP_FILE}.pt')]
+        torch.jit.save(encoder, paths[-2])
+        torch.jit.save(step, paths[-1])
+    if onnx:
+        paths += [os.path.join(output_dir, f'{ENCODER_FILE}.onnx'), os.path.join(output_dir, f'{STEP_FILE}.onnx')]
+        export_onnx(params, model, paths[-2], paths[-1])
+    return paths
+
+
+if __name__ == '__main__':
+    fire.Fire(export)
@@ -17,9 +17,16 @@ PARAMS = {
     "hidden_dim": 256,
     "embed_dim": 128,
     "batch_size": 8,
+    "bucketing_cache_size": 100,
     "max_enc_steps": 400,
     "max_dec_steps": 100,
+    "dec_steps_ratio": 1.0,
     "beam_size": 4,
+    "early_stop": "exact",
+    "decode_batch_size": 16,
+    "num_workers": 1,
+    "pr_timeout": 0.0,
+    "run_timeout": 0.0,
     "min_dec_steps": 3,
     "vocab_size": 30000,
     "eps": 1e-12,
@@ -37,6 +44,11 @@ PARAMS = {
     "rl_weight": 0.9984,
     "device": "cpu",
     "eval_device": "cpu",
+    "quantize": False,
+    "shortlist_size": 0,
+    "backend": "eager",
+    "export_dir": "",
+    "trust_checkpoint": False,
     "summary_flush_interval": 100,
     "print_interval": 200,
     "eval_print_interval": 1000,
@@ -46,8 +58,19 @@ PARAMS = {
 
 
 class Params:
-    def __init__(self):
+    def __init__(self, **kwargs):
+        """
+        The default hyper-parameters are in `PARAMS`, keyword arguments override them, e.g., the options of a
+        config file. The overriding values are cast to the types of the defaults.
+        """
         self.__dict__.update(PARAMS)
+        for k, v in kwargs.items():
+            if k not in PARAMS:
+                raise KeyError(f'Unknown hyper-parameter: {k}')
+            default = PARAMS[k]
+            if isinstance(default, bool) and isinstance(v, str):
+                v = v.lower() in ('1', 'true', 'yes', 'on')
+            self.__dict__[k] = type(default)(v)
 
     @property
     def dict(self):
@@ -19,7 +19,7 @@ from torch import nn
 from torch.nn import functional as F
 from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 
-from .utils import try_load_state
+from .checkpoint import assign_state, load_state
 
 
 class Encoder(nn.Module):
@@ -219,6 +219,91 @@ class AttentionDecoder(nn.Module):
 
         return final_dist, s_t, c_t, attn_dist, coverage_t
 
+    def shortlist(self, ids):
+        """
+        The vocab ids of a shortlist and their rows of the weight and the bias of `V2`, see `step`. The weights of a
+        dynamically quantized `V2` are dequantized.
+        """
+        weight, bias = self.V2.weight, self.V2.bias
+        if callable(weight):
+            weight, bias = weight().dequantize(), bias()
+        return ids, weight.index_select(0, ids), bias.index_select(0, ids)
+
+    def step(self, y_t_1, s_t_1, c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros,
+             enc_inps_extended, coverage_t, shortlist=None):
+        """
+        The same as `forward` for inference, but it returns the log of the final distribution.
+
+        `W_s` is applied to s_t once per row and broadcast over the encoder positions instead of being applied to
+        s_t expanded to every position, and the intermediate tensors are updated in place. Without the pointer
+        mechanism, the log probabilities come from `log_softmax` directly. The parameters are the same as
+        `forward`'s, the extend_vocab_zeros are only used for their size.
+
+        With a shortlist, the vocab distribution is only computed over the vocab ids of the shortlist instead of the
+        whole vocab, the other ids get a probability of 0, or the smallest normal float with the pointer mechanism.
+        It is the ids, their rows of `V2` by `shortlist`, and the mask of each row, batch_size x shortlist_size, 0
+        for the ids it can generate and -inf for the others.
+
+        :return:
+            log_probs: batch_size x extend_vocab_size
+            s_t: (1 x batch_size x hidden_size, 1 x batch_size x hidden_size)
+            c_t: batch_size x 1 x 2*hidden_dim
+            attn_dist
+            coverage_t
+        """
+        # STEP 1: calculate s_t
+        dec_embeddings = self.embedding(y_t_1.view(-1, 1))
+        lstm_input = self.x_context(torch.cat([dec_embeddings, c_t_1], dim=-1))
+        lstm_output, s_t = self.lstm(lstm_input, s_t_1)
+
+        # STEP2: calculate c_t
+        # batch_size x 1 x 2*hidden_size
+        s_t_cat_T = torch.cat(s_t, -1).transpose(0, 1)
+        # batch_size x enc_max_seq_len x 2*hidden_size, the only tensor of this size
+        att_features = enc_features + self.W_s(s_t_cat_T)
+        if self._hps.is_coverage:
+            att_features += self.W_cover(coverage_t.unsqueeze(2))
+        e_t = self.v(torch.tanh_(att_features)).squeeze(-1)
+
+        attn_dist = F.softmax(e_t, dim=-1).mul_(enc_pad_mask)
+        normalizer = attn_dist.sum(dim=-1, keepdim=True)
+        attn_dist.div_(normalizer + self._hps.eps)
+
+        if self._hps.is_coverage:
+            coverage_t = coverage_t + attn_dist
+
+        c_t = torch.bmm(attn_dist.unsqueeze(1), enc_outputs)
+
+        # STEP3: calculate the log probabilities
+        dec_output = self.V1(torch.cat((lstm_output, c_t), dim=-1).squeeze(1))
+        vocab_size = self.V2.out_features
+        if shortlist is None:
+            logits = self.V2(dec_output)
+        else:
+            ids, weight, bias, mask = shortlist
+            logits = torch.addmm(bias, dec_output, weight.t()).add_(mask)
+        if not self._hps.pointer_gen:
+            log_probs = F.log_softmax(logits, dim=-1)
+            if shortlist is not None:
+                log_probs = log_probs.new_full((log_probs.size(0), vocab_size), float('-inf')) \
+                    .index_copy_(1, ids, log_probs)
+            return log_probs, s_t, c_t, attn_dist, coverage_t
+
+        p_gen_input = torch.cat((c_t, s_t_cat_T, dec_embeddings), dim=-1)
+        p_gen = torch.sigmoid(self.p_gen_linear(p_gen_input)).view(-1, 1)
+        # the vocab distribution is written into the final distribution, so that the extended vocab needs no cat
+        num_extend = 0 if extend_vocab_zeros is None else extend_vocab_zeros.size(1)
+        final_dist = logits.new_zeros((logits.size(0), vocab_size + num_extend))
+        if shortlist is None:
+            torch.mul(F.softmax(logits, dim=-1), p_gen, out=final_dist[:, :vocab_size])
+        else:
+            final_dist.index_copy_(1, ids, F.softmax(logits, dim=-1).mul_(p_gen))
+        final_dist.scatter_add_(1, enc_inps_extended, (1 - p_gen) * attn_dist)
+        if shortlist is not None:
+            # most of the final distribution is 0, whose log is much slower than the one of a normal float
+            final_dist.clamp_(min=torch.finfo(final_dist.dtype).tiny)
+        return final_dist.log_(), s_t, c_t, attn_dist, coverage_t
+
 
 class PointerEncoderDecoder:
     def __init__(self, hps, model_file_path, pad_id=1, is_eval=False):
@@ -242,10 +327,26 @@ class PointerEncoderDecoder:
         self.decoder = decoder
 
         if model_file_path is not None:
-            state = try_load_state(model_file_path)
-            self.encoder.load_state_dict(state['encoder_state_dict'])
-            # since we need to leverage coverage
-            self.decoder.load_state_dict(state['decoder_state_dict'], strict=False)
+            state = load_state(model_file_path, trusted=hps.trust_checkpoint)
+            if is_eval:
+                # the data of the parameters are replaced without copying, e.g., by memory-mapped weights
+                assign_state(self.encoder, state['encoder_state_dict'])
+                assign_state(self.decoder, state['decoder_state_dict'], strict=False)
+            else:
+                self.encoder.load_state_dict(state['encoder_state_dict'])
+                # since we need to leverage coverage
+                self.decoder.load_state_dict(state['decoder_state_dict'], strict=False)
+
+        if is_eval and hps.quantize:
+            self.quantize()
+
+    def quantize(self):
+        """
+        Quantize the weights of the linear layers and the LSTMs to int8 dynamically for the inference on CPU.
+        The modules are quantized in place, so that the encoder and the decoder still share the embedding.
+        """
+        for module in (self.encoder, self.decoder):
+            torch.quantization.quantize_dynamic(module, {nn.Linear, nn.LSTM}, dtype=torch.qint8, inplace=True)
 
     @property
     def parameters(self):
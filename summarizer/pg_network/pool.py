@@ -0,0 +1,79 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Decode in forked worker processes which share the model of the parent read-only. The workers are forked after the
+model is loaded, so that its weights are shared by copy-on-write, or by the page cache if they are memory-mapped,
+see `checkpoint.py`, and the examples are inherited instead of being pickled. Only the groups of indices and the
+summaries are sent between the processes.
+"""
+
+import math
+import multiprocessing
+import time
+
+import torch
+from loguru import logger
+
+from .dataset.scheduler import bucket_by_length, restore_order
+
+# the beam search and the examples of the running `decode_in_workers`, inherited by the forked workers
+_beam_search = None
+_examples = None
+
+
+def fork_context():
+    """The fork context of multiprocessing, or None if the platform cannot fork."""
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def init_worker(num_threads):
+    # the cores are split among the workers instead of every worker using all of them
+    torch.set_num_threads(num_threads)
+
+
+def decode_group(group):
+    # the indices of the examples cut short in the worker are sent back with the summaries
+    _beam_search.truncated = []
+    return _beam_search.decode_batch([_examples[i] for i in group], group), _beam_search.truncated
+
+
+def decode_in_workers(beam_search, examples, num_workers):
+    """
+    Decode the examples with `num_workers` forked processes, each of them decodes a group of examples of similar
+    lengths at a time, see `BeamSearch.decode_batch`. The groups are at most `decode_batch_size` examples and small
+    enough to give every worker one, the longest ones are handed out first. The hyps are returned in the input order.
+    """
+    global _beam_search, _examples
+    group_size = max(1, min(beam_search.params.decode_batch_size, math.ceil(len(examples) / num_workers)))
+    groups = bucket_by_length(examples, group_size)
+    num_workers = min(num_workers, len(groups))
+    num_threads = max(1, torch.get_num_threads() // num_workers)
+
+    beg = time.time()
+    outputs = []
+    _beam_search, _examples = beam_search, examples
+    try:
+        with fork_context().Pool(num_workers, initializer=init_worker, initargs=(num_threads,)) as pool:
+            for output, truncated in pool.imap(decode_group, groups):
+                if beam_search.first_output_time is None:
+                    beam_search.first_output_time = time.time() - beg
+                outputs.append(output)
+                beam_search.truncated.extend(truncated)
+    finally:
+        _beam_search, _examples = None, None
+    logger.debug(f'{len(examples)} PRs are decoded by {num_workers} workers of {num_threads} threads each')
+    return restore_order(groups, outputs)
@@ -0,0 +1,70 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The runtime of inference: autograd is off, the threads of torch are configured, and the resources are logged."""
+
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+import torch
+from loguru import logger
+
+
+def inference_context():
+    """`torch.inference_mode` if the version of torch has it, otherwise `torch.no_grad`."""
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def peak_rss_mb() -> float:
+    """The peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class InferenceRuntime(object):
+    def __init__(self, num_threads=None, num_interop_threads=None):
+        """
+        Args:
+            num_threads: the number of intra-op threads of torch, the default of torch is kept if it is None.
+            num_interop_threads: the number of inter-op threads of torch, it can only be set before torch runs any
+                inter-op parallel work, the default of torch is kept if it is None.
+        """
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+        if num_interop_threads:
+            try:
+                torch.set_num_interop_threads(int(num_interop_threads))
+            except RuntimeError as e:
+                logger.warning(f'Failed to set the number of inter-op threads: {e}')
+
+        # the seconds per item and the peak RSS in MB after the last run
+        self.latency = None
+        self.peak_rss = None
+
+    @contextmanager
+    def run(self, num_items):
+        """Run the block in the inference context, and log the latency per item and the peak memory."""
+        beg = time.time()
+        with inference_context():
+            yield
+        elapsed = time.time() - beg
+        self.latency = elapsed / max(num_items, 1)
+        self.peak_rss = peak_rss_mb()
+        logger.debug(f'Processed {num_items} item(s) in {elapsed:.2f} seconds ({self.latency * 1000:.1f} ms per item) '
+                     f'with {torch.get_num_threads()} thread(s), peak RSS: {self.peak_rss:.1f} MB')
@@ -12,21 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import csv
 import os
-import time
-from os.path import isdir
-from typing import List
 
 from loguru import logger
 
 from entity.entry import Entry
 from entity.pull_request import PullRequest
 from summarizer.base import Summarizer
+from summarizer.pg_network.cache import SummaryCache, cache_key, cache_prefix
+from summarizer.pg_network.dataset.batcher import Example
+from summarizer.pg_network.dataset.data import Vocab, article2arrays, pr2article, pr2words
 from summarizer.pg_network.decode import BeamSearch
-from summarizer.pg_network.params import Params
+from summarizer.pg_network.dedup import group_duplicates
+from summarizer.pg_network.params import PARAMS, Params
+from summarizer.pg_network.runtime import InferenceRuntime
 
-TMP_DIR = '/tmp/deeprelease'
 MODEL_PATH = '/models/pg_network'
 
 
@@ -37,16 +37,50 @@ class EntrySummarizer(Summarizer):
         if not os.path.exists(self.model_path):
             logger.error(f'The Discriminator model file {self.model_path} does not exist')
             exit(1)
-        if isdir(TMP_DIR) is False:
-            os.mkdir(TMP_DIR)
 
-    def summarize(self, items: [PullRequest]) -> [Entry]:
-        data_file_name = f'{TMP_DIR}/input_{time.time()}.csv'
-        logger.debug(f'Saving input to {data_file_name}')
+        self.params = Params(**{k: v for k, v in kwargs.items() if k in PARAMS})
+        self.beam_search = BeamSearch(self.params, self.model_path, ngram_filter=int(kwargs.get('ngram_filter', 1)))
+        self.vocab = self.beam_search.vocab
+        self.runtime = InferenceRuntime(num_threads=kwargs.get('num_threads'),
+                                        num_interop_threads=kwargs.get('num_interop_threads'))
+        logger.debug(f'Cold start: loading the summarization model took {self.beam_search.load_time:.2f} seconds')
+
+        # the PRs of identical articles are decoded once, and the ones of near-duplicate articles too if the
+        # threshold of their similarity is set, see `group_duplicates`
+        self.near_duplicate_threshold = float(kwargs.get('near_duplicate_threshold', 0))
+        # the indices of the PRs of the last `decode` call whose summaries are cut short by a deadline, the numbers of
+        # the PRs are not unique across repos
+        self.truncated = []
+
+        # the summaries are cached if cache_path is set, see `cache_key`
+        self.cache = None
+        if kwargs.get('cache_path'):
+            self.cache = SummaryCache(kwargs['cache_path'], max_size_mb=kwargs.get('cache_size_mb', 64))
+            self.cache_prefix = cache_prefix(self.cache.model_digest(self.model_path), self.params,
+                                             self.beam_search.ngram_filter, self.near_duplicate_threshold)
+
+    def cache_key(self, pr: PullRequest) -> str:
+        """The hash of the article of the PR, the digest of the model, and the hyper-parameters of decoding."""
+        return cache_key(self.cache_prefix, self.preprocess(pr))
 
-        rows = self.save_input_to_csv(items, data_file_name)
-        abstracts = self.decode(data_file_name, self.model_path)
+    def summarize(self, items: [PullRequest]) -> [Entry]:
+        with self.runtime.run(len(items)):
+            if self.cache is None:
+                abstracts = self.decode(items)
+            else:
+                keys = [self.cache_key(pr) for pr in items]
+                abstracts = self.cache.get_many(keys)
+                misses = [i for i, abstract in enumerate(abstracts) if abstract is None]
+                logger.debug(f'{len(items) - len(misses)} of {len(items)} summaries are cached')
+                for i, abstract in zip(misses, self.decode([items[i] for i in misses])):
+                    abstracts[i] = abstract
+                # the summaries cut short by a deadline are not cached, they are decoded again next time
+                truncated = set(self.truncated)
+                decoded = [i for j, i in enumerate(misses) if j not in truncated]
+                self.cache.put_many([keys[i] for i in decoded], [abstracts[i] for i in decoded])
         logger.debug(f'Model output: {abstracts}')
+        if self.beam_search.first_output_time is not None:
+            logger.debug(f'Warm start: the first PR is summarized in {self.beam_search.first_output_time:.2f} seconds')
 
         if len(items) != len(abstracts):
             logger.exception(
@@ -54,30 +88,45 @@ class EntrySummarizer(Summarizer):
 
         entries = []
         for i in range(len(abstracts)):
-            entries.append(Entry(rows[i][0], abstracts[i]))
+            entries.append(Entry(items[i].id, abstracts[i]))
         return entries
 
-    def save_input_to_csv(self, items: [PullRequest], filename: str) -> List[List[str]]:
-        rows = []
-
-        for pr in items:
-            article = self.preprocess(pr)
-            rows.append([pr.id, '', article])
-
-        with open(filename, 'w') as f:
-            writer = csv.writer(f)
-            writer.writerow(['id', 'abstract', 'article'])
-            writer.writerows(rows)
-
-        return rows
+    def decode(self, items: [PullRequest]) -> [str]:
+        """Decode a representative PR of each group of duplicate articles, its summary is the one of the group."""
+        groups = group_duplicates([self.preprocess(pr) for pr in items], self.near_duplicate_threshold)
+        if len(groups) < len(items):
+            logger.debug(f'{len(items) - len(groups)} model calls are avoided, {len(items)} PRs have {len(groups)} '
+                         f'distinct articles')
+        examples = [self.encode(items[group[0]], self.params, self.vocab) for group in groups]
+        summaries = self.beam_search.decode_examples(examples)
+
+        abstracts = [None] * len(items)
+        truncated = set(self.beam_search.truncated)
+        self.truncated = []
+        for j, (group, summary) in enumerate(zip(groups, summaries)):
+            for i in group:
+                abstracts[i] = summary
+            if j in truncated:
+                self.truncated.extend(group)
+        return abstracts
 
     @staticmethod
     def preprocess(pr: PullRequest) -> str:
-        lst = [' '.join(pr.title), ' '.join(pr.description), ' '.join(pr.commit_messages)]
-        return ' [sep] '.join(lst)
+        return pr2article(pr)
+
+    @staticmethod
+    def preprocess_words(pr: PullRequest) -> [str]:
+        """The words of the article returned by `preprocess`, without joining and splitting them again."""
+        return pr2words(pr)
 
     @staticmethod
-    def decode(data_file, model_path, ngram_filter=1):
-        params = Params()
-        decode_processor = BeamSearch(params, model_path, data_file=data_file, ngram_filter=ngram_filter)
-        return decode_processor.decode()
+    def encode(pr: PullRequest, params: Params, vocab: Vocab) -> Example:
+        """
+        Map the article of the PR to vocab ids and article OOVs directly, skipping the CSV round trip.
+
+        The encoder input of the returned example is identical to the one of
+        `Example(params, pr.id, EntrySummarizer.preprocess(pr), '', vocab)`.
+        """
+        words = EntrySummarizer.preprocess_words(pr)[:params.max_enc_steps]
+        enc_input, enc_input_extend_vocab, article_oovs = article2arrays(words, vocab)
+        return Example.from_ids(params, pr.id, enc_input, enc_input_extend_vocab, article_oovs, vocab)
@@ -0,0 +1,96 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from summarizer.pg_network.backend import EagerBackend, create_backend
+from summarizer.pg_network.decode import BeamSearch
+from summarizer.pg_network.export import export
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+from summarizer.pg_network.test_decode import make_examples
+from summarizer.pg_network.test_pointer_model import decoder_inputs
+
+
+def optional(backend):
+    # the onnx backend needs onnxruntime, which is optional
+    if backend == 'onnx':
+        pytest.importorskip('onnxruntime')
+    return backend
+
+
+@pytest.mark.parametrize("backend", ['torchscript', 'onnx'])
+@pytest.mark.parametrize("pointer_gen,is_coverage,num_extend", [(True, False, 3), (True, False, 0),
+                                                                (True, True, 2), (False, False, 0)])
+def test_backend(backend, pointer_gen, is_coverage, num_extend):
+    torch.manual_seed(0)
+    params = Params(pointer_gen=pointer_gen, is_coverage=is_coverage, backend=optional(backend))
+    model = PointerEncoderDecoder(params, None, is_eval=True)
+    eager, traced = EagerBackend(params, model), create_backend(params, model)
+
+    # the sizes differ from the ones of tracing
+    enc_batch = torch.randint(4, params.vocab_size, (3, 30))
+    enc_lens = torch.LongTensor([30, 17, 1]).numpy()
+    inputs = decoder_inputs(params, 12, 30, num_extend)
+    if not pointer_gen:
+        inputs = inputs[:-3] + (None, None, None)
+    with torch.no_grad():
+        expected, actual = eager.encode(enc_batch, enc_lens), traced.encode(enc_batch, enc_lens)
+        assert torch.allclose(expected[0], actual[0], atol=1e-5)
+        assert torch.allclose(expected[1], actual[1], atol=1e-5)
+        assert torch.allclose(torch.cat(expected[2]), torch.cat(actual[2]), atol=1e-5)
+
+        expected, actual = eager.step(*inputs), traced.step(*inputs)
+    assert torch.allclose(expected[0].exp(), actual[0].exp(), atol=1e-4)
+    assert torch.allclose(torch.cat(expected[1]), torch.cat(actual[1]), atol=1e-5)
+    for i in (2, 3, 4):
+        assert (actual[i] is None) if expected[i] is None else torch.allclose(expected[i], actual[i], atol=1e-5)
+
+
+@pytest.mark.parametrize("is_coverage", [False, True])
+def test_torchscript_decode(is_coverage):
+    torch.manual_seed(0)
+    params = Params(max_dec_steps=20, is_coverage=is_coverage, decode_batch_size=4)
+    beam_search = BeamSearch(params, None, ngram_filter=1)
+    examples = make_examples(params, beam_search.vocab, 10)
+    expected = beam_search.decode_examples(examples)
+
+    beam_search.backend = create_backend(Params(max_dec_steps=20, is_coverage=is_coverage, decode_batch_size=4,
+                                                backend='torchscript'), beam_search.model)
+    assert beam_search.decode_examples(examples) == expected
+
+
+@pytest.mark.parametrize("backend", ['torchscript', 'onnx'])
+def test_export(backend, tmp_path):
+    torch.manual_seed(0)
+    model_path = str(tmp_path / 'model.pt')
+    model = PointerEncoderDecoder(Params(), None, is_eval=True)
+    torch.save({'encoder_state_dict': model.encoder.state_dict(), 'decoder_state_dict': model.decoder.state_dict()},
+               model_path)
+    export_dir = str(tmp_path / 'export')
+    paths = export(model_path, export_dir, torchscript=backend == 'torchscript', onnx=optional(backend) == 'onnx')
+    assert len(paths) == 2
+
+    params = Params(backend=backend, export_dir=export_dir)
+    loaded = BeamSearch(params, model_path).backend
+    enc_batch = torch.randint(4, params.vocab_size, (2, 10))
+    with torch.no_grad():
+        expected = model.encoder(enc_batch, [10, 6])[1]
+        assert torch.allclose(loaded.encode(enc_batch, [10, 6])[1], expected, atol=1e-5)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend(Params(backend='tensorrt'), None)
@@ -0,0 +1,123 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import torch
+
+from entity.pull_request import PullRequest
+from summarizer.pg_network.cache import SummaryCache, file_digest
+from summarizer.pg_network.checkpoint import save_weights
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+from summarizer.pg_network.summarizer import EntrySummarizer
+
+
+def test_summary_cache(tmp_path):
+    path = str(tmp_path / 'cache' / 'summaries.db')
+    # room for three entries of 4 + 20 bytes
+    cache = SummaryCache(path, max_size_mb=80 / 1024 / 1024)
+    cache.put_many(['key0', 'key1'], ['a' * 20, 'b' * 20])
+    assert cache.get_many(['key1', 'key2', 'key0']) == ['b' * 20, None, 'a' * 20]
+
+    # key1 is the least recently used one
+    cache.get_many(['key0'])
+    cache.put_many(['key2', 'key3'], ['c' * 20, 'd' * 20])
+    assert cache.get_many(['key0', 'key1', 'key2', 'key3']) == ['a' * 20, None, 'c' * 20, 'd' * 20]
+    assert cache.size() == (3, 3 * 24)
+    cache.close()
+
+    # the cache is persistent
+    cache = SummaryCache(path)
+    assert cache.get_many(['key3']) == ['d' * 20]
+
+
+def test_model_digest(tmp_path):
+    model_path = str(tmp_path / 'model')
+    with open(model_path, 'wb') as f:
+        f.write(b'weights')
+    cache = SummaryCache(str(tmp_path / 'summaries.db'))
+    assert cache.model_digest(model_path) == file_digest(model_path)
+
+    with open(model_path, 'wb') as f:
+        f.write(b'new weights')
+    os.utime(model_path, ns=(0, 1))
+    assert cache.model_digest(model_path) == file_digest(model_path)
+
+
+def make_prs(n):
+    prs = []
+    for i in range(n):
+        pr = PullRequest(f'https://github.com/owner/repo/pull/{i}')
+        pr.set_data({'title': f'fix the bug {i}', 'desc': 'the bug is fixed', 'commits': ['fix']})
+        prs.append(pr)
+    return prs
+
+
+def test_summarizer_cache(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    model_path = str(tmp_path / 'model.weights')
+    save_weights({'encoder_state_dict': model.encoder.state_dict(),
+                  'decoder_state_dict': model.decoder.state_dict()}, model_path)
+    cache_path = str(tmp_path / 'summaries.db')
+    summarizer = EntrySummarizer(model_path=model_path, cache_path=cache_path, max_dec_steps='10')
+    expected = [entry.body for entry in summarizer.summarize(make_prs(3))]
+
+    decoded = []
+    summarizer = EntrySummarizer(model_path=model_path, cache_path=cache_path, max_dec_steps='10')
+    decode = summarizer.decode
+    summarizer.decode = lambda items: decoded.extend(items) or decode(items)
+    actual = [entry.body for entry in summarizer.summarize(make_prs(4))]
+    # only the new PR is decoded
+    assert [pr.id for pr in decoded] == [3]
+    assert actual[:3] == expected
+
+    # the summaries of other decoding hyper-parameters are not reused
+    pr = make_prs(1)[0]
+    keys = {EntrySummarizer(model_path=model_path, cache_path=cache_path, **kwargs).cache_key(pr)
+            for kwargs in ({'max_dec_steps': '10'}, {}, {'max_dec_steps': '10', 'ngram_filter': '0'})}
+    assert len(keys) == 3
+
+
+def test_truncated_not_cached(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    model_path = str(tmp_path / 'model.weights')
+    save_weights({'encoder_state_dict': model.encoder.state_dict(),
+                  'decoder_state_dict': model.decoder.state_dict()}, model_path)
+    summarizer = EntrySummarizer(model_path=model_path, cache_path=str(tmp_path / 'summaries.db'), max_dec_steps='10')
+
+    # the PRs of the same number in two repos, and a duplicate of the first one
+    prs = []
+    for url, title in [('https://github.com/foo/repo/pull/5', 'fix the bug'),
+                       ('https://github.com/bar/repo/pull/5', 'add a feature'),
+                       ('https://github.com/foo/repo/pull/6', 'fix the bug')]:
+        pr = PullRequest(url)
+        pr.set_data({'title': title, 'desc': 'the description', 'commits': ['commit']})
+        prs.append(pr)
+
+    # the first article is cut short by a deadline
+    decode_examples = summarizer.beam_search.decode_examples
+
+    def cut_short(examples):
+        hyps = decode_examples(examples)
+        summarizer.beam_search.truncated = [0]
+        return hyps
+
+    summarizer.beam_search.decode_examples = cut_short
+    summarizer.summarize(prs)
+    assert summarizer.truncated == [0, 2]
+    cached = summarizer.cache.get_many([summarizer.cache_key(pr) for pr in prs])
+    assert cached[0] is None and cached[2] is None and cached[1] is not None
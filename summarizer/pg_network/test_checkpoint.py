@@ -0,0 +1,103 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+
+import pytest
+import torch
+
+from summarizer.pg_network.checkpoint import convert, load_state, save_weights
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+
+
+def checkpoint(model):
+    # a training checkpoint has more than the weights
+    return {'iter': 100, 'encoder_state_dict': model.encoder.state_dict(),
+            'decoder_state_dict': model.decoder.state_dict(),
+            'optimizer': {'state': {0: {'exp_avg': torch.zeros(3)}}, 'param_groups': [{'lr': 0.1}]}}
+
+
+def test_weights_file(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    state = checkpoint(model)
+    state['encoder_state_dict']['extra.bf16'] = torch.randn(3, 2).bfloat16()
+    state['encoder_state_dict']['extra.bool'] = torch.tensor([True, False, True])
+    state['decoder_state_dict']['extra.empty'] = torch.zeros(0, 4)
+    checkpoint_path, weights_path = str(tmp_path / 'model.pt'), str(tmp_path / 'model.weights')
+    torch.save(state, checkpoint_path)
+    save_weights(state, weights_path)
+
+    for path in (checkpoint_path, weights_path):
+        loaded = load_state(path)
+        for key in ('encoder_state_dict', 'decoder_state_dict'):
+            assert loaded[key].keys() == state[key].keys()
+            for name, tensor in state[key].items():
+                assert torch.equal(loaded[key][name], tensor)
+    # the shared embedding is stored once
+    assert loaded['decoder_state_dict']['embedding.weight'] is loaded['encoder_state_dict']['embedding.weight']
+    assert 'optimizer' not in loaded
+
+
+def test_load_model(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    weights_path = str(tmp_path / 'model.weights')
+    save_weights(checkpoint(model), weights_path)
+
+    loaded = PointerEncoderDecoder(Params(), weights_path, is_eval=True)
+    for expected, actual in zip(model.parameters, loaded.parameters):
+        assert torch.equal(expected, actual)
+    # the embedding is still tied after the data of the parameters are replaced
+    assert loaded.decoder.embedding.weight is loaded.encoder.embedding.weight
+    enc_batch = torch.randint(4, 100, (2, 10))
+    with torch.no_grad():
+        assert torch.equal(model.encoder(enc_batch, [10, 4])[0], loaded.encoder(enc_batch, [10, 4])[0])
+
+
+def test_load_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_state(str(tmp_path / 'missing'))
+
+    path = str(tmp_path / 'model.weights')
+    save_weights(checkpoint(PointerEncoderDecoder(Params(), None)), path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    for corrupt in (data[:len(data) // 2], data[:100], b'not a model'):
+        with open(path, 'wb') as f:
+            f.write(corrupt)
+        with pytest.raises(RuntimeError, match='Failed to load the model file'):
+            load_state(path)
+
+
+def test_untrusted_checkpoint(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    state = checkpoint(model)
+    # an object which is not allowed by `weights_only`
+    state['args'] = argparse.Namespace(lr=0.1)
+    path = str(tmp_path / 'model.pt')
+    torch.save(state, path)
+
+    with pytest.raises(RuntimeError, match='trust_checkpoint'):
+        load_state(path)
+    assert load_state(path, trusted=True)['args'].lr == 0.1
+    loaded = PointerEncoderDecoder(Params(trust_checkpoint='true'), path, is_eval=True)
+    assert torch.equal(loaded.encoder.embedding.weight, model.encoder.embedding.weight)
+
+    weights_path = str(tmp_path / 'model.weights')
+    convert(path, weights_path, trusted=True)
+    assert torch.equal(load_state(weights_path)['encoder_state_dict']['embedding.weight'],
+                       model.encoder.embedding.weight)
@@ -0,0 +1,229 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import multiprocessing
+import random
+
+import pytest
+import torch
+
+from summarizer.pg_network import decode
+from summarizer.pg_network.dataset import data
+from summarizer.pg_network.dataset.batcher import Batch, Example
+from summarizer.pg_network.decode import BeamSearch
+from summarizer.pg_network.params import Params
+
+
+def make_examples(params, vocab, n):
+    rnd = random.Random(n)
+    words = [vocab.id2word(i) for i in range(4, 200)] + ['foobarqux', 'quxbarfoo']
+    return [Example(params, i, ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 30))), '', vocab)
+            for i in range(n)]
+
+
+def reference_outputs(beam_search, examples):
+    params, vocab = beam_search.params, beam_search.vocab
+    outputs = []
+    for ex in examples:
+        best_summary = beam_search.beam_search(Batch(params, [ex], vocab, 1))
+        outputs.append(beam_search.to_text(best_summary.tokens[1:], ex.article_oovs if params.pointer_gen else None))
+    return outputs
+
+
+# a bias of the stop token makes some hypotheses finish before the others
+@pytest.mark.parametrize("ngram_filter,is_coverage,stop_bias", [(1, False, 0), (0, False, 0), (1, True, 0),
+                                                                (1, False, 8), (0, True, 8)])
+@pytest.mark.parametrize("decode_batch_size", [1, 3, 16])
+def test_tensor_beam_search(ngram_filter, is_coverage, stop_bias, decode_batch_size):
+    # the weights are random, the outputs are meaningless but deterministic
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, is_coverage=is_coverage,
+                                    decode_batch_size=decode_batch_size), None, ngram_filter=ngram_filter)
+    beam_search.model.decoder.V2.bias.data[beam_search.vocab.word2id(data.STOP_DECODING)] += stop_bias
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    assert beam_search.decode_examples(examples) == reference_outputs(beam_search, examples)
+
+
+def test_block_3grams():
+    rnd = random.Random(0)
+    tokens = [[rnd.randint(0, 5) for _ in range(steps)] for steps in (1, 2, 3, 20, 20, 20)]
+    for hyp in tokens:
+        # pad the shorter hypotheses at the front, which must not create 3-grams ending with the last two tokens
+        hyp[:0] = [9] * (20 - len(hyp))
+    log_probs = torch.zeros((len(tokens), 10))
+    BeamSearch.block_3grams(torch.LongTensor(tokens), log_probs)
+    for hyp, row in zip(tokens, log_probs.tolist()):
+        ngrams = {tuple(hyp[i:i + 3]) for i in range(len(hyp) - 2)}
+        assert [t for t in range(10) if row[t] == float('-inf')] == \
+               [t for t in range(10) if (hyp[-2], hyp[-1], t) in ngrams]
+
+
+def test_params():
+    params = Params(beam_size='8', pointer_gen='False', lr='0.5')
+    assert (params.beam_size, params.pointer_gen, params.lr) == (8, False, 0.5)
+    assert Params().beam_size == 4
+    with pytest.raises(KeyError):
+        Params(foo=1)
+
+
+@pytest.mark.parametrize("num_workers", [2, 3])
+def test_decode_in_workers(num_workers):
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, decode_batch_size=4), None, ngram_filter=1)
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    expected = beam_search.decode_examples(examples)
+
+    beam_search.params.num_workers = num_workers
+    assert beam_search.decode_examples(examples) == expected
+    assert beam_search.first_output_time is not None
+
+
+# the beam search of `test_decode_in_daemon`, inherited by the forked worker
+_beam_search = None
+
+
+def decode_in_daemon(examples):
+    return _beam_search.decode_examples(examples)
+
+
+def test_decode_in_daemon():
+    global _beam_search
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, decode_batch_size=4), None, ngram_filter=1)
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    expected = beam_search.decode_examples(examples)
+
+    # the workers of a pool, e.g., the ones of bulk, are daemonic and cannot fork workers of their own
+    beam_search.params.num_workers = 2
+    _beam_search = beam_search
+    try:
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            assert pool.apply(decode_in_daemon, (examples,)) == expected
+    finally:
+        _beam_search = None
+
+
+def test_dec_steps_ratio():
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, dec_steps_ratio=0.5), None, ngram_filter=1)
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    hyps = beam_search.decode_examples(examples)
+    assert hyps == reference_outputs(beam_search, examples)
+    for ex, hyp in zip(examples, hyps):
+        assert len(hyp.split()) <= math.ceil(0.5 * ex.enc_len)
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_deadlines(num_workers):
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, decode_batch_size=4, num_workers=num_workers), None,
+                             ngram_filter=1)
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    expected = beam_search.decode_examples(examples)
+    assert beam_search.truncated == []
+
+    # the deadlines have passed after the first step, the examples stop after min_dec_steps
+    for timeouts in ({'pr_timeout': 1e-9}, {'run_timeout': 1e-9}):
+        beam_search.params = Params(max_dec_steps=20, decode_batch_size=4, num_workers=num_workers, **timeouts)
+        hyps = beam_search.decode_examples(examples)
+        assert beam_search.truncated
+        for i, (hyp, full) in enumerate(zip(hyps, expected)):
+            if i in beam_search.truncated:
+                assert len(hyp.split()) <= beam_search.params.min_dec_steps
+            else:
+                assert hyp == full
+
+
+def test_deadline_per_example(monkeypatch):
+    torch.manual_seed(0)
+    params = Params(max_dec_steps=20, decode_batch_size=4)
+    beam_search = BeamSearch(params, None, ngram_filter=1)
+    words = [beam_search.vocab.id2word(i) for i in range(4, 40)]
+    # a long article and three short ones of the same batch, the short ones stop after 3 steps by dec_steps_ratio
+    examples = [Example(params, i, ' '.join(words[i:i + n]), '', beam_search.vocab)
+                for i, n in enumerate([3, 30, 3, 3])]
+    expected = beam_search.decode_examples(examples)
+
+    # a clock which ticks once a call, i.e., about once a step
+    ticks = iter(range(1000))
+    monkeypatch.setattr(decode, 'time', type('Clock', (), {'time': staticmethod(lambda: next(ticks))}))
+    beam_search.params = Params(max_dec_steps=20, decode_batch_size=4, pr_timeout=8)
+    hyps = beam_search.decode_examples(examples)
+    # only the long example runs out of its deadline
+    assert beam_search.truncated == [1]
+    assert len(hyps[1].split()) < len(expected[1].split())
+    assert [hyps[i] for i in (0, 2, 3)] == [expected[i] for i in (0, 2, 3)]
+
+
+def test_score_bound():
+    beam_search = BeamSearch(Params(), None)
+    rnd = random.Random(0)
+    for _ in range(100):
+        log_probs = [0.0] + [-rnd.expovariate(1) for _ in range(rnd.randint(0, 10))]
+        max_len = len(log_probs) - 1 + rnd.randint(0, 10)
+        bound = beam_search.score_bound(sum(log_probs), len(log_probs), max_len)
+        # no extension of the hypothesis of at most max_len steps has a better average
+        for steps in range(len(log_probs), max_len + 1):
+            extension = log_probs + [-rnd.expovariate(10) for _ in range(steps + 1 - len(log_probs))]
+            assert sum(extension) / len(extension) <= bound
+
+
+@pytest.mark.parametrize("is_coverage", [False, True])
+def test_early_stop(is_coverage):
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, is_coverage=is_coverage, early_stop='none'), None,
+                             ngram_filter=1)
+    # the stop token finishes some hypotheses early, so that there are results to compare with
+    beam_search.model.decoder.V2.bias.data[beam_search.vocab.word2id(data.STOP_DECODING)] += 8
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+
+    rows = []
+    step = beam_search.backend.step
+    beam_search.backend.step = lambda y_t_1, *inputs: rows.append(len(y_t_1)) or step(y_t_1, *inputs)
+    expected = beam_search.decode_examples(examples)
+    full_rows = sum(rows)
+
+    rows.clear()
+    beam_search.params.early_stop = 'exact'
+    assert beam_search.decode_examples(examples) == expected
+    assert reference_outputs(beam_search, examples) == expected
+    assert sum(rows) <= full_rows
+
+    # the outputs may change, but they are the same as the ones of the reference implementation
+    rows.clear()
+    beam_search.params.early_stop = 'length'
+    assert beam_search.decode_examples(examples) == reference_outputs(beam_search, examples)
+    assert sum(rows) < full_rows
+
+    with pytest.raises(ValueError):
+        BeamSearch(Params(early_stop='foo'), None)
+
+
+@pytest.mark.parametrize("pointer_gen", [True, False])
+def test_shortlist(pointer_gen):
+    torch.manual_seed(0)
+    beam_search = BeamSearch(Params(max_dec_steps=20, shortlist_size=50, pointer_gen=pointer_gen,
+                                    decode_batch_size=4), None, ngram_filter=1)
+    examples = make_examples(beam_search.params, beam_search.vocab, 10)
+    hyps = beam_search.decode_examples(examples)
+    assert hyps == reference_outputs(beam_search, examples)
+    # the words are the frequent ones, or the ones of the article
+    for ex, hyp in zip(examples, hyps):
+        words = ex.original_article.split()
+        for word in hyp.split():
+            assert beam_search.vocab.word2id(word) < 50 or word in words
+
+    with pytest.raises(ValueError):
+        BeamSearch(Params(shortlist_size=50, backend='torchscript'), None)
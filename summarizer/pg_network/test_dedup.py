@@ -0,0 +1,82 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import torch
+
+from entity.pull_request import PullRequest
+from summarizer.pg_network.checkpoint import save_weights
+from summarizer.pg_network.dedup import MinHashIndex, group_duplicates
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+from summarizer.pg_network.summarizer import EntrySummarizer
+
+
+def bump(package, old, new):
+    return f'bump {package} from {old} to {new} [sep] bumps {package} from {old} to {new} . ' \
+           f'release notes sourced from {package} releases . commits see full diff in compare view . ' \
+           f'dependabot will resolve any conflicts with this pr as long as you do not alter it yourself'
+
+
+def test_group_exact_duplicates():
+    articles = ['fix the bug', 'add a feature', 'fix the bug', 'fix the bug .', 'add a feature']
+    assert group_duplicates(articles) == [[0, 2], [1, 4], [3]]
+    assert group_duplicates([]) == []
+
+
+def test_group_near_duplicates():
+    articles = [bump('lodash', '4.17.15', '4.17.21'), 'fix the crash when the config file is missing',
+                bump('lodash', '4.17.15', '4.17.20'), bump('lodash', '4.17.15', '4.17.21'),
+                bump('axios', '0.21.1', '0.21.2'), '']
+    assert group_duplicates(articles) == [[0, 3], [1], [2], [4], [5]]
+    assert group_duplicates(articles, threshold=0.6) == [[0, 2, 3], [1], [4], [5]]
+
+
+def test_minhash_similarity():
+    rnd = random.Random(0)
+    words = [f'w{i}' for i in range(1000)]
+    index = MinHashIndex(threshold=0.5, shingle_size=1, num_perm=256, bands=32)
+    base = set(rnd.sample(words, 100))
+    for key, overlap in enumerate((90, 60, 30)):
+        other = set(rnd.sample(sorted(base), overlap)) | set(rnd.sample(sorted(set(words) - base), 100 - overlap))
+        jaccard = len(base & other) / len(base | other)
+        estimate = float((index.signature(' '.join(base)) == index.signature(' '.join(other))).mean())
+        assert abs(estimate - jaccard) < 0.1
+        index.add(key, index.signature(' '.join(other)))
+    # the most similar one of at least the threshold
+    assert index.query(index.signature(' '.join(base))) == 0
+    assert MinHashIndex(threshold=0.95).query(index.signature(' '.join(base))) is None
+
+
+def test_summarizer_dedup(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    model_path = str(tmp_path / 'model.weights')
+    save_weights({'encoder_state_dict': model.encoder.state_dict(),
+                  'decoder_state_dict': model.decoder.state_dict()}, model_path)
+    prs = []
+    for i, title in enumerate(['fix the bug', 'add a feature', 'fix the bug']):
+        pr = PullRequest(f'https://github.com/owner/repo/pull/{i}')
+        pr.set_data({'title': title, 'desc': 'the change is tested', 'commits': ['fix']})
+        prs.append(pr)
+
+    summarizer = EntrySummarizer(model_path=model_path, max_dec_steps='10')
+    expected = [summarizer.beam_search.decode_examples([summarizer.encode(pr, summarizer.params, summarizer.vocab)])[0]
+                for pr in prs]
+    decoded = []
+    decode_examples = summarizer.beam_search.decode_examples
+    summarizer.beam_search.decode_examples = lambda examples: decoded.extend(examples) or decode_examples(examples)
+    assert [entry.body for entry in summarizer.summarize(prs)] == expected
+    assert [ex.id for ex in decoded] == [0, 1]
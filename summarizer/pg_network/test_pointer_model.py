@@ -0,0 +1,103 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+
+
+def decoder_inputs(params, batch_size, enc_len, num_extend):
+    enc_outputs = torch.randn(batch_size, enc_len, 2 * params.hidden_dim)
+    enc_features = torch.randn(batch_size, enc_len, 2 * params.hidden_dim)
+    enc_pad_mask = torch.ones(batch_size, enc_len)
+    enc_pad_mask[0, enc_len // 2:] = 0
+    extend_vocab_zeros = torch.zeros(batch_size, num_extend) if num_extend > 0 else None
+    enc_inps_extended = torch.randint(0, params.vocab_size + num_extend, (batch_size, enc_len))
+    s_t_1 = (torch.randn(1, batch_size, params.hidden_dim), torch.randn(1, batch_size, params.hidden_dim))
+    c_t_1 = torch.randn(batch_size, 1, 2 * params.hidden_dim)
+    y_t_1 = torch.randint(0, params.vocab_size, (batch_size,))
+    coverage_t = torch.rand(batch_size, enc_len) if params.is_coverage else None
+    return y_t_1, s_t_1, c_t_1, enc_outputs, enc_features, enc_pad_mask, extend_vocab_zeros, enc_inps_extended, \
+        coverage_t
+
+
+@pytest.mark.parametrize("pointer_gen,is_coverage,num_extend", [(True, False, 3), (True, False, 0),
+                                                                (True, True, 2), (False, False, 0)])
+def test_decoder_step(pointer_gen, is_coverage, num_extend):
+    torch.manual_seed(0)
+    params = Params(pointer_gen=pointer_gen, is_coverage=is_coverage)
+    decoder = PointerEncoderDecoder(params, None, is_eval=True).decoder
+    inputs = decoder_inputs(params, 8, 50, num_extend)
+    with torch.no_grad():
+        final_dist, s_t, c_t, attn_dist, coverage_t = decoder(*inputs)
+        log_probs, s_t_step, c_t_step, attn_dist_step, coverage_t_step = decoder.step(*inputs)
+
+    assert log_probs.size() == (8, params.vocab_size + num_extend)
+    assert torch.allclose(log_probs, torch.log(final_dist), atol=1e-5)
+    assert torch.equal(s_t[0], s_t_step[0]) and torch.equal(s_t[1], s_t_step[1])
+    assert torch.allclose(c_t, c_t_step, atol=1e-6)
+    assert torch.allclose(attn_dist, attn_dist_step, atol=1e-6)
+    if is_coverage:
+        assert torch.allclose(coverage_t, coverage_t_step, atol=1e-6)
+
+
+def test_quantize():
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(quantize=True), None, is_eval=True)
+    assert model.decoder.embedding.weight is model.encoder.embedding.weight
+    assert not any(isinstance(m, (torch.nn.Linear, torch.nn.LSTM)) for m in model.decoder.modules())
+
+    params = Params()
+    inputs = decoder_inputs(params, 4, 20, 2)
+    with torch.no_grad():
+        log_probs = model.decoder.step(*inputs)[0]
+    assert log_probs.size() == (4, params.vocab_size + 2)
+    assert torch.allclose(log_probs.exp().sum(-1), torch.ones(4), atol=1e-4)
+
+
+@pytest.mark.parametrize("pointer_gen,quantize", [(True, False), (False, False), (True, True)])
+def test_shortlist(pointer_gen, quantize):
+    torch.manual_seed(0)
+    params = Params(pointer_gen=pointer_gen, quantize=quantize)
+    model = PointerEncoderDecoder(params, None, is_eval=True)
+    inputs = decoder_inputs(params, 4, 20, 2 if pointer_gen else 0)
+    with torch.no_grad():
+        expected = model.decoder.step(*inputs)[0]
+
+        # the shortlist of the whole vocab is the same as the full projection
+        ids = torch.arange(params.vocab_size)
+        log_probs = model.decoder.step(*inputs, model.decoder.shortlist(ids) + (torch.zeros(4, len(ids)),))[0]
+        # the probabilities of 0 may be the smallest normal float, and the activations are not quantized for the
+        # shortlist, so that the log probabilities of the rare words differ more
+        assert torch.allclose(log_probs.exp(), expected.exp(), atol=1e-6 if quantize else 1e-7)
+
+        # the ids out of the shortlist or masked by their row are never generated
+        ids = torch.arange(0, params.vocab_size, 7)
+        mask = torch.zeros(4, len(ids))
+        mask[0, 1:] = float('-inf')
+        log_probs = model.decoder.step(*inputs, model.decoder.shortlist(ids) + (mask,))[0]
+    generated = log_probs[:, :params.vocab_size].exp()
+    if pointer_gen:
+        # the copied words of the article are not restricted
+        copied = torch.zeros_like(generated, dtype=torch.bool)
+        copied.scatter_(1, inputs[7].clamp(max=params.vocab_size - 1), True)
+        generated = generated.masked_fill(copied, 0)
+    outside = torch.ones(params.vocab_size, dtype=torch.bool)
+    outside[ids] = False
+    tiny = torch.finfo(generated.dtype).tiny
+    assert (generated[:, outside] <= tiny).all()
+    assert (generated[0, ids[1:]] <= tiny).all()
+    assert torch.allclose(log_probs.exp().sum(-1), torch.ones(4), atol=1e-4)
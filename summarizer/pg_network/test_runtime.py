@@ -0,0 +1,27 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+
+from summarizer.pg_network.runtime import InferenceRuntime, peak_rss_mb
+
+
+def test_inference_runtime():
+    runtime = InferenceRuntime(num_threads=torch.get_num_threads())
+    x = torch.ones(2, requires_grad=True)
+    with runtime.run(4):
+        y = x * 2
+    assert not y.requires_grad
+    assert runtime.latency >= 0
+    assert runtime.peak_rss == peak_rss_mb() > 0
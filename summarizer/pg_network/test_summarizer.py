@@ -14,7 +14,12 @@
 
 import unittest
 
+import numpy as np
+
 from entity.pull_request import PullRequest
+from summarizer.pg_network.dataset.batcher import Batch, Example
+from summarizer.pg_network.dataset.data import Vocab
+from summarizer.pg_network.params import Params
 from summarizer.pg_network.summarizer import EntrySummarizer
 from summarizer.pg_network.utils import all_same
 
@@ -43,3 +48,13 @@ class TestSummarizer(unittest.TestCase):
         entries = self.summarizer.summarize(prepare_data())
         self.assertEqual(len(entries), PR_NUM)
         self.assertTrue(all_same(entries))
+
+    def test_encode(self):
+        params = Params()
+        vocab = Vocab()
+        for pr in prepare_data():
+            expected = Batch(params, [Example(params, pr.id, self.summarizer.preprocess(pr), '', vocab)], vocab, 1)
+            actual = Batch(params, [self.summarizer.encode(pr, params, vocab)], vocab, 1)
+            self.assertTrue(np.array_equal(expected.enc_batch, actual.enc_batch))
+            self.assertTrue(np.array_equal(expected.enc_batch_extend_vocab, actual.enc_batch_extend_vocab))
+            self.assertEqual(expected.art_oovs, actual.art_oovs)
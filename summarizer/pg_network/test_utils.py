@@ -14,7 +14,7 @@
 
 import pytest
 
-from summarizer.pg_network.utils import all_same
+from summarizer.pg_network.utils import all_same, rouge, rouge_l, rouge_n
 
 
 @pytest.mark.parametrize("test_input,expected", [
@@ -25,3 +25,13 @@ from summarizer.pg_network.utils import all_same
 ])
 def test_all_same(test_input, expected):
     assert all_same(test_input) == expected
+
+
+def test_rouge():
+    assert rouge_n('a b c'.split(), 'a b c'.split(), 2) == rouge_l('a b c'.split(), 'a b c'.split()) == 1.0
+    assert rouge_n('a b'.split(), 'c d'.split(), 1) == rouge_l([], 'c d'.split()) == 0.0
+    # precision 2/4, recall 2/3
+    assert rouge_n('a b x y'.split(), 'a b c'.split(), 1) == pytest.approx(4 / 7)
+    # the LCS of "a x b c" and "a b y c" is "a b c"
+    assert rouge_l('a x b c'.split(), 'a b y c'.split()) == pytest.approx(0.75)
+    assert rouge(['A b', 'c'], ['a b', 'd']) == {'rouge_1': 0.5, 'rouge_2': 0.5, 'rouge_l': 0.5}
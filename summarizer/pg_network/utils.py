@@ -15,10 +15,9 @@
 import re
 import sys
 import csv
-import time
+from collections import Counter
 from typing import Any
 
-import torch
 from nltk import sent_tokenize
 
 csv.field_size_limit(sys.maxsize)
@@ -45,20 +44,71 @@ def prepare_rouge_text(text):
     return text
 
 
-def try_load_state(model_file_path):
-    counter = 0
-    state = None
-    while True:
-        if counter >= 10:
-            raise FileNotFoundError
-        try:
-            state = torch.load(model_file_path, map_location=lambda storage, location: storage)
-        except Exception:
-            time.sleep(30)
-            counter += 1
-            continue
-        break
-    return state
+def ngrams(tokens: [str], n: int) -> Counter:
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def f1(overlap: int, hyp_count: int, ref_count: int) -> float:
+    if overlap == 0:
+        return 0.0
+    precision = overlap / hyp_count
+    recall = overlap / ref_count
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_n(hyp: [str], ref: [str], n: int) -> float:
+    """
+    The ROUGE-N F1 score of a hypothesis against a reference.
+
+    Args:
+        hyp: the tokens of the hypothesis.
+        ref: the tokens of the reference.
+        n: the size of the n-grams.
+
+    Returns:
+        The F1 score.
+    """
+    hyp_ngrams, ref_ngrams = ngrams(hyp, n), ngrams(ref, n)
+    overlap = sum((hyp_ngrams & ref_ngrams).values())
+    return f1(overlap, sum(hyp_ngrams.values()), sum(ref_ngrams.values()))
+
+
+def rouge_l(hyp: [str], ref: [str]) -> float:
+    """
+    The ROUGE-L F1 score of a hypothesis against a reference, i.e., based on their longest common subsequence.
+
+    Args:
+        hyp: the tokens of the hypothesis.
+        ref: the tokens of the reference.
+
+    Returns:
+        The F1 score.
+    """
+    # the LCS lengths of the prefixes of hyp and the previous prefix of ref
+    prev = [0] * (len(hyp) + 1)
+    for r in ref:
+        cur = [0]
+        for i, h in enumerate(hyp):
+            cur.append(prev[i] + 1 if h == r else max(prev[i + 1], cur[i]))
+        prev = cur
+    return f1(prev[-1], len(hyp), len(ref))
+
+
+def rouge(hyps: [str], refs: [str]) -> dict:
+    """
+    The average ROUGE-1, ROUGE-2 and ROUGE-L F1 scores of the hypotheses against the references, which are
+    tokenized by whitespace.
+
+    Returns:
+        A dict of the scores.
+    """
+    scores = {'rouge_1': 0.0, 'rouge_2': 0.0, 'rouge_l': 0.0}
+    for hyp, ref in zip(hyps, refs):
+        hyp, ref = hyp.lower().split(), ref.lower().split()
+        scores['rouge_1'] += rouge_n(hyp, ref, 1)
+        scores['rouge_2'] += rouge_n(hyp, ref, 2)
+        scores['rouge_l'] += rouge_l(hyp, ref)
+    return {k: v / max(len(hyps), 1) for k, v in scores.items()}
 
 
 def sentence_end(text):
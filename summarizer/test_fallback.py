@@ -0,0 +1,86 @@
+# Copyright 2022 Hoshea Jiang
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+
+from entity.pull_request import PullRequest
+from summarizer.extractive.summarizer import ExtractiveSummarizer
+from summarizer.fallback import SECONDS_PER_STEP, FallbackSummarizer
+from summarizer.pg_network.checkpoint import save_weights
+from summarizer.pg_network.params import Params
+from summarizer.pg_network.pointer_model import PointerEncoderDecoder
+from summarizer.pg_network.summarizer import EntrySummarizer
+
+
+def make_prs(n, words=10):
+    prs = []
+    for i in range(n):
+        pr = PullRequest(f'https://github.com/owner/repo/pull/{i}')
+        pr.set_data({'title': f'fix the bug {i}', 'desc': ' '.join(['word'] * words), 'commits': ['fix']})
+        prs.append(pr)
+    return prs
+
+
+def test_predict_seconds():
+    summarizer = FallbackSummarizer(seconds_per_step='0.5', max_dec_steps='20')
+    prs = make_prs(3)
+    enc_len = len(EntrySummarizer.preprocess_words(prs[0]))
+    assert enc_len < 20
+    assert summarizer.predict_seconds(prs) == 3 * enc_len * 0.5
+    # the decoding is bounded by max_dec_steps
+    assert summarizer.predict_seconds(make_prs(3, words=100)) == 3 * 20 * 0.5
+    # the duplicate articles are decoded once
+    assert summarizer.predict_seconds(prs[:1] * 3) == enc_len * 0.5
+
+
+def save_model(tmp_path):
+    torch.manual_seed(0)
+    model = PointerEncoderDecoder(Params(), None)
+    model_path = str(tmp_path / 'model.weights')
+    save_weights({'encoder_state_dict': model.encoder.state_dict(),
+                  'decoder_state_dict': model.decoder.state_dict()}, model_path)
+    return model_path
+
+
+def test_predict_duplicates_and_cached(tmp_path):
+    model_path = save_model(tmp_path)
+    cache_path = str(tmp_path / 'summaries.db')
+    options = {'model_path': model_path, 'cache_path': cache_path, 'max_dec_steps': '10', 'seconds_per_step': '1'}
+    prs = make_prs(4)
+    for pr in prs:
+        # near-duplicate articles of long descriptions
+        pr.description = [f'word{j}' for j in range(50)]
+    assert FallbackSummarizer(**options).predict_seconds(prs) == 4 * 10
+    # the near-duplicate articles are decoded once
+    assert FallbackSummarizer(near_duplicate_threshold='0.8', **options).predict_seconds(prs) == 10
+
+    # the cached summaries are not decoded
+    EntrySummarizer(**options).summarize(prs[:3])
+    assert FallbackSummarizer(**options).predict_seconds(prs) == 10
+
+
+def test_fallback(tmp_path):
+    model_path = save_model(tmp_path)
+
+    summarizer = FallbackSummarizer(model_path=model_path, max_dec_steps='10', latency_budget='0.1')
+    prs = make_prs(10)
+    assert [e.body for e in summarizer.summarize(prs)] == [e.body for e in ExtractiveSummarizer().summarize(prs)]
+    # the model is not loaded
+    assert summarizer.abstractive is None
+
+    entries = summarizer.summarize(prs[:1])
+    assert summarizer.abstractive is not None
+    assert [e.body for e in entries] == [e.body for e in summarizer.abstractive.summarize(prs[:1])]
+    # the prediction of the next runs is calibrated by this one
+    assert summarizer.seconds_per_step != SECONDS_PER_STEP
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import subprocess
+import sys
+
 import pytest
 
 from deeprelease import split_owner_repo, validate_date_format
@@ -35,3 +38,34 @@ def test_split_owner_repo(test_input, expected):
 ])
 def test_validate_date_format(date, expected):
     assert validate_date_format(date) == expected
+
+
+# a run of the extractive summarizer only, with a stub discriminator and collector
+EXTRACTIVE_RUN = """
+import sys
+import deeprelease
+from entity.category import Category, EntryCategory
+from entity.pull_request import PullRequest
+
+class Discriminator:
+    def __init__(self, **kwargs):
+        pass
+
+    def classify(self, items):
+        return [EntryCategory(pr.id, Category.BugFix) for pr in items]
+
+pr = PullRequest('https://github.com/owner/repo/pull/1')
+pr.set_data({'title': 'fix the bug', 'desc': 'the bug is fixed', 'commits': ['fix']})
+deeprelease.CategoryDiscriminator = Discriminator
+app = deeprelease.DeepRelease(config=sys.argv[1])
+app.collect = lambda *args, **kwargs: [pr]
+app.run('owner/repo', save_dir=sys.argv[2])
+assert 'torch' not in sys.modules, 'torch is imported'
+"""
+
+
+def test_extractive_run_without_torch(tmp_path):
+    config = tmp_path / 'deeprelease.ini'
+    config.write_text('[summarizer]\nmodel_path = missing\nlatency_budget = 1e-9\n')
+    subprocess.run([sys.executable, '-c', EXTRACTIVE_RUN, str(config), str(tmp_path)], check=True)
+    assert 'Fix the bug' in (tmp_path / 'release.md').read_text()